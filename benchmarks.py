@@ -0,0 +1,1027 @@
+"""
+Benchmarks for the Pacman game.
+
+Usage: python benchmarks.py <benchmark> [options]
+Run `python benchmarks.py -h` for the list of benchmarks.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import zlib
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def report(name, count, elapsed, unit="frames"):
+    rate = count / elapsed if elapsed > 0 else float('inf')
+    print(f"  {name:<38} {count:>8} {unit} in {elapsed:7.3f}s  {rate:10.1f} {unit}/s")
+
+
+def bench_pixels(args):
+    """Pixel observation throughput, compared with copying the frame out via tostring."""
+    import numpy as np
+    import pacman
+    from pixel_env import FrameStack, PixelEnv
+
+    env = PixelEnv(stack=args.stack, downsample=args.downsample, seed=0)
+    env.reset()
+    print(f"Pixel observations: {env.observation_shape} uint8, {args.frames} frames")
+
+    start = time.perf_counter()
+    for _ in range(args.frames):
+        env.frames.capture()
+        env.frames.stacked(out=env.observation)
+    report("surfarray view + ring buffer", args.frames, time.perf_counter() - start)
+
+    step = args.downsample
+    off = step // 2
+    weights = np.array(FrameStack.WEIGHTS, dtype=np.uint16)
+    start = time.perf_counter()
+    for _ in range(args.frames):
+        raw = pacman.pygame.image.tostring(env.surface, 'RGB')
+        rgb = np.frombuffer(raw, dtype=np.uint8).reshape(pacman.PLAYFIELD_HEIGHT, pacman.GAME_WIDTH, 3)
+        gray = (rgb[off::step, off::step].astype(np.uint16) @ weights) >> 8
+        gray.astype(np.uint8)
+    report("tostring copy (baseline)", args.frames, time.perf_counter() - start)
+
+    rng = random.Random(0)
+    env.reset()
+    start = time.perf_counter()
+    for _ in range(args.frames):
+        _, _, done = env.step(rng.randrange(len(env.ACTIONS)))
+        if done:
+            env.reset()
+    report("env.step (simulate + draw + observe)", args.frames, time.perf_counter() - start)
+
+
+def bench_autopilot(args):
+    """Headless autopilot games: search rate, decision latency and the scores reached."""
+    from pacman import Autopilot, Simulation, FPS
+
+    print(f"Autopilot: {args.games} games, {args.budget:.2f} of a frame per decision, max depth {args.depth}")
+    for game in range(args.games):
+        sim = Simulation(seed=game)
+        pilot = Autopilot(max_depth=args.depth)
+        latencies = []
+        while not sim.game_over and sim.tick < args.ticks:
+            direction = None
+            if not sim.pacman.moving:
+                start = time.perf_counter()
+                direction, depth = pilot.decide(sim, start + args.budget / FPS)
+                done = time.perf_counter()
+                pilot.search_time += done - start
+                pilot.depth_total += depth
+                latencies.append(done - start)
+            sim.step(direction)
+        latencies.sort()
+        decisions = max(len(latencies), 1)
+        print(f"  seed {game}: score {sim.score:>6}, {sim.tick:>6} ticks, lives {sim.lives}, "
+              f"{pilot.nodes_per_second():8.0f} nodes/s, mean depth {pilot.depth_total / decisions:4.1f}, "
+              f"latency p50 {latencies[len(latencies) // 2] * 1000:.2f} ms / max {latencies[-1] * 1000:.2f} ms")
+
+
+async def server_request(port, message):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(json.dumps(message).encode() + b'\n')
+    reply = json.loads(await reader.readline())
+    writer.close()
+    return reply
+
+
+async def simulated_client(port, seed, stop, received):
+    """Joins a game, steers at random and restarts after game over."""
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(json.dumps({'cmd': 'join', 'seed': seed}).encode() + b'\n')
+    next_turn = time.perf_counter()
+    try:
+        while not stop.is_set():
+            line = await reader.readline()
+            if not line:
+                break
+            received[0] += len(line)
+            if b'"o":1' in line:
+                writer.write(b'{"cmd":"restart"}\n')
+            elif time.perf_counter() >= next_turn:
+                next_turn += rng.uniform(0.2, 1.0)
+                writer.write(b'{"dir":"%s"}\n' % rng.choice([b'up', b'down', b'left', b'right']))
+    finally:
+        writer.close()
+
+
+async def server_load(args):
+    for _ in range(50):
+        try:
+            await server_request(args.port, {'cmd': 'stats'})
+            break
+        except OSError:
+            await asyncio.sleep(0.1)
+
+    print(f"{'sessions':>8} {'cpu':>6} {'sess/core':>9} {'jitter p50':>10} {'p99':>7} {'max':>7} "
+          f"{'overruns':>8} {'down B/s':>9} {'up B/s':>7}  (per session)")
+    for count in args.sessions:
+        stop = asyncio.Event()
+        received = [0]
+        clients = [asyncio.create_task(simulated_client(args.port, seed, stop, received))
+                   for seed in range(count)]
+        await asyncio.sleep(args.warmup)
+        await server_request(args.port, {'cmd': 'stats', 'reset': True})
+        await asyncio.sleep(args.duration)
+        stats = await server_request(args.port, {'cmd': 'stats'})
+        stop.set()
+        await asyncio.gather(*clients, return_exceptions=True)
+
+        sessions = max(stats['sessions'], 1)
+        cpu = stats['cpu_s'] / stats['wall_s']
+        jitter = stats['jitter_ms']
+        print(f"{stats['sessions']:>8} {cpu * 100:>5.0f}% {sessions / max(cpu, 1e-9):>9.0f} "
+              f"{jitter['p50']:>8.2f}ms {jitter['p99']:>5.2f}ms {jitter['max']:>5.2f}ms {stats['overruns']:>8} "
+              f"{stats['bytes_sent'] / stats['wall_s'] / sessions:>9.0f} "
+              f"{stats['bytes_received'] / stats['wall_s'] / sessions:>7.0f}")
+        await asyncio.sleep(0.5)
+
+
+def bench_server(args):
+    """Load-test server.py with simulated clients: sessions per core, tick jitter, bandwidth."""
+    proc = subprocess.Popen([sys.executable, os.path.join(HERE, 'server.py'), '--port', str(args.port),
+                             '--tick-rate', str(args.tick_rate)], stdout=subprocess.DEVNULL)
+    try:
+        print(f"Server load test: {args.tick_rate} ticks/s, one server process, "
+              f"{args.duration:.0f}s per step")
+        asyncio.run(server_load(args))
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def bench_leaderboard(args):
+    """Load-test leaderboard.py with simulated cabinets: offline queue drain, batching and top-N reads."""
+    import tempfile
+    from pacman import Simulation, Replay, REPLAY_DIRECTIONS, FPS, LeaderboardClient, ConnectionPool
+
+    # One real replay, so submissions are the size the game sends
+    rng = random.Random(0)
+    sim = Simulation(seed=0)
+    recording = Replay(0)
+    while not sim.game_over:
+        direction = rng.choice(REPLAY_DIRECTIONS) if rng.random() < 0.05 else None
+        sim.step(direction)
+        recording.record(sim, direction)
+    replay = recording.to_bytes()
+
+    url = f"http://127.0.0.1:{args.port}"
+    print(f"Leaderboard load test: {args.cabinets} cabinets, {args.offline} scores each while the service "
+          f"is down, then {args.rate:.0f} scores/s for {args.duration:.0f}s ({len(replay)} B replays)")
+    with tempfile.TemporaryDirectory() as tmp:
+        cabinets = [LeaderboardClient(url, os.path.join(tmp, f"queue{i}.jsonl"), f"cab{i}",
+                                      refresh=1.0, backoff=0.1, max_backoff=1.0)
+                    for i in range(args.cabinets)]
+        for c in cabinets:
+            c.start()
+        for c in cabinets:
+            for _ in range(args.offline):
+                c.submit("LOAD", rng.randrange(100000), replay)
+        time.sleep(0.5)
+        on_disk = 0
+        for i in range(args.cabinets):
+            with open(os.path.join(tmp, f"queue{i}.jsonl")) as f:
+                on_disk += sum(1 for _ in f)
+
+        def drain(timeout=120.0):
+            start = time.perf_counter()
+            while any(c.queued() for c in cabinets) and time.perf_counter() - start < timeout:
+                time.sleep(0.01)
+            return time.perf_counter() - start
+
+        proc = subprocess.Popen([sys.executable, os.path.join(HERE, 'leaderboard.py'), '--port', str(args.port),
+                                 '--data', os.path.join(tmp, 'service')], stdout=subprocess.DEVNULL)
+        try:
+            elapsed = drain()
+            offline = args.cabinets * args.offline
+            batches = sum(c.batches for c in cabinets)
+            print(f"  offline  {on_disk} scores queued on disk, all sent in {batches} batches "
+                  f"{elapsed:.2f}s after the service started (retries back off up to 1s)")
+
+            # Online: scores arrive at random cabinets while a 60 fps loop reads the cached top scores
+            for c in cabinets:
+                c.latencies.clear()
+            reads = []
+            submitted = 0
+            start = time.perf_counter()
+            frame = 0
+            while time.perf_counter() - start < args.duration:
+                frame += 1
+                while submitted < args.rate * frame / FPS:
+                    rng.choice(cabinets).submit("LOAD", rng.randrange(100000), replay)
+                    submitted += 1
+                c = rng.choice(cabinets)
+                t = time.perf_counter()
+                c.top()
+                reads.append(time.perf_counter() - t)
+                time.sleep(max(0.0, start + frame / FPS - time.perf_counter()))
+            drain()
+            latencies = sorted(x for c in cabinets for x in c.latencies)
+            batches = sum(c.batches for c in cabinets) - batches
+            reads.sort()
+            print(f"  online   {submitted} scores in {batches} batches ({submitted / max(batches, 1):.1f} per batch), "
+                  f"submit to ack p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+                  f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms")
+            print(f"  top()    {len(reads)} frame reads, p50 {reads[len(reads) // 2] * 1e6:.2f} us, "
+                  f"max {reads[-1] * 1e6:.2f} us; {sum(c.cached is not None for c in cabinets)} cabinets "
+                  f"have the top {cabinets[0].top_n}")
+
+            _, _, data = ConnectionPool('127.0.0.1', args.port).request('GET', '/stats')
+            stats = json.loads(data)
+            print(f"  service  {stats['accepted']} accepted, {stats['duplicates']} duplicates, "
+                  f"{stats['requests']} requests on {stats['connections']} connections")
+            assert stats['accepted'] == offline + submitted, "scores lost or counted twice"
+        finally:
+            for c in cabinets:
+                c.close()
+            proc.terminate()
+            proc.wait()
+
+
+def bench_spectate(args):
+    """Spectator stream size and encode cost per tick, checking that decoding reproduces the game."""
+    from pacman import Simulation, FPS
+    from spectate import StateEncoder, StateDecoder, LENGTH, entities
+
+    print(f"Spectator stream: {args.games} games of up to {args.ticks} ticks, random steering")
+    for game in range(args.games):
+        rng = random.Random(game)
+        sim = Simulation(seed=game)
+        encoder = StateEncoder()
+        decoder = StateDecoder()
+        costs = []
+        total = keyframes = keyframe_bytes = 0
+        while not sim.game_over and sim.tick < args.ticks:
+            sim.step(rng.choice([(0, -1), (0, 1), (-1, 0), (1, 0)]) if rng.random() < 0.05 else None)
+            start = time.perf_counter()
+            message = encoder.encode(sim)
+            costs.append(time.perf_counter() - start)
+            total += LENGTH.size + len(message)
+            if message[0] == 0:
+                keyframes += 1
+                keyframe_bytes += len(message)
+            decoder.apply(message)
+            view = decoder.sim
+            assert (view.score, view.lives, view.pellets, view.power_pellets) == \
+                (sim.score, sim.lives, sim.pellets, sim.power_pellets), f"diverged at tick {sim.tick}"
+            assert entities(view) == entities(sim), f"entities diverged at tick {sim.tick}"
+        costs.sort()
+        seconds = sim.tick / FPS
+        print(f"  seed {game}: {sim.tick:>6} ticks, {total / seconds:6.0f} B/s per viewer, "
+              f"{total / sim.tick:5.1f} B/tick, {keyframes} keyframes of {keyframe_bytes // max(keyframes, 1)} B, "
+              f"encode p50 {costs[len(costs) // 2] * 1e6:.1f} us / p99 {costs[int(len(costs) * 0.99)] * 1e6:.1f} us")
+
+
+def continue_saved(data, ticks):
+    """Worker process side of the save handoff check: resume a save, play on, save again."""
+    from pacman import Simulation
+    sim = Simulation.from_bytes(data)
+    for _ in range(ticks):
+        if sim.game_over:
+            break
+        sim.step()
+    return sim.to_bytes()
+
+
+def bench_save(args):
+    """Save and restore cost of the binary save format, checking that resumed games play on identically."""
+    from concurrent.futures import ProcessPoolExecutor
+    from pacman import Simulation, SAVE_SIZE
+
+    print(f"Binary saves: {SAVE_SIZE} bytes, {args.games} games of up to {args.ticks} ticks, random steering")
+    saves, restores = [], []
+    with ProcessPoolExecutor(1) as pool:
+        for game in range(args.games):
+            rng = random.Random(game)
+            sim = Simulation(seed=game)
+            while not sim.game_over and sim.tick < args.ticks:
+                sim.step(rng.choice([(0, -1), (0, 1), (-1, 0), (1, 0)]) if rng.random() < 0.05 else None)
+                start = time.perf_counter()
+                data = sim.to_bytes()
+                saves.append(time.perf_counter() - start)
+                resumed = Simulation()
+                start = time.perf_counter()
+                resumed.restore(data)
+                restores.append(time.perf_counter() - start)
+                assert resumed.to_bytes() == data, f"restore changed the state at tick {sim.tick}"
+
+            # Hand a mid-game save to another process and check it plays on exactly as here
+            sim = Simulation(seed=game)
+            while not sim.game_over and sim.tick < args.ticks // 2:
+                sim.step(rng.choice([(0, -1), (0, 1), (-1, 0), (1, 0)]) if rng.random() < 0.05 else None)
+            remote = pool.submit(continue_saved, sim.to_bytes(), args.ticks // 2).result()
+            assert remote == continue_saved(sim.to_bytes(), args.ticks // 2), f"seed {game}: handoff diverged"
+            print(f"  seed {game}: handoff to worker process at tick {sim.tick} matches")
+
+    for name, costs in (("save", saves), ("restore", restores)):
+        costs.sort()
+        print(f"  {name:<8} p50 {costs[len(costs) // 2] * 1e6:6.1f} us  p99 {costs[int(len(costs) * 0.99)] * 1e6:6.1f} us"
+              f"  max {costs[-1] * 1e6:6.1f} us  ({len(costs)} samples)")
+
+
+def bench_replays(args):
+    """Replay verification throughput, serial and across a process pool, with tampered replays mixed in."""
+    from pacman import Simulation, Replay, REPLAY_DIRECTIONS, FPS
+    from replay import verify_batch
+
+    print(f"Recording {args.distinct} games with random steering")
+    games = []
+    for game in range(args.distinct):
+        rng = random.Random(game)
+        sim = Simulation(seed=game)
+        replay = Replay(game)
+        while not sim.game_over:
+            direction = rng.choice(REPLAY_DIRECTIONS) if rng.random() < 0.05 else None
+            sim.step(direction)
+            replay.record(sim, direction)
+        games.append(replay)
+
+    # Every fourth replay is tampered with: a higher final score, or a doctored checkpoint mid-game
+    batch, expected = [], []
+    for i in range(args.replays):
+        replay = Replay.from_bytes(games[i % len(games)].to_bytes())
+        if i % 4 == 3:
+            if i % 8 == 3:
+                replay.score += 1000
+                replay.checkpoints[-1] = (replay.checkpoints[-1][0], replay.score, 0)
+            else:
+                k = len(replay.checkpoints) // 2
+                tick, score, lives = replay.checkpoints[k]
+                replay.checkpoints[k] = (tick, score + 10, lives)
+        batch.append((f"replay{i}", replay.to_bytes()))
+        expected.append(i % 4 != 3)
+    ticks = sum(g.ticks for g in games) * args.replays // len(games)
+    print(f"Batch: {args.replays} replays, {ticks:,} ticks ({ticks / FPS / 3600:.1f} hours of play)")
+
+    for workers in args.workers:
+        start = time.perf_counter()
+        results = {r['replay']: r for r in verify_batch(batch, workers)}
+        elapsed = time.perf_counter() - start
+        verdicts = [results[name]['accepted'] for name, _ in batch]
+        assert verdicts == expected, "verifier accepted a tampered replay or rejected a genuine one"
+        rejected = [r for r in results.values() if not r['accepted']]
+        located = sum(r['divergence'] is not None for r in rejected)
+        report(f"{workers} worker(s)", args.replays, elapsed, "replays")
+        print(f"  {'':<38} {ticks / elapsed:>17,.0f} ticks/s, {len(rejected)} rejected "
+              f"({located} with a divergence tick), {args.replays / elapsed * 3600:,.0f} replays/hour")
+
+
+# Run in a fresh interpreter by bench_startup; prints wall-clock times of each startup phase
+STARTUP_PROBE = """
+import json, os, sys, time
+marks = {{'start': time.time()}}
+sys.path.insert(0, {here!r})
+import pacman
+marks['imported'] = time.time()
+pacman.check_dependencies()
+pygame = pacman.init_pygame(headless={headless})
+marks['pygame'] = time.time()
+flip = pygame.display.flip
+
+def first_flip():
+    marks.setdefault('first_frame', time.time())
+    flip()
+
+pygame.display.flip = first_flip
+game = pacman.Game()
+marks['constructed'] = time.time()
+pygame.event.post(pygame.event.Event(pygame.QUIT))
+game.run()
+marks['modules'] = len(sys.modules)
+print(json.dumps(marks))
+"""
+
+
+def bench_startup(args):
+    """Cold start: import time and time to first frame, in fresh interpreters."""
+    probe = STARTUP_PROBE.format(here=HERE, headless=not args.window)
+    phases = [('interpreter', 'start'), ('import pacman', 'imported'), ('import + init pygame', 'pygame'),
+              ('Game()', 'constructed'), ('first frame', 'first_frame')]
+    runs = []
+    for _ in range(args.runs):
+        spawned = time.time()
+        out = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True, cwd=HERE, check=True)
+        marks = json.loads(out.stdout.strip().splitlines()[-1])
+        marks['spawned'] = spawned
+        runs.append(marks)
+
+    print(f"Startup: median of {args.runs} fresh interpreters ({runs[0]['modules']} modules loaded)")
+    previous = 'spawned'
+    for name, mark in phases:
+        phase = sorted(r[mark] - r[previous] for r in runs)[len(runs) // 2]
+        total = sorted(r[mark] - r['spawned'] for r in runs)[len(runs) // 2]
+        print(f"  {name:<22} {phase * 1000:8.1f} ms   (at {total * 1000:7.1f} ms)")
+        previous = mark
+
+
+def bench_rewind(args):
+    """Rewind buffer memory per minute of history, recording cost and seek latency per snapshot interval."""
+    from pacman import Simulation, RewindBuffer, REPLAY_DIRECTIONS, FPS
+
+    print(f"Rewind: {args.minutes} minutes of play, {args.max_bytes // 1024} KiB cap, {args.seeks} random seeks")
+    print(f"  {'interval':>8} {'KiB/min':>8} {'history':>8} {'record':>8} {'seek p50':>9} {'p99':>8} {'max':>8}")
+    for interval in args.intervals:
+        rng = random.Random(0)
+        sim = Simulation(seed=0)
+        sim.lives = 200  # one long game
+        buffer = RewindBuffer(args.max_bytes, interval)
+        buffer.start(sim)
+        ticks = int(args.minutes * 60 * FPS)
+        checks = {}
+        record = 0.0
+        for _ in range(ticks):
+            direction = rng.choice(REPLAY_DIRECTIONS) if rng.random() < 0.05 else None
+            sim.step(direction)
+            start = time.perf_counter()
+            buffer.record(sim, direction)
+            record += time.perf_counter() - start
+            if rng.random() < 0.01:
+                checks[sim.tick] = sim.to_bytes()
+
+        probe = Simulation()
+        costs = []
+        for _ in range(args.seeks):
+            tick = rng.randint(buffer.oldest, buffer.latest)
+            start = time.perf_counter()
+            buffer.seek(tick, probe)
+            costs.append(time.perf_counter() - start)
+            if tick in checks:
+                assert probe.to_bytes() == checks[tick], f"seek to {tick} does not match the recorded state"
+        for tick, state in checks.items():
+            if tick >= buffer.oldest:
+                assert buffer.seek(tick, probe).to_bytes() == state, f"seek to {tick} does not match"
+        costs.sort()
+        history = (buffer.latest - buffer.oldest) / FPS / 60
+        print(f"  {interval:>8} {buffer.bytes_per_minute() / 1024:>8.1f} {history:>6.1f}min {record / ticks * 1e6:>6.2f}us "
+              f"{costs[len(costs) // 2] * 1000:>7.3f}ms {costs[int(len(costs) * 0.99)] * 1000:>6.3f}ms "
+              f"{costs[-1] * 1000:>6.3f}ms")
+
+
+def bench_timers(args):
+    """Per-tick cost of timers polled by every entity, against the scheduler firing only the due ones."""
+    from pacman import Simulation, TimerWheel
+
+    class Entity:
+        timer = 0
+
+    print(f"Timers: {args.ticks} ticks, each timer restarting with a delay of 1-{args.max_delay} ticks")
+    print(f"  {'timers':>7} {'polled':>10} {'wheel':>10} {'fired/tick':>11}")
+    for count in args.counts:
+        rng = random.Random(0)
+        entities = [Entity() for _ in range(count)]
+        for e in entities:
+            e.timer = rng.randint(1, args.max_delay)
+        fired = 0
+        start = time.perf_counter()
+        for _ in range(args.ticks):
+            for e in entities:
+                e.timer -= 1
+                if e.timer <= 0:
+                    e.timer = rng.randint(1, args.max_delay)
+                    fired += 1
+        polled = time.perf_counter() - start
+
+        rng = random.Random(0)
+        wheel = TimerWheel()
+        for i in range(count):
+            wheel.schedule(rng.randint(0, args.max_delay - 1), i)
+        start = time.perf_counter()
+        for tick in range(args.ticks):
+            for i in wheel.advance(tick):
+                wheel.schedule(tick + rng.randint(1, args.max_delay), i)
+        wheel_time = time.perf_counter() - start
+        print(f"  {count:>7} {polled / args.ticks * 1e6:>8.2f}us {wheel_time / args.ticks * 1e6:>8.2f}us "
+              f"{fired / args.ticks:>11.2f}")
+
+    sim = Simulation(seed=0)
+    sim.lives = 200  # one long game
+    start = time.perf_counter()
+    for _ in range(args.ticks):
+        sim.step()
+    report("simulation", args.ticks, time.perf_counter() - start, "ticks")
+
+
+def bench_telemetry(args):
+    """Telemetry cost per frame, background writer throughput and offline aggregation rate."""
+    import tempfile
+    from pacman import Simulation, Telemetry, TelemetryWriter, REPLAY_DIRECTIONS, FPS
+
+    # Real sessions to copy from, and the frame-loop cost of recording them
+    records = []
+    telemetry = Telemetry()
+    plain = recorded = 0.0
+    ticks = 0
+    for seed in range(args.games):
+        for record in (False, True):
+            rng = random.Random(seed)
+            sim = Simulation(seed=seed)
+            telemetry.start(sim)
+            start = time.perf_counter()
+            while not sim.game_over:
+                sim.step(rng.choice(REPLAY_DIRECTIONS) if rng.random() < 0.05 else None)
+                if record:
+                    telemetry.record(sim)
+            if record:
+                recorded += time.perf_counter() - start
+                records.append(telemetry.finish(sim))
+                ticks += sim.tick
+            else:
+                plain += time.perf_counter() - start
+    cost = (recorded - plain) / ticks
+    print(f"Telemetry: {args.games} games, {ticks} ticks")
+    print(f"  step {plain / ticks * 1e6:.2f} us, with telemetry {recorded / ticks * 1e6:.2f} us: "
+          f"{cost * 1e6:+.2f} us per frame ({cost * FPS:+.4%} of a {1000 / FPS:.1f} ms frame)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'telemetry.bin')
+        writer = TelemetryWriter(path, interval=args.interval)
+        submit = 0.0
+        start = time.perf_counter()
+        for i in range(args.sessions):
+            t = time.perf_counter()
+            writer.submit(records[i % len(records)])
+            submit += time.perf_counter() - t
+        writer.close()
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(path)
+        # The file repeats a few sessions, which compress far better than real ones would
+        distinct = len(zlib.compress(b''.join(records), 6)) / len(records)
+        print(f"  writer: {args.sessions} sessions in {writer.batches} batches, {elapsed:.2f}s, "
+              f"submit {submit / args.sessions * 1e6:.2f} us each, about {distinct:.0f} B per session on disk")
+
+        try:
+            import telemetry as tool
+        except ImportError as e:
+            print(f"  aggregation skipped: {e}")
+            return
+        total = tool.Aggregate()
+        start = time.perf_counter()
+        for sessions in tool.read_sessions(path):
+            total.add(sessions)
+        elapsed = time.perf_counter() - start
+        assert total.sessions == args.sessions, f"read back {total.sessions} of {args.sessions} sessions"
+        report("aggregate", total.sessions, elapsed, "sessions")
+        print(f"  about {1e6 / (total.sessions / elapsed):.0f}s per million sessions")
+
+
+def check_buffered_turn():
+    """A turn pressed before a wall is kept while Pacman carries on, and taken at the first
+    tile where it fits: stepped and fast-forwarded, right from (1, 1) then down at (2, 1)
+    turns down at (6, 1) instead of stopping at (3, 1)."""
+    from pacman import Simulation, FastForward
+
+    for fast in (False, True):
+        sim = Simulation(seed=0)
+        p = sim.pacman
+        p.start_x, p.start_y = 1, 1
+        p.reset()
+        ff = FastForward(sim)
+
+        def play(ticks, direction=None):
+            if fast:
+                ff.run(sim.tick + ticks, direction)
+            else:
+                for i in range(ticks):
+                    sim.step(direction if i == 0 else None)
+
+        play(1, (1, 0))
+        while p.tile_x < 2:
+            play(1)
+        play(1, (0, 1))
+        play(60)
+        assert (p.tile_x, p.face_dir) == (6, (0, 1)) and p.tile_y > 1, \
+            f"buffered turn not taken: Pacman at {(p.tile_x, p.tile_y)} facing {p.face_dir}"
+
+
+def bench_fastforward(args):
+    """Headless games stepped tick by tick against FastForward, checking both end in the same state."""
+    from pacman import Simulation, FastForward, REPLAY_DIRECTIONS
+
+    check_buffered_turn()
+    print(f"Fast-forward: {args.games} games per input rate, best of {args.repeat}")
+    for rate in args.rates:
+        games = []
+        for seed in range(args.games):
+            rng = random.Random(seed)
+            sim = Simulation(seed=seed)
+            inputs = {}
+            while not sim.game_over:
+                direction = rng.choice(REPLAY_DIRECTIONS) if rng.random() < rate else None
+                if direction:
+                    inputs[sim.tick] = direction
+                sim.step(direction)
+            games.append((seed, inputs, sim.to_bytes()))
+        ticks = sum(Simulation.from_bytes(end).tick for _, _, end in games)
+
+        stepped = fast = float('inf')
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            for seed, inputs, end in games:
+                sim = Simulation(seed=seed)
+                while not sim.game_over:
+                    sim.step(inputs.get(sim.tick))
+            stepped = min(stepped, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            for seed, inputs, end in games:
+                sim = Simulation(seed=seed)
+                ff = FastForward(sim)
+                direction = None
+                for tick in sorted(inputs) + [1 << 31]:
+                    ff.run(tick, direction)
+                    if sim.game_over:
+                        break
+                    direction = inputs[tick]
+                assert sim.to_bytes() == end, f"fast-forward diverged from stepping in game {seed}"
+            fast = min(fast, time.perf_counter() - start)
+        print(f"  input on {rate:.1%} of ticks ({ticks:,} ticks):")
+        report("stepped", ticks, stepped, "ticks")
+        report("fast-forward", ticks, fast, "ticks")
+        print(f"  {'speed-up':<38} {stepped / fast:8.2f}x")
+
+
+def bench_export(args):
+    """Replay export throughput in frames per second, serial and across worker processes."""
+    import tempfile
+    from pacman import Simulation, Replay, REPLAY_DIRECTIONS
+    from export import export
+
+    rng = random.Random(args.seed)
+    sim = Simulation(seed=args.seed)
+    replay = Replay(args.seed)
+    while not sim.game_over:
+        direction = rng.choice(REPLAY_DIRECTIONS) if rng.random() < 0.05 else None
+        sim.step(direction)
+        replay.record(sim, direction)
+    data = replay.to_bytes()
+
+    output = "PNG sequence" if args.png else "frames rendered, not written"
+    print(f"Replay export: {replay.ticks} ticks, {args.segment:.0f}s segments, scale {args.scale}, {output}")
+    print(f"  {'workers':>7} {'segments':>8} {'frames':>7} {'plan':>7} {'total':>8} {'frames/s':>9}")
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as tmp:
+            result = export(data, png=tmp if args.png else None, workers=workers, segment=args.segment,
+                            scale=args.scale)
+        print(f"  {result['workers']:>7} {result['segments']:>8} {result['frames']:>7} {result['plan_s']:>6.2f}s "
+              f"{result['total_s']:>7.2f}s {result['fps']:>9.1f}")
+
+
+def bench_maze(args):
+    """Procedural maze generation, connectivity validation and cache reload time at each size."""
+    import tempfile
+    from pathlib import Path
+    import mazegen
+
+    print(f"Maze generator: seed {args.seed}, cache in a temporary folder")
+    print(f"  {'size':>11} {'walkable':>10} {'generate':>9} {'Mtiles/s':>9} {'validate':>9} "
+          f"{'file':>8} {'from disk':>10} {'memory':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        mazegen.CACHE_DIR = Path(tmp)
+        for size in args.sizes:
+            w, h = map(int, size.split('x'))
+            mazegen._mazes.clear()
+            start = time.perf_counter()
+            maze = mazegen.generate(w, h, args.seed)     # generated, validated and written out
+            generate = time.perf_counter() - start
+            start = time.perf_counter()
+            check = mazegen.validate(maze)
+            validate = time.perf_counter() - start
+            assert not check['unreachable'] and check['house'], check
+            mazegen._mazes.clear()
+            start = time.perf_counter()
+            loaded = mazegen.generate(w, h, args.seed)
+            disk = time.perf_counter() - start
+            assert loaded.layout == maze.layout and loaded.exits == maze.exits and loaded.pellets == maze.pellets
+            start = time.perf_counter()
+            mazegen.generate(w, h, args.seed)
+            memory = time.perf_counter() - start
+            file_size = (Path(tmp) / f"{args.seed}_{w}x{h}.pmz").stat().st_size
+            print(f"  {size:>11} {check['walkable']:>10,} {generate:>8.2f}s {w * h / generate / 1e6:>9.2f} "
+                  f"{validate:>8.2f}s {file_size / 1e6:>6.1f}MB {disk * 1000:>8.1f}ms {memory * 1e6:>6.1f}us")
+
+
+def measure_allocations(frames=3000, warmup=120, draw=False):
+    """Play (and with draw, draw) a seeded game under tracemalloc after warmup frames.
+
+    Returns the frames measured, the net blocks and bytes retained by pacman.py
+    over them (with the tracemalloc statistics, largest first), and every frame's
+    transient allocation: the peak traced memory during the frame above where it
+    started, in bytes, sorted.
+    """
+    import tracemalloc
+    import pacman
+    from pacman import Simulation, REPLAY_DIRECTIONS
+
+    surface = None
+    if draw:
+        pygame = pacman.init_pygame(headless=True)
+        surface = pygame.Surface((pacman.GAME_WIDTH, pacman.PLAYFIELD_HEIGHT))
+    rng = random.Random(0)
+    inputs = [rng.choice(REPLAY_DIRECTIONS) if rng.random() < 0.05 else None for _ in range(frames)]
+    sim = Simulation(seed=0)
+    for direction in inputs[:warmup]:
+        sim.step(direction)
+        if surface:
+            sim.draw(surface, ticks=sim.tick * 16)
+
+    only_pacman = [tracemalloc.Filter(True, pacman.__file__)]
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot().filter_traces(only_pacman)
+    transient = []
+    for direction in inputs[warmup:]:
+        if sim.game_over:
+            break
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        sim.step(direction)
+        if surface:
+            sim.draw(surface, ticks=sim.tick * 16)
+        transient.append(tracemalloc.get_traced_memory()[1] - current)
+    after = tracemalloc.take_snapshot().filter_traces(only_pacman)
+    tracemalloc.stop()
+
+    diff = after.compare_to(before, 'lineno')
+    transient.sort()
+    return {
+        'frames': len(transient),
+        'blocks': sum(stat.count_diff for stat in diff),
+        'bytes': sum(stat.size_diff for stat in diff),
+        'stats': diff,
+        'transient': transient,
+    }
+
+
+def bench_alloc(args):
+    """Memory allocated per frame by the simulation (and drawing), measured with tracemalloc.
+
+    Fails if the frame loop retains memory (the net number of blocks allocated in
+    pacman.py must stay under --limit per frame once the game is warmed up) or if
+    the 99th percentile of a frame's transient allocation exceeds --transient-limit
+    bytes. test_alloc.py runs the same checks under pytest.
+    """
+    m = measure_allocations(args.frames, args.warmup, args.draw)
+    frames, blocks, transient = m['frames'], m['blocks'], m['transient']
+    p99 = transient[int(len(transient) * 0.99)]
+    print(f"Allocations: {frames} frames of simulation{' and drawing' if args.draw else ''} "
+          f"after {args.warmup} warm-up frames")
+    print(f"  retained      {blocks / frames:8.3f} blocks/frame  {m['bytes'] / frames:8.1f} bytes/frame")
+    print(f"  transient     p50 {transient[len(transient) // 2]} bytes  "
+          f"p99 {p99} bytes  max {transient[-1]} bytes per frame")
+    for stat in m['stats'][:args.top]:
+        if stat.count_diff:
+            print(f"    {stat}")
+    assert blocks / frames < args.limit, f"frame loop retains {blocks / frames:.3f} blocks per frame"
+    assert p99 <= args.transient_limit, f"frame loop allocates {p99} bytes per frame (p99)"
+
+
+def bench_render(args):
+    """Frame draw time at each output resolution, drawn natively against drawn at game size and scaled."""
+    import pacman
+    pygame = pacman.init_pygame(headless=not args.window)
+
+    print(f"Rendering: {args.frames} gameplay frames per resolution and mode")
+    print(f"  {'output':<10} {'mode':<7} {'scale':>6} {'frame':>9} {'fps':>7} {'resize':>9}")
+    for size in args.sizes:
+        w, h = map(int, size.split('x'))
+        for mode in pacman.Game.RENDER_MODES:
+            game = pacman.Game(render=mode)
+            try:
+                start = time.perf_counter()
+                game.set_display_mode((w, h))
+                game.reset_game()
+                game.state = 'playing'
+                game.draw_frame()   # sprites for this scale
+                resize = time.perf_counter() - start
+                rng = random.Random(0)
+                elapsed = 0.0
+                for _ in range(args.frames):
+                    if game.sim.game_over:
+                        game.reset_game()
+                    game.sim.step(rng.choice(pacman.REPLAY_DIRECTIONS) if rng.random() < 0.05 else None)
+                    start = time.perf_counter()
+                    game.draw_frame()
+                    pygame.display.flip()
+                    elapsed += time.perf_counter() - start
+            finally:
+                game.telemetry_writer.close()
+            print(f"  {size:<10} {mode:<7} {game.scale:>6.2f} {elapsed / args.frames * 1000:>7.2f}ms "
+                  f"{args.frames / elapsed:>7.0f} {resize * 1000:>7.1f}ms")
+
+
+def bench_pipeline(args):
+    """Frame rate, game speed and input latency of the game loop, single-threaded against pipelined."""
+    import tempfile
+    import threading
+    from pathlib import Path
+    import pacman
+
+    def press_keys(pygame, stop):
+        # A player turning a few times a second, then closing the window
+        rng = random.Random(0)
+        keys = [pygame.K_UP, pygame.K_DOWN, pygame.K_LEFT, pygame.K_RIGHT]
+        while not stop.wait(rng.uniform(0.1, 0.4)):
+            pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=rng.choice(keys), mod=0, unicode=''))
+        pygame.event.post(pygame.event.Event(pygame.QUIT))
+
+    print(f"Pipeline: {args.seconds:.0f}s of play per resolution and loop, {args.render} rendering")
+    print(f"  {'output':<10} {'loop':<9} {'fps':>6} {'missed':>7} {'ticks/s':>8} {'latency p50':>12} {'p95':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            w, h = map(int, size.split('x'))
+            for pipeline in (False, True):
+                pygame = pacman.init_pygame(headless=True)
+                game = pacman.Game(render=args.render, pipeline=pipeline)
+                game.save_path = Path(tmp) / "savegame.bin"
+                game.telemetry_writer.close()
+                game.telemetry_writer = pacman.TelemetryWriter(Path(tmp) / "telemetry.bin")
+                game.set_display_mode((w, h))
+                game.reset_game()
+                game.state = 'playing'
+                stop = threading.Event()
+                keys = threading.Thread(target=press_keys, args=(pygame, stop))
+                keys.start()
+                threading.Timer(args.seconds, stop.set).start()
+                start = time.perf_counter()
+                game.run()
+                elapsed = time.perf_counter() - start
+                keys.join()
+                s = game.pacer.stats()
+                latency = sorted(game.input.latencies['immediate']) or [0.0]
+                print(f"  {size:<10} {'pipeline' if pipeline else 'serial':<9} {s['fps']:>6.1f} {s['missed']:>7} "
+                      f"{game.sim.tick / elapsed:>8.1f} {latency[len(latency) // 2] * 1000:>10.1f}ms "
+                      f"{latency[int(len(latency) * 0.95)] * 1000:>6.1f}ms")
+
+
+def bench_pacing(args):
+    """Frame-interval jitter of each frame pacing mode under a game-like render load."""
+    import pacman
+    pygame = pacman.init_pygame(headless=not args.window)
+    surface = pygame.Surface((pacman.GAME_WIDTH, pacman.GAME_HEIGHT))
+    frames = int(args.seconds * pacman.FPS)
+
+    print(f"Frame pacing: {frames} frames per mode at {pacman.FPS} fps")
+    print(f"  {'mode':<8} {'fps':>6} {'mean':>8} {'jitter':>8} {'p50':>8} {'p99':>8} {'max':>8} {'missed':>7}")
+    for mode in args.modes:
+        flags = pygame.SCALED if mode == 'vsync' else 0
+        try:
+            screen = pygame.display.set_mode((pacman.GAME_WIDTH, pacman.GAME_HEIGHT), flags,
+                                             vsync=int(mode == 'vsync'))
+        except pygame.error as e:
+            print(f"  {mode:<8} unavailable: {e}")
+            continue
+        pacer = pacman.FramePacer(mode)
+        sim = pacman.Simulation(seed=0)
+        for _ in range(frames):
+            pygame.event.pump()
+            sim.step()
+            surface.fill(pacman.BLACK)
+            sim.draw(surface)
+            screen.blit(surface, (0, 0))
+            pygame.display.flip()
+            pacer.wait()
+        s = pacer.stats()
+        print(f"  {pacer.mode:<8} {s['fps']:>6.1f} {s['mean_ms']:>6.2f}ms {s['jitter_ms']:>6.3f}ms "
+              f"{s['p50_ms']:>6.2f}ms {s['p99_ms']:>6.2f}ms {s['max_ms']:>6.2f}ms {s['missed']:>7}")
+        if args.report:
+            pacer.save_report(f"{args.report}_{pacer.mode}.json")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pacman benchmarks")
+    sub = parser.add_subparsers(dest='benchmark', required=True)
+
+    p = sub.add_parser('pixels', help="pixel observation pipeline frames per second")
+    p.add_argument('--frames', type=int, default=2000)
+    p.add_argument('--stack', type=int, default=4)
+    p.add_argument('--downsample', type=int, default=8)
+    p.set_defaults(func=bench_pixels)
+
+    p = sub.add_parser('autopilot', help="autopilot search rate and decision latency")
+    p.add_argument('--games', type=int, default=3)
+    p.add_argument('--ticks', type=int, default=3000, help="stop each game after this many frames")
+    p.add_argument('--budget', type=float, default=1.0, help="search time per decision, in frames")
+    p.add_argument('--depth', type=int, default=12, help="maximum search depth in tiles")
+    p.set_defaults(func=bench_autopilot)
+
+    p = sub.add_parser('server', help="game server load test with simulated clients")
+    p.add_argument('--sessions', type=int, nargs='+', default=[25, 50, 100, 200])
+    p.add_argument('--duration', type=float, default=5.0, help="measured seconds per step")
+    p.add_argument('--warmup', type=float, default=1.0)
+    p.add_argument('--tick-rate', type=int, default=60)
+    p.add_argument('--port', type=int, default=8799)
+    p.set_defaults(func=bench_server)
+
+    p = sub.add_parser('leaderboard', help="leaderboard service load test with simulated cabinets")
+    p.add_argument('--cabinets', type=int, default=100)
+    p.add_argument('--offline', type=int, default=5, help="scores each cabinet queues while the service is down")
+    p.add_argument('--rate', type=float, default=200.0, help="scores per second across the fleet once it is up")
+    p.add_argument('--duration', type=float, default=10.0)
+    p.add_argument('--port', type=int, default=8767)
+    p.set_defaults(func=bench_leaderboard)
+
+    p = sub.add_parser('spectate', help="spectator stream bandwidth and encode cost per tick")
+    p.add_argument('--games', type=int, default=3)
+    p.add_argument('--ticks', type=int, default=5000)
+    p.set_defaults(func=bench_spectate)
+
+    p = sub.add_parser('save', help="binary save/restore time and resume exactness")
+    p.add_argument('--games', type=int, default=3)
+    p.add_argument('--ticks', type=int, default=3000)
+    p.set_defaults(func=bench_save)
+
+    p = sub.add_parser('replays', help="replay verification throughput for leaderboard anti-cheat")
+    p.add_argument('--replays', type=int, default=400, help="replays in the batch")
+    p.add_argument('--distinct', type=int, default=40, help="distinct games recorded for the batch")
+    p.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count() or 1])
+    p.set_defaults(func=bench_replays)
+
+    p = sub.add_parser('startup', help="import time and time to first frame")
+    p.add_argument('--runs', type=int, default=10)
+    p.add_argument('--window', action='store_true', help="use a real window instead of the dummy driver")
+    p.set_defaults(func=bench_startup)
+
+    p = sub.add_parser('rewind', help="rewind buffer memory per minute and seek latency")
+    p.add_argument('--minutes', type=float, default=5.0, help="minutes of play to record")
+    p.add_argument('--max-bytes', type=int, default=4 << 20)
+    p.add_argument('--intervals', type=int, nargs='+', default=[15, 30, 60, 120, 240],
+                   help="ticks between snapshots")
+    p.add_argument('--seeks', type=int, default=2000)
+    p.set_defaults(func=bench_rewind)
+
+    p = sub.add_parser('timers', help="per-tick cost of polled timers against the timer wheel")
+    p.add_argument('--ticks', type=int, default=20000)
+    p.add_argument('--counts', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    p.add_argument('--max-delay', type=int, default=360)
+    p.set_defaults(func=bench_timers)
+
+    p = sub.add_parser('telemetry', help="telemetry frame cost, writer throughput and aggregation rate")
+    p.add_argument('--games', type=int, default=10)
+    p.add_argument('--sessions', type=int, default=100000)
+    p.add_argument('--interval', type=float, default=0.5, help="writer flush interval in seconds")
+    p.set_defaults(func=bench_telemetry)
+
+    p = sub.add_parser('fastforward', help="headless simulation speed, stepped against fast-forward")
+    p.add_argument('--games', type=int, default=20)
+    p.add_argument('--rates', type=float, nargs='+', default=[0.05, 0.01, 0.002],
+                   help="share of ticks with a direction pressed")
+    p.add_argument('--repeat', type=int, default=3)
+    p.set_defaults(func=bench_fastforward)
+
+    p = sub.add_parser('export', help="replay-to-video export frames per second, serial and parallel")
+    p.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count() or 1])
+    p.add_argument('--segment', type=float, default=5.0, help="seconds of game per segment")
+    p.add_argument('--scale', type=float, default=1)
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--png', action='store_true', help="also write the PNG sequence (to a temporary folder)")
+    p.set_defaults(func=bench_export)
+
+    p = sub.add_parser('maze', help="procedural maze generation, validation and cache reload time")
+    p.add_argument('--sizes', nargs='+', default=['28x31', '256x256', '1024x1024', '2048x2048'], help="WxH")
+    p.add_argument('--seed', type=int, default=0)
+    p.set_defaults(func=bench_maze)
+
+    p = sub.add_parser('alloc', help="allocations per frame of the game loop (tracemalloc)")
+    p.add_argument('--frames', type=int, default=3000)
+    p.add_argument('--warmup', type=int, default=120)
+    p.add_argument('--draw', action='store_true', help="also draw every frame")
+    p.add_argument('--limit', type=float, default=0.05, help="fail above this many retained blocks per frame")
+    p.add_argument('--transient-limit', type=int, default=512,
+                   help="fail above this many bytes allocated during a frame (p99)")
+    p.add_argument('--top', type=int, default=5, help="allocation sites to list")
+    p.set_defaults(func=bench_alloc)
+
+    p = sub.add_parser('render', help="frame draw time at output resolution, native against scaled")
+    p.add_argument('--frames', type=int, default=600)
+    p.add_argument('--sizes', nargs='+', default=['1920x1080', '3840x2160'], help="output resolutions, WxH")
+    p.add_argument('--window', action='store_true', help="use a real window instead of the dummy driver")
+    p.set_defaults(func=bench_render)
+
+    p = sub.add_parser('pipeline', help="game loop frame rate, game speed and input latency, serial against pipelined")
+    p.add_argument('--seconds', type=float, default=5.0, help="play time per resolution and loop")
+    p.add_argument('--sizes', nargs='+', default=['1920x1080', '3840x2160'], help="output resolutions, WxH")
+    p.add_argument('--render', choices=['native', 'scaled'], default='scaled')
+    p.set_defaults(func=bench_pipeline)
+
+    p = sub.add_parser('pacing', help="frame-interval jitter of each frame pacing mode")
+    p.add_argument('--seconds', type=float, default=5.0, help="run time per mode")
+    p.add_argument('--modes', nargs='+', default=['sleep', 'busy', 'hybrid', 'vsync'])
+    p.add_argument('--window', action='store_true', help="use a real window instead of the dummy driver")
+    p.add_argument('--report', metavar='PREFIX', help="also write PREFIX_<mode>.json reports")
+    p.set_defaults(func=bench_pacing)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
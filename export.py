@@ -0,0 +1,214 @@
+"""
+Export Pacman replays to video without a window.
+
+A replay (the format is described in pacman.py, Replay) is re-simulated from
+its seed and inputs under SDL's dummy video driver, and every frame is drawn
+the way the game draws it (Simulation.draw: draw_maze, Pacman.draw and
+Ghost.draw) with the score and lives below. Frames are streamed as raw RGB
+into an ffmpeg pipe, or saved as a numbered PNG sequence.
+
+Long replays are cut into segments rendered in parallel by worker processes.
+The game is first played through once headlessly (fast-forwarded, no
+drawing), keeping a save (Simulation.to_bytes()) at the start of each
+segment; each worker resumes its save and plays on, which reproduces the game
+exactly. With ffmpeg every segment is encoded to its own file and the files
+are then joined without re-encoding.
+
+Usage: python export.py [--out clip.mp4 | --png DIR] [--workers N] [--segment SECONDS]
+                        [--scale S] [--every N] [--color NAME] [--ffmpeg PATH] REPLAY
+"""
+
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import pacman
+from pacman import (GAME_WIDTH, GAME_HEIGHT, FPS, PACMAN_COLORS, REPLAY_DIRECTIONS, BLACK, WHITE,
+                    Replay, Simulation, FastForward)
+
+
+def plan_segments(replay, color, length):
+    """Play the replay through and cut it into segments of `length` ticks.
+
+    Returns (inputs, segments): the inputs as {tick: direction} and one
+    (start tick, end tick, save at the start) per segment.
+    """
+    inputs = {tick: REPLAY_DIRECTIONS[d] for tick, d in replay.inputs if d < len(REPLAY_DIRECTIONS)}
+    sim = Simulation(color, replay.seed)
+    ff = FastForward(sim)
+    upcoming = sorted(inputs, reverse=True)
+    segments = []
+    while sim.tick < replay.ticks and not sim.game_over:
+        start = sim.tick
+        end = min(start + length, replay.ticks)
+        save = sim.to_bytes()
+        while sim.tick < end and not sim.game_over:
+            while upcoming and upcoming[-1] <= sim.tick:
+                upcoming.pop()
+            ff.run(min(upcoming[-1], end) if upcoming else end, inputs.get(sim.tick))
+        segments.append((start, sim.tick, save))
+    return inputs, segments
+
+
+class FrameRenderer:
+    """Draws game frames as the game does, at `scale` output pixels per game pixel."""
+
+    def __init__(self, scale=1):
+        self.scale = scale
+        self.surface = pacman.pygame.Surface((round(GAME_WIDTH * scale), round(GAME_HEIGHT * scale)))
+        self.font = pacman.pygame.font.Font(None, max(1, round(36 * scale)))
+
+    def draw(self, sim):
+        surface, scale = self.surface, self.scale
+        surface.fill(BLACK)
+        # Animations run on the game clock, so a frame looks the same whoever renders it
+        sim.draw(surface, ticks=sim.tick * 1000 // FPS, scale=scale)
+        surface.blit(self.font.render(f"Score: {sim.score}", True, WHITE),
+                     (round(10 * scale), round((GAME_HEIGHT - 50) * scale)))
+        surface.blit(self.font.render(f"Lives: {sim.lives}", True, WHITE),
+                     (round((GAME_WIDTH - 120) * scale), round((GAME_HEIGHT - 50) * scale)))
+        return surface
+
+
+def encoder(ffmpeg, path, size, fps):
+    """An ffmpeg process that encodes raw RGB frames written to its stdin into path."""
+    return subprocess.Popen(
+        [ffmpeg, '-loglevel', 'error', '-y', '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+         '-s', f'{size[0]}x{size[1]}', '-r', str(fps), '-i', '-',
+         '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p', path],
+        stdin=subprocess.PIPE)
+
+
+def render_segment(job):
+    """Worker side: resume a segment's save, play it and write its frames.
+
+    Every `every`th tick becomes a frame; the frame for tick t is numbered t // every.
+    Returns (segment index, frames written, seconds taken).
+    """
+    index, start, end, save, inputs, options = job
+    started = time.perf_counter()
+    pygame = pacman.init_pygame(headless=True)
+    renderer = FrameRenderer(options['scale'])
+    every = options['every']
+    sim = Simulation.from_bytes(save)
+    pipe = None
+    if options['video']:
+        pipe = encoder(options['ffmpeg'], options['video'] % index, renderer.surface.get_size(), FPS / every)
+    frames = 0
+    try:
+        while sim.tick < end:
+            sim.step(inputs.get(sim.tick))
+            if sim.tick % every:
+                continue
+            surface = renderer.draw(sim)
+            if pipe:
+                pipe.stdin.write(pygame.image.tostring(surface, 'RGB'))
+            elif options['png']:
+                pygame.image.save(surface, os.path.join(options['png'], f"frame_{sim.tick // every:06d}.png"))
+            frames += 1
+    finally:
+        if pipe:
+            pipe.stdin.close()
+            if pipe.wait():
+                raise RuntimeError(f"ffmpeg failed on segment {index}")
+    return index, frames, time.perf_counter() - started
+
+
+def render_segments(jobs, workers):
+    """Render segments across a process pool, yielding results as they complete."""
+    workers = min(workers, len(jobs))
+    if workers <= 1:
+        yield from map(render_segment, jobs)
+        return
+    pool = multiprocessing.Pool(workers)
+    try:
+        yield from pool.imap_unordered(render_segment, jobs)
+    finally:
+        # Not terminate(): SDL turns SIGTERM into a quit event, so a worker with a
+        # display initialised would never exit
+        pool.close()
+        pool.join()
+
+
+def export(data, out=None, png=None, workers=None, segment=30.0, scale=1, every=1,
+           color=PACMAN_COLORS['yellow'], ffmpeg='ffmpeg', progress=None):
+    """Render a replay (Replay.to_bytes()) to a video file (out) or PNG folder (png),
+    or only render it when neither is given. Returns a dict of frame counts and timings.
+    """
+    replay = Replay.from_bytes(data)
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    # Segments are whole frames long
+    length = max(every, int(segment * FPS) // every * every)
+    inputs, segments = plan_segments(replay, color, length)
+    if not segments:
+        raise ValueError("replay has no frames to export")
+    planned = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        options = {'scale': scale, 'every': every, 'png': png, 'ffmpeg': ffmpeg,
+                   'video': os.path.join(tmp, 'segment%05d.mp4') if out else None}
+        if png:
+            os.makedirs(png, exist_ok=True)
+        jobs = [(i, s, e, save, {t: d for t, d in inputs.items() if s <= t < e}, options)
+                for i, (s, e, save) in enumerate(segments)]
+        frames = 0
+        busy = 0.0
+        for index, count, seconds in render_segments(jobs, workers):
+            frames += count
+            busy += seconds
+            if progress:
+                progress(index, len(jobs), count, seconds)
+        rendered = time.perf_counter() - start - planned
+
+        if out:
+            listing = os.path.join(tmp, 'segments.txt')
+            with open(listing, 'w') as f:
+                f.writelines(f"file '{options['video'] % i}'\n" for i in range(len(jobs)))
+            subprocess.run([ffmpeg, '-loglevel', 'error', '-y', '-f', 'concat', '-safe', '0',
+                            '-i', listing, '-c', 'copy', out], check=True)
+
+    elapsed = time.perf_counter() - start
+    return {'ticks': replay.ticks, 'frames': frames, 'segments': len(jobs), 'workers': min(workers, len(jobs)),
+            'plan_s': planned, 'render_s': rendered, 'total_s': elapsed, 'busy_s': busy,
+            'fps': frames / elapsed if elapsed else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a Pacman replay to video or PNG frames")
+    parser.add_argument('replay', metavar='REPLAY', help="replay file (.pmr)")
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument('--out', help="video file written by ffmpeg, e.g. clip.mp4")
+    output.add_argument('--png', metavar='DIR', help="folder for a PNG sequence (frame_000001.png, ...)")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument('--segment', type=float, default=30.0, help="seconds of game per segment (default: 30)")
+    parser.add_argument('--scale', type=float, default=1, help="output pixels per game pixel (default: 1)")
+    parser.add_argument('--every', type=int, default=1, help="keep every Nth tick, e.g. 2 for 30 fps")
+    parser.add_argument('--color', choices=list(PACMAN_COLORS), default='yellow', help="Pacman's colour")
+    parser.add_argument('--ffmpeg', default='ffmpeg', help="ffmpeg executable (default: ffmpeg)")
+    args = parser.parse_args()
+
+    with open(args.replay, 'rb') as f:
+        data = f.read()
+
+    def progress(index, total, count, seconds):
+        print(f"  segment {index + 1}/{total}: {count} frames in {seconds:.2f}s", file=sys.stderr)
+
+    try:
+        result = export(data, args.out, args.png, args.workers, args.segment, args.scale, args.every,
+                        PACMAN_COLORS[args.color], args.ffmpeg, progress)
+    except ValueError as e:
+        sys.exit(f"{args.replay}: {e}")
+    except (OSError, subprocess.CalledProcessError, RuntimeError) as e:
+        sys.exit(f"Export failed: {e}")
+    print(f"{result['frames']} frames from {result['ticks']} ticks in {result['total_s']:.2f}s "
+          f"({result['fps']:.1f} frames/s, {result['segments']} segments on {result['workers']} workers, "
+          f"planning {result['plan_s']:.2f}s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
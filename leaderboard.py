@@ -0,0 +1,294 @@
+"""
+Fleet leaderboard service for Pacman cabinets.
+
+A small HTTP/1.1 server that collects high scores from any number of
+cabinets and serves the combined top scores. Connections are kept alive, so
+a cabinet's client (pacman.py, LeaderboardClient) can reuse one connection
+for every request. Requests and replies are JSON:
+
+    POST /scores   {"cabinet": "hall-3", "scores": [{"id": "...", "name": "ANN",
+                    "score": 12340, "time": 1700000000, "replay": "<base64>"}]}
+                   -> {"ack": [ids], "rejected": {id: reason}}
+    GET /top?n=10  -> {"version": V, "scores": [{"name", "score", "cabinet"}]}
+                      with ETag V; a request with If-None-Match: V gets 304
+    GET /stats     -> request, connection and score counters
+
+Every score has an id chosen by the cabinet, and a score whose id was seen
+before is acknowledged without being counted again, so cabinets can retry a
+batch whose reply was lost. With --verify the replay sent with a score must
+reproduce it (verify_replay, in worker processes) or the score is rejected.
+
+Accepted scores are appended to scores.jsonl in the data folder, which is read
+back on start, and their replays are kept in its replays folder.
+
+Usage: python leaderboard.py [--host 127.0.0.1] [--port 8766] [--data leaderboard] [--verify]
+"""
+
+import argparse
+import asyncio
+import base64
+import bisect
+import json
+import os
+import time
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qs
+
+from pacman import verify_replay
+
+# Top scores kept in memory and the most a client may ask for
+MAX_TOP = 100
+MAX_BATCH = 500
+MAX_BODY = 16 * 1024 * 1024
+REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 413: 'Payload Too Large'}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message=''):
+        super().__init__(message)
+        self.status = status
+
+
+class Leaderboard:
+    """Scores seen so far, the current top MAX_TOP and the on-disk log of accepted scores."""
+
+    def __init__(self, folder, verify=False):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.replay_dir = self.folder / "replays"
+        self.log_path = self.folder / "scores.jsonl"
+        self.verify = verify
+        self.pool = None
+        self.seen = set()
+        # Ascending by (score, -order) so the best is last; bisect keeps it sorted
+        self.top = []
+        self.order = 0
+        self.version = 0
+        self.load()
+        self.log = open(self.log_path, 'a', encoding='utf-8')
+
+        # Statistics
+        self.connections = 0
+        self.requests = 0
+        self.batches = 0
+        self.accepted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.started = time.perf_counter()
+
+    def load(self):
+        if not self.log_path.exists():
+            return
+        with open(self.log_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A line cut short when the service was killed
+                    continue
+                self.seen.add(entry['id'])
+                self.rank(entry)
+        self.version = 1
+
+    def rank(self, entry):
+        """Put an accepted score in the top list if it makes it."""
+        self.order += 1
+        key = (entry['score'], -self.order)
+        if len(self.top) >= MAX_TOP and key < self.top[0][0]:
+            return False
+        bisect.insort(self.top, (key, {'name': entry['name'], 'score': entry['score'],
+                                       'cabinet': entry['cabinet']}))
+        if len(self.top) > MAX_TOP:
+            del self.top[0]
+        return True
+
+    def top_scores(self, n):
+        return [e for _, e in self.top[:-n - 1:-1]]
+
+    async def verify_all(self, items):
+        """verify_replay results for (replay bytes, score) pairs, in worker processes."""
+        if self.pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+            self.pool = ProcessPoolExecutor()
+        loop = asyncio.get_running_loop()
+        return await asyncio.gather(*(loop.run_in_executor(self.pool, verify_replay, data, score)
+                                      for data, score in items))
+
+    async def submit(self, cabinet, scores):
+        """Take one batch of scores from a cabinet. Returns the reply."""
+        if not isinstance(scores, list) or len(scores) > MAX_BATCH:
+            raise HttpError(400, "scores must be a list of at most %d" % MAX_BATCH)
+        self.batches += 1
+        ack = []
+        rejected = {}
+        fresh = []
+        for s in scores:
+            try:
+                entry = {'id': str(s['id']), 'name': str(s['name'])[:10], 'score': int(s['score']),
+                         'time': s.get('time'), 'cabinet': cabinet}
+                replay = base64.b64decode(s['replay']) if s.get('replay') else None
+            except (KeyError, TypeError, ValueError) as e:
+                if isinstance(s, dict) and 'id' in s:
+                    rejected[str(s['id'])] = f"malformed score: {e}"
+                continue
+            if entry['id'] in self.seen:
+                self.duplicates += 1
+                ack.append(entry['id'])
+            elif self.verify and replay is None:
+                rejected[entry['id']] = "no replay"
+            else:
+                # Marked seen now so a retry arriving mid-verification is not counted twice
+                self.seen.add(entry['id'])
+                fresh.append((entry, replay))
+
+        if self.verify and fresh:
+            results = await self.verify_all([(replay, entry['score']) for entry, replay in fresh])
+            checked = []
+            for (entry, replay), result in zip(fresh, results):
+                if result['accepted']:
+                    checked.append((entry, replay))
+                else:
+                    self.seen.discard(entry['id'])
+                    rejected[entry['id']] = result['reason']
+            fresh = checked
+
+        for entry, replay in fresh:
+            if replay is not None:
+                try:
+                    self.replay_dir.mkdir(exist_ok=True)
+                    name = ''.join(c if c.isalnum() or c in '-_' else '_'
+                                   for c in f"{entry['cabinet']}_{entry['id']}") + '.pmr'
+                    (self.replay_dir / name).write_bytes(replay)
+                    entry['replay'] = name
+                except OSError:
+                    pass
+            self.log.write(json.dumps(entry) + '\n')
+            if self.rank(entry):
+                self.version += 1
+            ack.append(entry['id'])
+        self.log.flush()
+        self.accepted += len(fresh)
+        self.rejected += len(rejected)
+        return {'ack': ack, 'rejected': rejected}
+
+    def stats(self):
+        return {
+            'uptime_s': time.perf_counter() - self.started,
+            'connections': self.connections,
+            'requests': self.requests,
+            'batches': self.batches,
+            'accepted': self.accepted,
+            'duplicates': self.duplicates,
+            'rejected': self.rejected,
+            'scores': len(self.seen),
+        }
+
+    async def route(self, method, target, headers, body):
+        """(status, extra headers, reply object or None) for one request."""
+        url = urlsplit(target)
+        if url.path == '/scores':
+            if method != 'POST':
+                raise HttpError(405)
+            try:
+                request = json.loads(body)
+                cabinet = str(request.get('cabinet', ''))[:64]
+            except (ValueError, AttributeError):
+                raise HttpError(400, "body must be a JSON object")
+            return 200, {}, await self.submit(cabinet, request.get('scores'))
+        if method != 'GET':
+            raise HttpError(405)
+        if url.path == '/top':
+            try:
+                n = min(max(int(parse_qs(url.query).get('n', ['10'])[0]), 1), MAX_TOP)
+            except ValueError:
+                raise HttpError(400, "n must be a number")
+            etag = f'"{self.version}"'
+            if headers.get('if-none-match') == etag:
+                return 304, {'ETag': etag}, None
+            return 200, {'ETag': etag}, {'version': self.version, 'scores': self.top_scores(n)}
+        if url.path == '/stats':
+            return 200, {}, self.stats()
+        raise HttpError(404)
+
+    async def handle(self, reader, writer):
+        """Serve requests on one connection until the client closes it or asks to."""
+        self.connections += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    method, target, version = line.decode('latin-1').split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = (headers.get('connection', '').lower() != 'close'
+                              and version == 'HTTP/1.1')
+                self.requests += 1
+                try:
+                    try:
+                        length = int(headers.get('content-length', 0))
+                    except ValueError:
+                        length = -1
+                    if length < 0:
+                        # The body cannot be found, so neither can the next request
+                        keep_alive = False
+                        raise HttpError(400, "bad Content-Length")
+                    if length > MAX_BODY:
+                        keep_alive = False
+                        raise HttpError(413)
+                    body = await reader.readexactly(length)
+                    status, extra, reply = await self.route(method, target, headers, body)
+                except HttpError as e:
+                    status, extra, reply = e.status, {}, {'error': str(e) or REASONS.get(e.status, '')}
+                payload = json.dumps(reply, separators=(',', ':')).encode() if reply is not None else b''
+                head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+                        f"Content-Length: {len(payload)}"]
+                if payload:
+                    head.append("Content-Type: application/json")
+                head += [f"{k}: {v}" for k, v in extra.items()]
+                if not keep_alive:
+                    head.append("Connection: close")
+                writer.write(('\r\n'.join(head) + '\r\n\r\n').encode() + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host, port, folder, verify):
+    board = Leaderboard(folder, verify)
+    listener = await asyncio.start_server(board.handle, host, port)
+    async with listener:
+        await listener.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pacman fleet leaderboard service")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--data', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'leaderboard'),
+                        help="folder for the score log and replays (default: leaderboard/)")
+    parser.add_argument('--verify', action='store_true', help="reject scores their replay does not reproduce")
+    args = parser.parse_args()
+
+    print(f"Pacman leaderboard on http://{args.host}:{args.port}/, data in {args.data}")
+    try:
+        asyncio.run(serve(args.host, args.port, args.data, args.verify))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
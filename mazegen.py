@@ -0,0 +1,408 @@
+"""
+Seeded procedural Pacman mazes, for stress-testing at sizes far beyond the
+hard-coded MAZE_LAYOUT.
+
+Mazes use the same cell format as MAZE_LAYOUT (a list of strings; 0 empty,
+1 wall, 2 pellet, 3 power pellet, 4 ghost door) and work with the
+layout-keyed helpers in pacman.py (ghost_exits, wall_layer). Every maze is
+left-right symmetric, one-tile corridors with no dead ends, with tunnels
+through the side walls (which wrap, as in the game), a ghost house with a
+door in the middle and power pellets near the corners, plus one every
+POWER_SPACING tiles in big mazes.
+
+A maze is carved on the left half as a randomised depth-first spanning tree
+of cells two tiles apart, its dead ends are opened into loops, and the half
+is mirrored. Everything is linear in the number of tiles, including the
+connectivity check every maze passes before it is returned (see validate).
+
+Mazes and their derived tables (Maze) are cached by seed and size: in memory,
+and as compressed files in maze_cache/ so later runs can reuse them. A cache
+file has a header (magic, version, seed, width, height, payload length), a
+zlib-compressed payload and a CRC32 of both.
+
+Usage: python mazegen.py [--size WxH] [--seed N] [--print] [--no-cache]
+"""
+
+import argparse
+import array
+import itertools
+import random
+import struct
+import sys
+import time
+import zlib
+from collections import deque
+from pathlib import Path
+
+MIN_SIZE = 21
+MAX_SIZE = 4096
+POWER_SPACING = 64
+# Rows between tunnels (there is always at least one)
+TUNNEL_SPACING = 64
+
+# Cache file format
+MAZE_MAGIC = b'PMMZ'
+MAZE_VERSION = 1
+MAZE_HEADER = struct.Struct('<4sHQIII')     # magic, version, seed, width, height, payload length
+MAZE_META = struct.Struct('<IIIIIIII')      # start x, y, house x, y, w, h, door count, tunnel count
+MAZE_CRC = struct.Struct('<I')
+CACHE_DIR = Path(__file__).parent / "maze_cache"
+
+EMPTY, WALL, PELLET, POWER, DOOR = b'01234'
+# Cell byte -> 1 where Pacman may stand; cell byte -> 1 for a pellet, a power pellet
+WALKABLE = bytes.maketrans(b'01234', b'\x01\x00\x01\x01\x00')
+PELLETS = bytes.maketrans(b'01234', b'\x00\x00\x01\x00\x00')
+POWERS = bytes.maketrans(b'01234', b'\x00\x00\x00\x01\x00')
+# Exit bits per tile, in the order of pacman.REPLAY_DIRECTIONS: up, down, left, right
+UP, DOWN, LEFT, RIGHT = 1, 2, 4, 8
+
+# (seed, width, height) -> Maze
+_mazes = {}
+
+
+class Maze:
+    """A generated maze and the tables derived from it.
+
+    layout      the maze as a list of strings, like MAZE_LAYOUT
+    walkable    bytearray, 1 where Pacman may stand (not a wall or the door)
+    exits       bytearray of UP | DOWN | LEFT | RIGHT bits: the walkable
+                neighbours of each walkable tile, wrapping through tunnels
+    pellets     array of tile indices (y * width + x) that start with a pellet
+    power       the same for power pellets
+    start       Pacman's start tile, below the ghost house
+    house       (x, y, w, h) of the ghost house walls
+    doors       door tiles
+    tunnels     rows open at both side walls
+    """
+
+    def __init__(self, seed, width, height, layout, start, house, doors, tunnels):
+        self.seed = seed
+        self.width = width
+        self.height = height
+        self.layout = layout
+        self.start = start
+        self.house = house
+        self.doors = doors
+        self.tunnels = tunnels
+        self.derive()
+
+    def derive(self):
+        """Build walkable, exits, pellets and power from the layout in a few passes over it."""
+        width, height = self.width, self.height
+        cells = b''.join(row.encode() for row in self.layout)
+        self.walkable = bytearray(cells.translate(WALKABLE))
+        walk = self.walkable
+        exits = bytearray(width * height)
+        # A row at a time as one big integer per neighbour, a byte per tile: the rows above
+        # and below, and the row rotated by one either way (rotating is the tunnel wrap).
+        # Every byte stays below 16, so the bits never carry into the next tile.
+        for y in range(height):
+            row = walk[y * width:(y + 1) * width]
+            up = int.from_bytes(walk[(y - 1) * width:y * width], 'little') if y else 0
+            down = int.from_bytes(walk[(y + 1) * width:(y + 2) * width], 'little') if y + 1 < height else 0
+            left = int.from_bytes(row[-1:] + row[:-1], 'little')
+            right = int.from_bytes(row[1:] + row[:1], 'little')
+            bits = (up | down << 1 | left << 2 | right << 3) & int.from_bytes(row, 'little') * 15
+            exits[y * width:(y + 1) * width] = bits.to_bytes(width, 'little')
+        self.exits = exits
+        self.pellets = array.array('I', itertools.compress(range(len(cells)), cells.translate(PELLETS)))
+        self.power = array.array('I', itertools.compress(range(len(cells)), cells.translate(POWERS)))
+
+    def to_bytes(self):
+        payload = b''.join([
+            MAZE_META.pack(*self.start, *self.house, len(self.doors), len(self.tunnels)),
+            array.array('I', [i for x, y in self.doors for i in (x, y)]).tobytes(),
+            array.array('I', self.tunnels).tobytes(),
+            b''.join(row.encode() for row in self.layout),
+            bytes(self.exits),
+            array.array('I', [len(self.pellets), len(self.power)]).tobytes(),
+            self.pellets.tobytes(),
+            self.power.tobytes(),
+        ])
+        payload = zlib.compress(payload, 1)
+        data = MAZE_HEADER.pack(MAZE_MAGIC, MAZE_VERSION, self.seed, self.width, self.height, len(payload)) + payload
+        return data + MAZE_CRC.pack(zlib.crc32(data))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Load a cached maze without recomputing its tables. Raises ValueError if it is not valid."""
+        if len(data) < MAZE_HEADER.size + MAZE_CRC.size:
+            raise ValueError("maze file is truncated")
+        magic, version, seed, width, height, length = MAZE_HEADER.unpack_from(data)
+        if magic != MAZE_MAGIC or version != MAZE_VERSION:
+            raise ValueError(f"unsupported maze format {magic!r} version {version}")
+        end = MAZE_HEADER.size + length
+        if len(data) != end + MAZE_CRC.size:
+            raise ValueError("maze file length does not match its header")
+        if zlib.crc32(data[:end]) != MAZE_CRC.unpack_from(data, end)[0]:
+            raise ValueError("maze file is corrupt (checksum mismatch)")
+        payload = zlib.decompress(data[MAZE_HEADER.size:end])
+
+        sx, sy, hx, hy, hw, hh, n_doors, n_tunnels = MAZE_META.unpack_from(payload)
+        at = MAZE_META.size
+        doors = array.array('I', payload[at:at + n_doors * 8])
+        at += n_doors * 8
+        tunnels = array.array('I', payload[at:at + n_tunnels * 4])
+        at += n_tunnels * 4
+        tiles = width * height
+        cells = payload[at:at + tiles]
+        at += tiles
+
+        maze = cls.__new__(cls)
+        maze.seed, maze.width, maze.height = seed, width, height
+        maze.layout = [cells[y * width:(y + 1) * width].decode() for y in range(height)]
+        maze.start = (sx, sy)
+        maze.house = (hx, hy, hw, hh)
+        maze.doors = list(zip(doors[::2], doors[1::2]))
+        maze.tunnels = list(tunnels)
+        maze.walkable = bytearray(cells.translate(WALKABLE))
+        maze.exits = bytearray(payload[at:at + tiles])
+        at += tiles
+        n_pellets, n_power = array.array('I', payload[at:at + 8])
+        at += 8
+        maze.pellets = array.array('I', payload[at:at + n_pellets * 4])
+        at += n_pellets * 4
+        maze.power = array.array('I', payload[at:at + n_power * 4])
+        return maze
+
+
+def carve(seed, width, height):
+    """Layout rows (bytearrays) of a symmetric maze, with the ghost house not yet placed.
+
+    Cells sit two tiles apart on the left half, in columns aligned so that the
+    middle column (odd widths) or the two middle columns (even widths) are cells
+    and the halves join across the middle once mirrored.
+    """
+    rng = random.Random(seed)
+    half = (width + 1) // 2
+    last = (width - 1) // 2          # rightmost column of the left half
+    xs = list(range(last, 0, -2))[::-1]
+    ys = list(range(1, height - 1, 2))
+    cols, rows = len(xs), len(ys)
+    grid = bytearray([WALL]) * (half * height)
+    for y in ys:
+        for x in xs:
+            grid[y * half + x] = PELLET
+
+    # Depth-first spanning tree over the cells, iteratively; cell id = row * cols + col
+    visited = bytearray(cols * rows)
+    start = rng.randrange(cols * rows)
+    visited[start] = 1
+    stack = [start]
+    randrange = rng.randrange
+    while stack:
+        cell = stack[-1]
+        r, c = divmod(cell, cols)
+        options = []
+        if r > 0 and not visited[cell - cols]:
+            options.append(cell - cols)
+        if r + 1 < rows and not visited[cell + cols]:
+            options.append(cell + cols)
+        if c > 0 and not visited[cell - 1]:
+            options.append(cell - 1)
+        if c + 1 < cols and not visited[cell + 1]:
+            options.append(cell + 1)
+        if not options:
+            stack.pop()
+            continue
+        nxt = options[randrange(len(options))] if len(options) > 1 else options[0]
+        visited[nxt] = 1
+        nr, nc = divmod(nxt, cols)
+        # The wall tile between the two cells
+        grid[(ys[r] + ys[nr]) // 2 * half + (xs[c] + xs[nc]) // 2] = PELLET
+        stack.append(nxt)
+
+    # No dead ends: a cell with one way out gets a second one. Cells in the middle column
+    # of an even width already lead across to their mirror image.
+    across = width % 2 == 0
+    for r, y in enumerate(ys):
+        for c, x in enumerate(xs):
+            i = y * half + x
+            walls = []
+            if r > 0 and grid[i - half] == WALL:
+                walls.append(i - half)
+            if r + 1 < rows and grid[i + half] == WALL:
+                walls.append(i + half)
+            if c > 0 and grid[i - 1] == WALL:
+                walls.append(i - 1)
+            if c + 1 < cols and grid[i + 1] == WALL:
+                walls.append(i + 1)
+            ways = (r > 0) + (r + 1 < rows) + (c > 0) + (c + 1 < cols) - len(walls)
+            if c + 1 == cols:
+                ways += across or grid[i - 1] != WALL     # mirrored west passage on odd widths
+            if ways < 2 and walls:
+                grid[walls[randrange(len(walls))]] = PELLET
+
+    # Mirror into full rows
+    mirrored = width - half
+    return [bytearray(grid[y * half:(y + 1) * half] + grid[y * half:y * half + mirrored][::-1])
+            for y in range(height)], xs, ys
+
+
+def generate(width, height, seed=0, cache=True):
+    """The maze of this size and seed, from the cache when it has been made before.
+
+    cache=False skips the maze_cache/ folder (the in-memory cache is always used).
+    Raises ValueError for sizes outside MIN_SIZE..MAX_SIZE.
+    """
+    key = (seed, width, height)
+    maze = _mazes.get(key)
+    if maze is not None:
+        return maze
+    if not (MIN_SIZE <= width <= MAX_SIZE and MIN_SIZE <= height <= MAX_SIZE):
+        raise ValueError(f"maze size must be {MIN_SIZE} to {MAX_SIZE} tiles a side, not {width}x{height}")
+    path = CACHE_DIR / f"{seed}_{width}x{height}.pmz"
+    if cache:
+        try:
+            maze = Maze.from_bytes(path.read_bytes())
+        except (OSError, ValueError, zlib.error):
+            maze = None
+    if maze is None:
+        maze = build(seed, width, height)
+        if cache:
+            try:
+                CACHE_DIR.mkdir(exist_ok=True)
+                temp = path.with_suffix('.tmp')
+                temp.write_bytes(maze.to_bytes())
+                temp.replace(path)
+            except OSError as e:
+                print(f"Could not cache maze: {e}", file=sys.stderr)
+    _mazes[key] = maze
+    return maze
+
+
+def build(seed, width, height):
+    """Generate, decorate and validate a new maze."""
+    rows, xs, ys = carve(seed, width, height)
+
+    # Tunnels: cell rows opened through both side walls, away from the house
+    house_w, house_h = (8 if width % 2 == 0 else 7), 5
+    ring_x, ring_y = (width - house_w - 2) // 2, (height - house_h - 2) // 2
+    ring_w, ring_h = house_w + 2, house_h + 2
+    candidates = [y for y in ys[1:-1] if not ring_y <= y < ring_y + ring_h] or ys
+    count = max(1, height // TUNNEL_SPACING)
+    tunnels = sorted({candidates[(2 * k + 1) * len(candidates) // (2 * count)] for k in range(count)})
+    for y in tunnels:
+        row = rows[y]
+        for x in range(xs[0]):
+            row[x] = row[width - 1 - x] = EMPTY
+
+    # Power pellets near the four corners, and on a lattice in big mazes
+    power = {(xs[0], ys[0]), (xs[0], ys[-1])}
+    for y in ys[::max(1, POWER_SPACING // 2)]:
+        for x in xs[::max(1, POWER_SPACING // 2)]:
+            power.add((x, y))
+    for x, y in power:
+        if not (ring_x <= x < ring_x + ring_w and ring_y <= y < ring_y + ring_h):
+            rows[y][x] = rows[y][width - 1 - x] = POWER
+
+    # Ghost house: walls with the door in the middle of the top, inside an empty ring
+    for y in range(ring_y, ring_y + ring_h):
+        rows[y][ring_x:ring_x + ring_w] = bytes([EMPTY]) * ring_w
+    house_x, house_y = ring_x + 1, ring_y + 1
+    for y in range(house_y, house_y + house_h):
+        edge = y in (house_y, house_y + house_h - 1)
+        for x in range(house_x, house_x + house_w):
+            if edge or x in (house_x, house_x + house_w - 1):
+                rows[y][x] = WALL
+    door_w = 2 if width % 2 == 0 else 1
+    doors = [(x, house_y) for x in range((width - door_w) // 2, (width + door_w) // 2)]
+    for x, y in doors:
+        rows[y][x] = DOOR
+    start = ((width - 1) // 2, ring_y + ring_h - 1)
+
+    layout = [row.decode() for row in rows]
+    maze = Maze(seed, width, height, layout, start, (house_x, house_y, house_w, house_h), doors, tunnels)
+    report = validate(maze)
+    if report['unreachable'] or not report['house']:
+        raise ValueError(f"generated maze {seed} {width}x{height} is not connected: {report}")
+    return maze
+
+
+def validate(maze):
+    """Check that every walkable tile can be reached from Pacman's start, and the ghost
+    house through its door. One breadth-first pass over the tiles.
+
+    Returns a dict: 'walkable' tiles, 'reachable' from the start, 'unreachable'
+    walkable tiles, 'pellets' unreachable pellets and power pellets, and 'house':
+    whether the house interior is reached through the door.
+    """
+    width, height = maze.width, maze.height
+    walk, exits = maze.walkable, maze.exits
+    seen = bytearray(width * height)
+    sx, sy = maze.start
+    first = sy * width + sx
+    seen[first] = 1
+    queue = deque([first])
+    pop, push = queue.popleft, queue.append
+    reached = 1
+    while queue:
+        i = pop()
+        bits = exits[i]
+        if not bits:
+            continue
+        y, x = divmod(i, width)
+        if bits & UP and not seen[i - width]:
+            seen[i - width] = 1
+            push(i - width)
+            reached += 1
+        if bits & DOWN and not seen[i + width]:
+            seen[i + width] = 1
+            push(i + width)
+            reached += 1
+        j = i - 1 if x else i + width - 1
+        if bits & LEFT and not seen[j]:
+            seen[j] = 1
+            push(j)
+            reached += 1
+        j = i + 1 if x + 1 < width else i - x
+        if bits & RIGHT and not seen[j]:
+            seen[j] = 1
+            push(j)
+            reached += 1
+
+    walkable = walk.count(1)
+    # The house interior lies behind a door; it counts if a door tile touches reached tiles
+    # on one side and the interior on the other
+    hx, hy, hw, hh = maze.house
+    interior = [(y * width + x) for y in range(hy + 1, hy + hh - 1) for x in range(hx + 1, hx + hw - 1)]
+    house = all(walk[i] for i in interior) and any(
+        seen[(y - 1) * width + x] and walk[(y + 1) * width + x] for x, y in maze.doors)
+    # Flood the interior from the door so it is not reported as unreachable
+    if house:
+        for i in interior:
+            if not seen[i]:
+                seen[i] = 1
+                reached += 1
+    unreachable = walkable - reached
+    pellets = sum(1 for i in maze.pellets if not seen[i]) + sum(1 for i in maze.power if not seen[i])
+    return {'walkable': walkable, 'reachable': reached, 'unreachable': unreachable,
+            'pellets': pellets, 'house': house}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a procedural Pacman maze")
+    parser.add_argument('--size', default='28x31', help="WxH in tiles (default: 28x31)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--print', action='store_true', help="print the layout, one row per line")
+    parser.add_argument('--no-cache', action='store_true', help="neither read nor write maze_cache/")
+    args = parser.parse_args()
+
+    width, height = map(int, args.size.split('x'))
+    start = time.perf_counter()
+    try:
+        maze = generate(width, height, args.seed, cache=not args.no_cache)
+    except ValueError as e:
+        sys.exit(str(e))
+    elapsed = time.perf_counter() - start
+    if args.print:
+        print('\n'.join(maze.layout))
+    report = validate(maze)
+    print(f"{width}x{height} seed {args.seed}: {report['walkable']:,} walkable tiles, {len(maze.pellets):,} pellets, "
+          f"{len(maze.power)} power pellets, {len(maze.tunnels)} tunnels; "
+          f"{'connected' if not report['unreachable'] and report['house'] else 'NOT connected'}; "
+          f"{elapsed:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,20 +3,27 @@ Pacman Game - Simple movement version
 """
 
 import random
-import json
+import array
+import copy
+import gc
+import itertools
+import collections
 import math
-import urllib.request
-import urllib.error
-import threading
+import struct
+import zlib
+import time
 import os
 import sys
 from pathlib import Path
 
+# json, threading, urllib and argparse are imported where they are used: none of
+# them is needed to get the menu on screen, and urllib alone costs tens of ms
+
 
 def check_dependencies():
     """Check if pygame is installed and offer to install if missing."""
     try:
-        import pygame
+        import_pygame(lean=True)
         return True
     except ImportError:
         return handle_missing_pygame()
@@ -91,6 +98,40 @@ def install_pygame(system=""):
 # This allows the script to show helpful error messages if pygame is missing
 pygame = None
 
+# Imported by pygame at import time for optional features the game does not use
+# (surfarray and package data); together they are most of pygame's import time
+PYGAME_OPTIONAL_IMPORTS = ('numpy', 'pkg_resources')
+
+
+def import_pygame(lean=False):
+    """Import pygame. lean skips the optional imports; only for processes that never use surfarray."""
+    blocked = [name for name in PYGAME_OPTIONAL_IMPORTS if lean and name not in sys.modules]
+    for name in blocked:
+        sys.modules[name] = None
+    try:
+        import pygame as pg
+    finally:
+        for name in blocked:
+            del sys.modules[name]
+    return pg
+
+
+def init_pygame(headless=False):
+    """Import pygame and initialise the modules the game uses, optionally under the dummy video driver.
+
+    Only the display (with events) and fonts are initialised, not audio, joysticks
+    or the other subsystems pygame.init() would start.
+    """
+    global pygame
+    if headless:
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    pygame = import_pygame()
+    pygame.display.init()
+    pygame.font.init()
+    return pygame
+
+
 # Game version - increment this when releasing updates
 GAME_VERSION = "1.0.0"
 GITHUB_REPO = "dave-sedlacko-fts/pacman-game"
@@ -113,6 +154,8 @@ class UpdateChecker:
 
     def get_remote_version(self):
         """Fetch the version from the remote pacman.py file."""
+        import urllib.request
+        import urllib.error
         try:
             req = urllib.request.Request(
                 GITHUB_RAW_URL,
@@ -200,11 +243,13 @@ class UpdateChecker:
 
     def start_check(self):
         """Start the update check in a background thread."""
+        import threading
         thread = threading.Thread(target=self.check_for_updates, daemon=True)
         thread.start()
 
     def start_download(self):
         """Start the download in a background thread."""
+        import threading
         thread = threading.Thread(target=self.download_update, daemon=True)
         thread.start()
 
@@ -214,7 +259,9 @@ TILE_SIZE = 24
 MAZE_WIDTH = 28
 MAZE_HEIGHT = 31
 GAME_WIDTH = TILE_SIZE * MAZE_WIDTH
-GAME_HEIGHT = TILE_SIZE * MAZE_HEIGHT + 60
+PLAYFIELD_HEIGHT = TILE_SIZE * MAZE_HEIGHT
+GAME_HEIGHT = PLAYFIELD_HEIGHT + 60
+FPS = 60
 
 # Colors
 BLACK = (0, 0, 0)
@@ -275,13 +322,671 @@ MAZE_LAYOUT = [
     "1111111111111111111111111111",
 ]
 
+# Tiles that start with a pellet / power pellet, in layout order
+PELLET_TILES = [(x, y) for y, row in enumerate(MAZE_LAYOUT) for x, c in enumerate(row) if c == '2']
+POWER_TILES = [(x, y) for y, row in enumerate(MAZE_LAYOUT) for x, c in enumerate(row) if c == '3']
+# MAZE_LAYOUT as rows of cell numbers; never modified, so every game shares it
+MAZE_CELLS = [[int(c) for c in row] for row in MAZE_LAYOUT]
+
+
+# Pacman touches a ghost when their centres are closer than 0.6 tiles (squared, in pixels)
+TOUCH_DISTANCE_SQ = (TILE_SIZE * 0.6) ** 2
+
+# Pacman and a ghost cannot touch while the larger of their x and y distances is at least this
+TOUCH_REACH = int(TOUCH_DISTANCE_SQ ** 0.5) + 1
+# Tick beyond any game, for "nothing due"
+NEVER = 1 << 62
+
+# Frames between Pacman's mouth opening and closing
+MOUTH_INTERVAL = 5
+
+# Kinds of timer event, scheduled as (kind, index) on the Simulation's TimerWheel
+TIMER_MOUTH = 0         # Pacman's mouth toggles
+TIMER_VULNERABLE = 1    # ghost index stops being vulnerable
+TIMER_HOUSE = 2         # ghost index leaves the ghost house
+
+# One shared (x, y) tuple per tile, so the frame loop can name tiles without building tuples
+TILES = [[(x, y) for x in range(MAZE_WIDTH)] for y in range(MAZE_HEIGHT)]
+TILE_COLUMNS = [[row[x] for row in TILES] for x in range(MAZE_WIDTH)]
+
+# Moves in the order ghosts consider them; ties and random picks depend on this order
+GHOST_DIRECTIONS = ((0, -1), (0, 1), (-1, 0), (1, 0))
+# The reverse of each heading as a one-move tuple, indexed by (dy + 1) * 3 + dx + 1
+GHOST_REVERSE = tuple(((-dx, -dy),) for dy in (-1, 0, 1) for dx in (-1, 0, 1))
+_ghost_exits = {}
+
+
+def ghost_exits(layout):
+    """Moves a ghost may take from each tile, as exits[allow_door][y][x][heading].
+
+    heading is (dy + 1) * 3 + dx + 1 for the ghost's current direction, and a ghost
+    never turns straight back. Built once per layout; every entry is a shared tuple.
+    """
+    key = tuple(layout)
+    if key not in _ghost_exits:
+        height, width = len(layout), len(layout[0])
+        shared = {}
+        tables = []
+        for allow_door in (False, True):
+            blocked = '1' if allow_door else '14'
+            rows = []
+            for y in range(height):
+                row = []
+                for x in range(width):
+                    open_moves = [(dx, dy) for dx, dy in GHOST_DIRECTIONS
+                                  if 0 <= y + dy < height and layout[y + dy][(x + dx) % width] not in blocked]
+                    by_heading = []
+                    for hy in (-1, 0, 1):
+                        for hx in (-1, 0, 1):
+                            moves = tuple(d for d in open_moves if (hx or hy) == 0 or d != (-hx, -hy))
+                            by_heading.append(shared.setdefault(moves, moves))
+                    row.append(tuple(by_heading))
+                rows.append(tuple(row))
+            tables.append(tuple(rows))
+        _ghost_exits[key] = tuple(tables)
+    return _ghost_exits[key]
+
+
+_ghost_corridors = {}
+
+
+def ghost_corridors(layout):
+    """The maze as junctions joined by corridors, for ghosts: runs[allow_door][y][x][heading].
+
+    For a ghost that has just decided on tile (x, y) and now heads in heading, the run
+    is the tile centres ahead where its move is forced (a single exit, or turning back
+    at a dead end), up to the next junction, tunnel mouth or, for eaten ghosts, the
+    tile where they re-enter the house. Each entry is (centre x, centre y, dx, dy, tile)
+    with the direction taken there. Built once per layout.
+    """
+    key = tuple(layout)
+    if key not in _ghost_corridors:
+        exits = ghost_exits(layout)
+        height, width = len(layout), len(layout[0])
+        tables = []
+        for allow_door in (False, True):
+            rows = []
+            for y in range(height):
+                row = []
+                for x in range(width):
+                    by_heading = []
+                    for heading in range(9):
+                        dx, dy = heading % 3 - 1, heading // 3 - 1
+                        tx, ty = x, y
+                        run = []
+                        while (dx == 0) != (dy == 0) and layout[y][x] != '1' and len(run) < width * height:
+                            tx += dx
+                            ty += dy
+                            if (not 0 <= tx < width or not 0 <= ty < height
+                                    or (allow_door and (tx, ty) == (13, 14))):
+                                break
+                            moves = exits[allow_door][ty][tx][(dy + 1) * 3 + dx + 1]
+                            if len(moves) > 1:
+                                break
+                            dx, dy = moves[0] if moves else (-dx, -dy)
+                            run.append((tx * TILE_SIZE + TILE_SIZE // 2, ty * TILE_SIZE + TILE_SIZE // 2,
+                                        dx, dy, TILES[ty][tx]))
+                        by_heading.append(tuple(run))
+                    row.append(tuple(by_heading))
+                rows.append(tuple(row))
+            tables.append(tuple(rows))
+        _ghost_corridors[key] = tuple(tables)
+    return _ghost_corridors[key]
+
+
+_wall_layers = {}
+
+
+def wall_layer(layout, scale=1):
+    """The maze's walls drawn at scale (output pixels per game pixel), for blitting over a
+    black background: black is the colour key, so only the walls are copied. Built once
+    per layout and scale."""
+    key = (tuple(layout), scale)
+    layer = _wall_layers.get(key)
+    if layer is None:
+        tile = TILE_SIZE * scale
+        border = -2 * round(2 * scale)
+        layer = pygame.Surface((round(len(layout[0]) * tile), round(len(layout) * tile)))
+        for y, row in enumerate(layout):
+            top = round(y * tile)
+            height = round((y + 1) * tile) - top
+            for x, cell in enumerate(row):
+                if cell == '1':
+                    # Edges are rounded, not sizes, so walls meet without gaps at any scale
+                    left = round(x * tile)
+                    rect = pygame.Rect(left, top, round((x + 1) * tile) - left, height)
+                    pygame.draw.rect(layer, WALL_BLUE, rect)
+                    pygame.draw.rect(layer, BLACK, rect.inflate(border, border))
+        # Run-length encoded, a blit skips the black between walls almost for free
+        layer.set_colorkey(BLACK, pygame.RLEACCEL)
+        _wall_layers[key] = layer
+    return layer
+
+
+def pack_bits(tiles, present):
+    """One bit per tile in tiles, set when the tile is in present."""
+    # Built as a binary-digit string so the per-tile work stays in C
+    digits = bytes(map(present.__contains__, tiles)).translate(_BIT_DIGITS)
+    return int(digits[::-1] or b'0', 2).to_bytes((len(tiles) + 7) // 8, 'little')
+
+
+def unpack_bits(tiles, data, offset=0):
+    """Inverse of pack_bits. Returns (set of tiles, offset after the bitmap)."""
+    end = offset + (len(tiles) + 7) // 8
+    bits = format(int.from_bytes(data[offset:end], 'little'), f'0{len(tiles)}b')
+    flags = bits[:-len(tiles) - 1:-1].encode().translate(_DIGIT_BITS)
+    return set(itertools.compress(tiles, flags)), end
+
+
+_BIT_DIGITS = bytes.maketrans(b'\x00\x01', b'01')
+_DIGIT_BITS = bytes.maketrans(b'01', b'\x00\x01')
+
+
+# Save format: header, fixed-layout body, CRC32 of both
+SAVE_MAGIC = b'PMSV'
+SAVE_VERSION = 1
+SAVE_HEADER = struct.Struct('<4sH')
+SAVE_BODY = struct.Struct(
+    '<3B'                      # Pacman colour
+    'IiBBB'                    # tick, score, lives, ghost eat streak, game over
+    'bbhhbbbbBbbBB'            # Pacman: tile, pixel, target, facing, moving, input, mouth, anim timer
+    + 'hhbbBBBhhbb' * 4        # ghosts: pixel, direction, vulnerable, eaten, in house, timers, last tile
+    + f'{(len(PELLET_TILES) + 7) // 8}s{(len(POWER_TILES) + 7) // 8}s'
+    + '625IBd'                 # Mersenne Twister state, cached gauss value
+)
+SAVE_CRC = struct.Struct('<I')
+SAVE_SIZE = SAVE_HEADER.size + SAVE_BODY.size + SAVE_CRC.size
+# Ticks between autosaves while playing (one second)
+AUTOSAVE_INTERVAL = FPS
+
+# Replay format: header, inputs as (tick, direction), checkpoints as (tick, score, lives), CRC32
+REPLAY_MAGIC = b'PMRP'
+REPLAY_VERSION = 1
+REPLAY_HEADER = struct.Struct('<4sHQIiII')   # magic, version, seed, ticks, final score, input count, checkpoint count
+REPLAY_INPUT = struct.Struct('<IB')
+REPLAY_CHECKPOINT = struct.Struct('<IiB')
+REPLAY_CRC = struct.Struct('<I')
+REPLAY_DIRECTIONS = [(0, -1), (0, 1), (-1, 0), (1, 0)]
+# Longest game a replay may claim (four hours), so a bogus header cannot tie up a verifier
+REPLAY_MAX_TICKS = FPS * 60 * 60 * 4
+
+# Telemetry: finished sessions are appended to telemetry.bin in batches, each a
+# header (magic, version, session count, payload length) and a zlib-compressed run
+# of fixed-size session records: TELEMETRY_SESSION, then deaths per tile (one
+# byte each) and the times Pacman entered each tile (uint16 each), tiles in
+# row-major order
+TELEMETRY_MAGIC = b'PMTL'
+TELEMETRY_VERSION = 1
+TELEMETRY_BATCH = struct.Struct('<4sHII')
+TELEMETRY_LEVELS = 16   # levels timed per session; later ones are only counted
+TELEMETRY_SESSION = struct.Struct(
+    '<IiHIH'                   # ticks, score, levels cleared, pellets eaten, power pellets eaten
+    '5H'                       # power pellets after which 0, 1, 2, 3 or 4 ghosts were eaten
+    f'{TELEMETRY_LEVELS}I'     # ticks taken by each level cleared (0 if not cleared or not timed)
+)
+MAZE_TILES = MAZE_WIDTH * MAZE_HEIGHT
+TELEMETRY_SIZE = TELEMETRY_SESSION.size + MAZE_TILES * 3
+
+
+class Replay:
+    """The inputs of one game from its seed, plus every tick where the score or lives changed.
+
+    Call record() after each Simulation.step(); verify_replay() re-simulates the game
+    and checks it against the recorded checkpoints.
+    """
+
+    def __init__(self, seed):
+        self.seed = seed
+        self.ticks = 0
+        self.score = 0
+        self.lives = 3
+        self.inputs = []
+        self.checkpoints = []
+
+    def record(self, sim, direction):
+        if direction is not None:
+            self.inputs.append((sim.tick - 1, REPLAY_DIRECTIONS.index(direction)))
+        if sim.score != self.score or sim.lives != self.lives:
+            self.score = sim.score
+            self.lives = sim.lives
+            self.checkpoints.append((sim.tick, sim.score, sim.lives))
+        self.ticks = sim.tick
+
+    def copy(self):
+        """A copy that later record() calls leave alone, to serialise on another thread."""
+        replay = Replay(self.seed)
+        replay.ticks = self.ticks
+        replay.score = self.score
+        replay.lives = self.lives
+        replay.inputs = self.inputs[:]
+        replay.checkpoints = self.checkpoints[:]
+        return replay
+
+    def to_bytes(self):
+        data = b''.join([
+            REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, self.seed, self.ticks, self.score,
+                               len(self.inputs), len(self.checkpoints)),
+            b''.join(REPLAY_INPUT.pack(*i) for i in self.inputs),
+            b''.join(REPLAY_CHECKPOINT.pack(*c) for c in self.checkpoints),
+        ])
+        return data + REPLAY_CRC.pack(zlib.crc32(data))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Parse a replay. Raises ValueError if it is not a valid one."""
+        if len(data) < REPLAY_HEADER.size + REPLAY_CRC.size:
+            raise ValueError("replay is truncated")
+        magic, version, seed, ticks, score, n_inputs, n_checkpoints = REPLAY_HEADER.unpack_from(data)
+        if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+            raise ValueError(f"unsupported replay format {magic!r} version {version}")
+        checkpoints_at = REPLAY_HEADER.size + n_inputs * REPLAY_INPUT.size
+        end = checkpoints_at + n_checkpoints * REPLAY_CHECKPOINT.size
+        if len(data) != end + REPLAY_CRC.size:
+            raise ValueError("replay length does not match its header")
+        if zlib.crc32(data[:end]) != REPLAY_CRC.unpack_from(data, end)[0]:
+            raise ValueError("replay is corrupt (checksum mismatch)")
+
+        replay = cls(seed)
+        replay.ticks = ticks
+        replay.score = score
+        replay.inputs = list(REPLAY_INPUT.iter_unpack(data[REPLAY_HEADER.size:checkpoints_at]))
+        replay.checkpoints = list(REPLAY_CHECKPOINT.iter_unpack(data[checkpoints_at:end]))
+        if replay.checkpoints:
+            replay.lives = replay.checkpoints[-1][2]
+        return replay
+
+
+def verify_replay(data, claimed_score=None):
+    """Re-simulate a replay and check it against its checkpoints and, if given, the claimed score.
+
+    Returns a dict with 'accepted', 'score', 'ticks', 'divergence' (the first tick
+    where the re-simulation disagrees with the replay, or None) and 'reason'.
+    """
+    result = {'accepted': False, 'score': None, 'ticks': 0, 'divergence': None, 'reason': ''}
+    try:
+        replay = Replay.from_bytes(data)
+    except ValueError as e:
+        result['reason'] = str(e)
+        return result
+    result['score'] = replay.score
+    result['ticks'] = replay.ticks
+    if replay.ticks > REPLAY_MAX_TICKS:
+        result['reason'] = f"replay claims {replay.ticks} ticks, limit is {REPLAY_MAX_TICKS}"
+        return result
+
+    sim = Simulation(seed=replay.seed)
+    inputs = {tick: REPLAY_DIRECTIONS[d] for tick, d in replay.inputs if d < len(REPLAY_DIRECTIONS)}
+    upcoming = sorted(inputs, reverse=True)
+    checkpoints = iter(replay.checkpoints)
+    expected = next(checkpoints, None)
+    # Stretches without input are fast-forwarded. Checkpoints are compared as if the game
+    # had been stepped tick by tick: after every tick that changes the score or lives,
+    # and on any other tick a checkpoint names.
+    ff = FastForward(sim)
+    while sim.tick < replay.ticks:
+        if sim.game_over:
+            result['divergence'] = sim.tick
+            result['reason'] = "game ended before the replay did"
+            return result
+        start = sim.tick
+        while upcoming and upcoming[-1] <= start:
+            upcoming.pop()
+        score, lives = sim.score, sim.lives
+        ff.run(min(upcoming[-1], replay.ticks) if upcoming else replay.ticks, inputs.get(start))
+        for tick, new_score, new_lives in ff.changes + [(sim.tick + 1, None, None)]:
+            while expected and start < expected[0] < tick and expected == (expected[0], score, lives):
+                expected = next(checkpoints, None)
+            if expected and start < expected[0] < tick:
+                tick, new_score, new_lives = expected[0], score, lives   # a checkpoint it misses
+            elif new_score is None:
+                break
+            if expected != (tick, new_score, new_lives):
+                result['divergence'] = tick
+                result['reason'] = (f"re-simulation has score {new_score}, lives {new_lives}; "
+                                    f"replay expects {expected}")
+                return result
+            score, lives = new_score, new_lives
+            expected = next(checkpoints, None)
+
+    if expected is not None:
+        result['divergence'] = expected[0]
+        result['reason'] = f"replay ends before its checkpoint at tick {expected[0]}"
+    elif not sim.game_over:
+        result['reason'] = "replay ends before game over"
+    elif sim.score != replay.score:
+        result['divergence'] = sim.tick
+        result['reason'] = f"final score is {sim.score}, replay claims {replay.score}"
+    elif claimed_score is not None and claimed_score != sim.score:
+        result['reason'] = f"replay scores {sim.score}, not the claimed {claimed_score}"
+    else:
+        result['accepted'] = True
+    return result
+
+
+class RewindBuffer:
+    """The last stretch of play, for seeking back to any recent tick.
+
+    Every `interval` ticks a full snapshot (Simulation.to_bytes()) is kept, and every
+    tick costs one byte: the direction given to step() on it. Both live in rings
+    preallocated from max_bytes, so memory stays fixed and the oldest history is
+    overwritten. Seeking restores the snapshot at or before the tick and re-simulates
+    the ticks after it, so it costs at most `interval` steps.
+    """
+
+    def __init__(self, max_bytes=4 << 20, interval=FPS):
+        self.interval = interval
+        self.slots = max(2, max_bytes // (SAVE_SIZE + interval))
+        self.capacity = self.slots * interval
+        self.snapshots = bytearray(self.slots * SAVE_SIZE)
+        self.inputs = bytearray(self.capacity)
+        self.base = None
+
+    @property
+    def memory(self):
+        return len(self.snapshots) + len(self.inputs)
+
+    def bytes_per_minute(self):
+        """Memory used by each minute of history."""
+        return FPS * 60 * (SAVE_SIZE + self.interval) // self.interval
+
+    def start(self, sim):
+        """Start recording from sim's current state."""
+        self.base = sim.tick
+        self.latest = sim.tick
+        self.oldest_snapshot = 0
+        self.store_snapshot(sim, 0)
+
+    def store_snapshot(self, sim, k):
+        i = k % self.slots * SAVE_SIZE
+        self.snapshots[i:i + SAVE_SIZE] = sim.to_bytes()
+        self.oldest_snapshot = max(self.oldest_snapshot, k - self.slots + 1)
+
+    @property
+    def oldest(self):
+        """The earliest tick that can still be reached."""
+        return self.base + self.oldest_snapshot * self.interval
+
+    def record(self, sim, direction):
+        """Call after each sim.step(direction). After a seek, this discards the old future."""
+        tick = sim.tick - 1
+        self.inputs[tick % self.capacity] = 0 if direction is None else REPLAY_DIRECTIONS.index(direction) + 1
+        self.latest = sim.tick
+        k, offset = divmod(sim.tick - self.base, self.interval)
+        if offset == 0:
+            self.store_snapshot(sim, k)
+
+    def seek(self, tick, sim):
+        """Put sim into the state it had at tick, which must be between oldest and latest."""
+        if not self.oldest <= tick <= self.latest:
+            raise ValueError(f"tick {tick} is outside the rewind history {self.oldest}-{self.latest}")
+        k = (tick - self.base) // self.interval
+        i = k % self.slots * SAVE_SIZE
+        sim.restore(memoryview(self.snapshots)[i:i + SAVE_SIZE])
+        inputs = self.inputs
+        for t in range(sim.tick, tick):
+            code = inputs[t % self.capacity]
+            sim.step(REPLAY_DIRECTIONS[code - 1] if code else None)
+        return sim
+
+
+class Telemetry:
+    """Gameplay counters for one session, in fixed-size buffers reused from game to game.
+
+    Call record() after each Simulation.step(): it looks at Pacman's tile and the
+    step's events and touches nothing else, so it costs a fraction of a microsecond.
+    finish() packs the session into one TELEMETRY_SIZE record for TelemetryWriter.
+    """
+
+    def __init__(self):
+        self.deaths = bytearray(MAZE_TILES)
+        self.visits = array.array('H', bytes(MAZE_TILES * 2))
+        self.ghost_eats = [0] * 5
+        self.level_ticks = [0] * TELEMETRY_LEVELS
+
+    def start(self, sim):
+        """Start a session from sim's current state (a new or resumed game)."""
+        self.deaths[:] = bytes(MAZE_TILES)
+        self.visits[:] = array.array('H', bytes(MAZE_TILES * 2))
+        self.ghost_eats[:] = [0] * 5
+        self.level_ticks[:] = [0] * TELEMETRY_LEVELS
+        self.start_tick = sim.tick
+        # A resumed game started its level before this session did, so that level is not timed
+        self.level_start = sim.tick if sim.tick == 0 else None
+        self.levels = 0
+        self.pellets = 0
+        self.power = 0
+        self.streak = None  # ghosts eaten since the last power pellet
+        self.tile = -1
+
+    def record(self, sim):
+        p = sim.pacman
+        tile = p.tile_y * MAZE_WIDTH + p.tile_x
+        if tile != self.tile:
+            self.tile = tile
+            if self.visits[tile] < 0xFFFF:
+                self.visits[tile] += 1
+        if sim.events:
+            for kind, detail in sim.events:
+                if kind == 'pellet':
+                    self.pellets += 1
+                elif kind == 'ghost':
+                    if self.streak is not None:
+                        self.streak += 1
+                elif kind == 'power':
+                    self.end_streak()
+                    self.power += 1
+                    self.streak = 0
+                elif kind == 'death':
+                    i = detail[1] * MAZE_WIDTH + detail[0]
+                    if self.deaths[i] < 0xFF:
+                        self.deaths[i] += 1
+                elif kind == 'level':
+                    if self.level_start is not None and self.levels < TELEMETRY_LEVELS:
+                        self.level_ticks[self.levels] = sim.tick - self.level_start
+                    self.level_start = sim.tick
+                    self.levels += 1
+
+    def end_streak(self):
+        if self.streak is not None:
+            self.ghost_eats[min(self.streak, 4)] += 1
+            self.streak = None
+
+    def finish(self, sim):
+        """The session as one record (bytes)."""
+        self.end_streak()
+        visits = self.visits
+        if sys.byteorder == 'big':
+            visits = array.array('H', visits)
+            visits.byteswap()
+        head = TELEMETRY_SESSION.pack(sim.tick - self.start_tick, sim.score, self.levels,
+                                      self.pellets, self.power, *self.ghost_eats, *self.level_ticks)
+        return head + bytes(self.deaths) + visits.tobytes()
+
+
+class TelemetryWriter:
+    """Appends telemetry records to a file in batches, from a background thread.
+
+    submit() only queues the record; the thread wakes every `interval` seconds and
+    writes whatever has queued up, as compressed batches of up to batch_size
+    sessions. close() writes the rest.
+    """
+
+    def __init__(self, path, interval=5.0, batch_size=1024):
+        self.path = path
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pending = collections.deque()
+        self.thread = None
+        self.sessions = 0
+        self.batches = 0
+        self.bytes_written = 0
+
+    def submit(self, record):
+        self.pending.append(record)
+        if self.thread is None:
+            import threading
+            self.stopping = threading.Event()
+            self.thread = threading.Thread(target=self._worker, daemon=True)
+            self.thread.start()
+
+    def _worker(self):
+        while not self.stopping.wait(self.interval):
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        try:
+            with open(self.path, 'ab') as f:
+                while self.pending:
+                    batch = []
+                    while self.pending and len(batch) < self.batch_size:
+                        batch.append(self.pending.popleft())
+                    payload = zlib.compress(b''.join(batch), 6)
+                    f.write(TELEMETRY_BATCH.pack(TELEMETRY_MAGIC, TELEMETRY_VERSION, len(batch), len(payload)))
+                    f.write(payload)
+                    self.sessions += len(batch)
+                    self.batches += 1
+                    self.bytes_written += TELEMETRY_BATCH.size + len(payload)
+        except OSError as e:
+            print(f"Could not write telemetry: {e}")
+
+    def close(self):
+        """Write everything still queued and stop the thread."""
+        if self.thread is not None:
+            self.stopping.set()
+            self.thread.join()
+            self.thread = None
+        self.flush()
+
+
+class SaveWriter:
+    """Writes game saves to a file from a background thread, so a slow disk never stalls a frame.
+
+    submit() only hands over the save; the thread writes the newest one waiting to a
+    temporary file, fsyncs it and renames it over the save, so a power cut leaves the
+    old save intact. write() and discard() act at once, for suspend, quit and game
+    over, and a background save older than either is dropped rather than written.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pending = None
+        self.thread = None
+        self.sequence = 0
+        # Sequence number of what the file holds now; the file lock orders writers
+        self.written = 0
+        self.saves = 0
+
+    def submit(self, state, replay):
+        """Save Simulation.to_bytes() and a Replay (not changed afterwards) in the background."""
+        if self.thread is None:
+            import threading
+            self.lock = threading.Lock()
+            self.file_lock = threading.Lock()
+            self.wake = threading.Event()
+            self.stopping = False
+            self.thread = threading.Thread(target=self._worker, daemon=True)
+            self.thread.start()
+        with self.lock:
+            self.sequence += 1
+            self.pending = (self.sequence, state, replay)
+        self.wake.set()
+
+    def _worker(self):
+        while True:
+            self.wake.wait()
+            self.wake.clear()
+            with self.lock:
+                job, self.pending = self.pending, None
+            if job:
+                with self.file_lock:
+                    self._write(*job)
+            if self.stopping:
+                break
+
+    def _next(self):
+        """A sequence number for a save or discard made now, dropping any save still waiting."""
+        if self.thread is None:
+            self.sequence += 1
+            return self.sequence
+        with self.lock:
+            self.sequence += 1
+            self.pending = None
+            return self.sequence
+
+    def _write(self, sequence, state, replay):
+        if sequence < self.written:
+            return True   # a newer save is on disk already
+        tmp = self.path.with_suffix('.tmp')
+        try:
+            with open(tmp, 'wb') as f:
+                # The replay so far follows the game state, so a resumed game can still be verified
+                f.write(state)
+                f.write(replay.to_bytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Could not save game: {e}")
+            return False
+        self.written = sequence
+        self.saves += 1
+        return True
+
+    def _remove(self, sequence):
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+        self.written = sequence
+
+    def write(self, state, replay):
+        """Save now, replacing any background save still waiting. Returns whether it worked."""
+        sequence = self._next()
+        if self.thread is None:
+            return self._write(sequence, state, replay)
+        with self.file_lock:
+            return self._write(sequence, state, replay)
+
+    def discard(self):
+        """Delete the save now; background saves still waiting are dropped."""
+        sequence = self._next()
+        if self.thread is None:
+            self._remove(sequence)
+            return
+        with self.file_lock:
+            self._remove(sequence)
+
+    def close(self):
+        """Write the save still waiting, if any, and stop the thread."""
+        if self.thread is not None:
+            self.stopping = True
+            self.wake.set()
+            self.thread.join()
+            self.thread = None
+
 
 class HighScoreManager:
     def __init__(self):
         self.scores_file = Path(__file__).parent / "highscores.json"
-        self.scores = self.load_scores()
+        self.replay_dir = Path(__file__).parent / "replays"
+        # Read from disk on first use rather than at startup
+        self._scores = None
+
+    @property
+    def scores(self):
+        if self._scores is None:
+            self._scores = self.load_scores()
+        return self._scores
+
+    @scores.setter
+    def scores(self, scores):
+        self._scores = scores
 
     def load_scores(self):
+        import json
         if self.scores_file.exists():
             try:
                 with open(self.scores_file, 'r') as f:
@@ -291,17 +996,34 @@ class HighScoreManager:
         return []
 
     def save_scores(self):
+        import json
         try:
             with open(self.scores_file, 'w') as f:
                 json.dump(self.scores, f, indent=2)
         except:
             pass
 
-    def add_score(self, name, score):
-        self.scores.append({'name': name, 'score': score})
+    def add_score(self, name, score, replay):
+        """Add a score, but only if the replay (Replay.to_bytes()) reproduces it.
+
+        Accepted replays are kept in the replays folder. Returns the verify_replay() result.
+        """
+        result = verify_replay(replay, score)
+        if not result['accepted']:
+            return result
+        entry = {'name': name, 'score': score}
+        try:
+            self.replay_dir.mkdir(exist_ok=True)
+            replay_file = self.replay_dir / f"{int(time.time())}_{score}.pmr"
+            replay_file.write_bytes(replay)
+            entry['replay'] = replay_file.name
+        except OSError:
+            pass
+        self.scores.append(entry)
         self.scores.sort(key=lambda x: x['score'], reverse=True)
         self.scores = self.scores[:10]
         self.save_scores()
+        return result
 
     def is_high_score(self, score):
         if len(self.scores) < 10:
@@ -312,12 +1034,336 @@ class HighScoreManager:
         return self.scores
 
 
+class ConnectionPool:
+    """Persistent HTTP/1.1 connections to one server, reused across requests.
+
+    request() borrows an idle connection (or opens one), and gives it back once the
+    whole reply has been read unless the server asked to close it. A reused
+    connection the server has meanwhile dropped is retried once on a new one.
+    """
+
+    def __init__(self, host, port, timeout=2.0, size=2):
+        import http.client
+        import threading
+        self.http = http.client
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.size = size
+        self.idle = []
+        self.lock = threading.Lock()
+        self.opened = 0
+        self.requests = 0
+
+    def request(self, method, path, body=None, headers=None):
+        """(status, headers, body bytes). Raises OSError or http.client.HTTPException."""
+        headers = dict(headers or {})
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+        while True:
+            with self.lock:
+                conn = self.idle.pop() if self.idle else None
+            reused = conn is not None
+            if conn is None:
+                conn = self.http.HTTPConnection(self.host, self.port, timeout=self.timeout)
+                self.opened += 1
+            try:
+                conn.request(method, path, body, headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (OSError, self.http.HTTPException):
+                conn.close()
+                if reused:
+                    continue
+                raise
+            self.requests += 1
+            if response.will_close:
+                conn.close()
+            else:
+                with self.lock:
+                    if len(self.idle) < self.size:
+                        self.idle.append(conn)
+                        conn = None
+                if conn is not None:
+                    conn.close()
+            return response.status, response.headers, data
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            conn.close()
+
+
+class LeaderboardClient:
+    """Sends this cabinet's high scores to the fleet leaderboard (leaderboard.py) and
+    keeps its top scores at hand, all from a background thread.
+
+    submit() appends the score to an on-disk queue (one JSON object per line) and
+    returns at once. The thread sends queued scores in batches of up to batch_size
+    over pooled keep-alive connections and drops them from the queue when the
+    service acknowledges them, so scores made while it is unreachable, even
+    across restarts, go out once it is back. Failed requests are retried after an
+    exponential backoff with jitter, capped at max_backoff seconds. Each score has
+    a unique id, so a batch that is sent twice is only counted once. A batch the
+    service refuses as a whole (a 4xx reply) is split in halves and resent, so
+    only the scores it refuses on their own are dropped.
+
+    The thread also fetches the top scores every `refresh` seconds (and when asked
+    to by refresh()); top() only reads that cache, so drawing never waits for the
+    network.
+    """
+
+    def __init__(self, url, queue_path, cabinet=None, top_n=10, batch_size=50, refresh=30.0,
+                 timeout=2.0, backoff=0.5, max_backoff=60.0):
+        import threading
+        from urllib.parse import urlsplit
+        address = urlsplit(url)
+        if address.scheme != 'http' or not address.hostname:
+            raise ValueError(f"leaderboard URL must be http://host:port, not {url!r}")
+        self.pool = ConnectionPool(address.hostname, address.port or 80, timeout)
+        self.base = address.path.rstrip('/')
+        self.queue_path = Path(queue_path)
+        if cabinet is None:
+            import platform
+            cabinet = platform.node() or 'cabinet'
+        self.cabinet = cabinet
+        self.top_n = top_n
+        self.batch_size = batch_size
+        self.interval = refresh
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.lock = threading.Lock()
+        self.pending = []
+        self.cached = None
+        self.etag = None
+        self.failures = 0
+        self.error = None
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._submitted = {}
+
+        # Statistics
+        self.sent = 0
+        self.batches = 0
+        self.fetches = 0
+        self.latencies = []     # seconds from submit() to acknowledgement, for this session's scores
+
+    def start(self):
+        """Load scores still queued from earlier sessions and start the thread."""
+        import json
+        import threading
+        try:
+            with open(self.queue_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self.pending.append(json.loads(line))
+                    except ValueError:
+                        # A line cut short when the game was killed mid-write
+                        pass
+        except OSError:
+            pass
+        self._thread = threading.Thread(target=self._worker, name="leaderboard", daemon=True)
+        self._thread.start()
+
+    def submit(self, name, score, replay=None):
+        """Queue a score (replay is Replay.to_bytes()) to be sent as soon as possible."""
+        import base64
+        import json
+        entry = {'id': f"{self.cabinet}-{time.time_ns():x}-{random.getrandbits(32):08x}",
+                 'name': name, 'score': score, 'time': int(time.time())}
+        if replay is not None:
+            entry['replay'] = base64.b64encode(replay).decode('ascii')
+        with self.lock:
+            self.pending.append(entry)
+            self._submitted[entry['id']] = time.perf_counter()
+            try:
+                with open(self.queue_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry) + '\n')
+            except OSError as e:
+                print(f"Could not queue score: {e}")
+        self._wake.set()
+
+    def refresh(self):
+        """Ask the thread for fresh top scores now (the high score screen is shown)."""
+        self._wake.set()
+
+    def top(self):
+        """The latest top scores fetched, or None before the first fetch succeeds."""
+        return self.cached
+
+    def queued(self):
+        return len(self.pending)
+
+    def _worker(self):
+        next_fetch = 0.0
+        while not self._stopping.is_set():
+            woken = self._wake.is_set()
+            self._wake.clear()
+            try:
+                while self.pending and not self._stopping.is_set():
+                    if not self.send_batch():
+                        # Nothing in the batch was settled; try again at the next refresh
+                        break
+                if woken or time.monotonic() >= next_fetch:
+                    self.fetch_top()
+                    next_fetch = time.monotonic() + self.interval
+                self.failures = 0
+                self.error = None
+            except (OSError, ValueError, self.pool.http.HTTPException) as e:
+                self.failures += 1
+                self.error = str(e) or type(e).__name__
+                delay = min(self.max_backoff, self.backoff * 2 ** (self.failures - 1))
+                # New scores do not cut the wait short: they are on disk already
+                self._stopping.wait(delay * random.uniform(0.5, 1.0))
+                continue
+            self._wake.wait(max(0.0, next_fetch - time.monotonic()))
+
+    def send_batch(self, batch=None):
+        """Send a batch of scores, by default the oldest queued. Returns how many of them
+        the service settled."""
+        import json
+        if batch is None:
+            with self.lock:
+                batch = self.pending[:self.batch_size]
+        ids = {e['id'] for e in batch}
+        body = json.dumps({'cabinet': self.cabinet, 'scores': batch}).encode()
+        status, _, data = self.pool.request('POST', self.base + '/scores', body)
+        if 400 <= status < 500:
+            if len(batch) > 1:
+                # Refused as a whole: send each half on its own so that one bad score
+                # only costs itself
+                half = len(batch) // 2
+                return self.send_batch(batch[:half]) + self.send_batch(batch[half:])
+            # Sending the same score again cannot help
+            print(f"Leaderboard refused score {batch[0]['id']} ({status}), dropping it")
+            done = ids
+        elif status != 200:
+            raise ValueError(f"leaderboard replied {status}")
+        else:
+            reply = json.loads(data)
+            if (not isinstance(reply, dict) or not isinstance(reply.get('ack'), list)
+                    or not isinstance(reply.get('rejected'), dict)):
+                raise ValueError("leaderboard reply has no ack and rejected lists")
+            done = ids & (set(map(str, reply['ack'])) | set(reply['rejected']))
+            for score_id, reason in reply['rejected'].items():
+                if score_id in done:
+                    print(f"Leaderboard rejected score {score_id}: {reason}")
+        if not done:
+            return 0
+        now = time.perf_counter()
+        with self.lock:
+            self.pending = [e for e in self.pending if e['id'] not in done]
+            for score_id in done:
+                submitted = self._submitted.pop(score_id, None)
+                if submitted is not None:
+                    self.latencies.append(now - submitted)
+            self.rewrite_queue()
+        self.sent += len(done)
+        self.batches += 1
+        # Anything sent may have changed the top scores
+        self._wake.set()
+        return len(done)
+
+    def rewrite_queue(self):
+        """Replace the queue file with what is still pending. Call with the lock held."""
+        import json
+        try:
+            if not self.pending:
+                self.queue_path.unlink(missing_ok=True)
+                return
+            temp = self.queue_path.with_suffix('.tmp')
+            with open(temp, 'w', encoding='utf-8') as f:
+                f.writelines(json.dumps(e) + '\n' for e in self.pending)
+            os.replace(temp, self.queue_path)
+        except OSError as e:
+            print(f"Could not update the score queue: {e}")
+
+    def fetch_top(self):
+        import json
+        headers = {'If-None-Match': self.etag} if self.etag else None
+        status, reply_headers, data = self.pool.request('GET', f"{self.base}/top?n={self.top_n}",
+                                                        headers=headers)
+        self.fetches += 1
+        if status == 304:
+            return
+        if status != 200:
+            raise ValueError(f"leaderboard replied {status}")
+        reply = json.loads(data)
+        if not isinstance(reply, dict) or not isinstance(reply.get('scores'), list):
+            raise ValueError("leaderboard reply has no scores list")
+        self.cached = reply['scores']
+        self.etag = reply_headers.get('ETag')
+
+    def status_text(self):
+        """One line for the high score screen: fleet scores, or why they may be stale."""
+        queued = len(self.pending)
+        if self.error:
+            text = "Leaderboard offline"
+            return text + (f", {queued} score{'s' * (queued != 1)} waiting" if queued else "")
+        if queued:
+            return f"Sending {queued} score{'s' * (queued != 1)}..."
+        return "Fleet leaderboard" if self.cached is not None else "Connecting to leaderboard..."
+
+    def close(self):
+        """Stop the thread. Scores not yet sent stay queued on disk for next time."""
+        if self._thread is not None:
+            self._stopping.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        self.pool.close()
+
+
+class TimerWheel:
+    """Central tick scheduler: events are registered for a tick and handed back when it comes.
+
+    Buckets are hashed by tick, so advancing costs one dict lookup plus the events
+    that fire, however many entities or timers are waiting. Unlike a fixed ring of
+    slots any delay fits without extra rounds, and copying one (Autopilot clones
+    every search node) only touches the ticks that have something pending.
+    Events are cancelled lazily: whoever handles one checks it is still current.
+    """
+
+    def __init__(self):
+        self.now = -1   # tick being stepped, or the last one stepped between ticks
+        self.buckets = {}
+
+    def __len__(self):
+        return sum(map(len, self.buckets.values()))
+
+    def schedule(self, tick, event):
+        bucket = self.buckets.get(tick)
+        if bucket is None:
+            self.buckets[tick] = [event]
+        else:
+            bucket.append(event)
+
+    def advance(self, tick):
+        """Move the clock to tick and return the events due on it (in scheduling order)."""
+        self.now = tick
+        return self.buckets.pop(tick, ())
+
+    def clear(self):
+        self.buckets.clear()
+
+    def copy(self):
+        other = TimerWheel()
+        other.now = self.now
+        other.buckets = {tick: bucket[:] for tick, bucket in self.buckets.items()}
+        return other
+
+
 class Pacman:
-    def __init__(self, start_x, start_y, color):
+    def __init__(self, start_x, start_y, color, timers=None):
         self.start_x = start_x
         self.start_y = start_y
         self.color = color
         self.speed = 4  # Pixels per frame
+        self.timers = timers if timers is not None else TimerWheel()
+        self.mouth_event = (TIMER_MOUTH, 0)
         self.reset()
 
     def reset(self):
@@ -336,9 +1382,26 @@ class Pacman:
         self.moving = False
         # Buffered input
         self.input_dir = (0, 0)
-        # Animation
+        # Animation: the mouth toggles on the tick in mouth_due
         self.mouth_open = True
-        self.anim_timer = 0
+        self.mouth_due = self.timers.now + MOUTH_INTERVAL
+        self.timers.schedule(self.mouth_due, self.mouth_event)
+
+    @property
+    def anim_timer(self):
+        """Frames since the mouth last toggled, as the old per-frame counter had it."""
+        return MOUTH_INTERVAL + self.timers.now - self.mouth_due
+
+    @anim_timer.setter
+    def anim_timer(self, value):
+        self.mouth_due = MOUTH_INTERVAL + self.timers.now - value
+
+    def toggle_mouth(self, tick):
+        """TIMER_MOUTH handler."""
+        if self.mouth_due == tick:
+            self.mouth_open = not self.mouth_open
+            self.mouth_due = tick + MOUTH_INTERVAL
+            self.timers.schedule(self.mouth_due, self.mouth_event)
 
     def request_direction(self, dx, dy):
         """Player requests a direction."""
@@ -356,33 +1419,45 @@ class Pacman:
         cell = maze[ty][tx]
         return cell != 1 and cell != 4
 
+    def start_move(self, maze, direction):
+        """Set off from the current tile toward direction if it is open. Returns whether he did."""
+        dx, dy = direction
+        # Calculate next tile
+        next_tx = self.tile_x + dx
+        next_ty = self.tile_y + dy
+
+        # Handle tunnel wrap
+        if next_tx < 0:
+            next_tx = MAZE_WIDTH - 1
+        elif next_tx >= MAZE_WIDTH:
+            next_tx = 0
+
+        # Check if we can move there
+        if not self.is_walkable(maze, next_tx, next_ty):
+            return False
+        self.target_x = next_tx
+        self.target_y = next_ty
+        self.face_dir = direction
+        self.moving = True
+        return True
+
     def update(self, maze):
-        # Animation
-        self.anim_timer += 1
-        if self.anim_timer >= 5:
-            self.anim_timer = 0
-            self.mouth_open = not self.mouth_open
+        # Reversing needs no junction, so turn back toward the tile we came from at once
+        if self.moving and self.input_dir[0] == -self.face_dir[0] and self.input_dir[1] == -self.face_dir[1]:
+            self.target_x = self.tile_x
+            self.target_y = self.tile_y
+            self.face_dir = self.input_dir
 
         # If not moving, check for input and start moving
         if not self.moving:
             dx, dy = self.input_dir
-            if dx != 0 or dy != 0:
-                # Calculate next tile
-                next_tx = self.tile_x + dx
-                next_ty = self.tile_y + dy
-
-                # Handle tunnel wrap
-                if next_tx < 0:
-                    next_tx = MAZE_WIDTH - 1
-                elif next_tx >= MAZE_WIDTH:
-                    next_tx = 0
-
-                # Check if we can move there
-                if self.is_walkable(maze, next_tx, next_ty):
-                    self.target_x = next_tx
-                    self.target_y = next_ty
-                    self.face_dir = (dx, dy)
-                    self.moving = True
+            if (dx != 0 or dy != 0) and not self.start_move(maze, self.input_dir):
+                # A turn that does not fit here stays buffered while he carries on ahead,
+                # and is taken at the first tile where it does. A blocked reverse is not
+                # a turn: carrying on would only turn him back on the next tick.
+                fx, fy = self.face_dir
+                if (fx != 0 or fy != 0) and (fx != -dx or fy != -dy):
+                    self.start_move(maze, self.face_dir)
 
         # If moving, interpolate toward target
         if self.moving:
@@ -424,7 +1499,8 @@ class Pacman:
                 elif diff_y < 0:
                     self.y -= self.speed
 
-    def draw(self, surface):
+    def draw(self, surface, scale=1):
+        """Draw Pacman; scale is output pixels per game pixel."""
         dx, dy = self.face_dir if self.face_dir != (0, 0) else self.input_dir
 
         if dx == 1:
@@ -439,9 +1515,21 @@ class Pacman:
             angle = 0
 
         mouth = 45 if self.mouth_open else 10
-        radius = TILE_SIZE // 3
+        key = (self.color, angle, mouth, scale)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            sprite = self.sprites[key] = self.make_sprite(self.color, angle, mouth, scale)
+        surface.blit(sprite, (int(self.x * scale) - sprite.get_width() // 2,
+                              int(self.y * scale) - sprite.get_height() // 2))
+
+    # Drawn sprites by (color, angle, mouth, scale); there are only eight per color and scale
+    sprites = {}
+
+    @staticmethod
+    def make_sprite(color, angle, mouth, scale=1):
+        radius = int(TILE_SIZE * scale) // 3
 
-        size = radius * 2 + 4
+        size = radius * 2 + round(4 * scale)
         surf = pygame.Surface((size, size), pygame.SRCALPHA)
         c = size // 2
 
@@ -454,26 +1542,29 @@ class Pacman:
         points.append((c, c))
 
         if len(points) > 2:
-            pygame.draw.polygon(surf, self.color, points)
+            pygame.draw.polygon(surf, color, points)
 
-        rotated = pygame.transform.rotate(surf, angle)
-        rect = rotated.get_rect(center=(int(self.x), int(self.y)))
-        surface.blit(rotated, rect)
+        return pygame.transform.rotate(surf, angle)
 
     def get_tile(self):
         """Get current tile position."""
-        return (self.tile_x, self.tile_y)
+        return TILES[self.tile_y][self.tile_x]
 
 
 class Ghost:
-    def __init__(self, start_x, start_y, color, name, behavior, exit_delay):
+    def __init__(self, start_x, start_y, color, name, behavior, exit_delay, rng=random, timers=None, index=0):
         self.start_x = start_x
         self.start_y = start_y
         self.color = color
         self.name = name
         self.behavior = behavior
         self.exit_delay = exit_delay
+        self.rng = rng
+        self.timers = timers if timers is not None else TimerWheel()
+        self.vulnerable_event = (TIMER_VULNERABLE, index)
+        self.house_event = (TIMER_HOUSE, index)
         self.speed = 2
+        self.exits = ghost_exits(MAZE_LAYOUT)
         self.reset()
 
     def reset(self):
@@ -482,16 +1573,57 @@ class Ghost:
         self.dir_x = 0
         self.dir_y = 0
         self.vulnerable = False
-        self.vulnerable_timer = 0
+        self.vulnerable_end = self.timers.now
         self.eaten = False
-        self.in_house = True
-        self.house_timer = 0
         self.last_tile = None
+        self.enter_house(self.exit_delay)
+
+    # The timers are kept as the tick on which they run out; these give the
+    # old per-frame counters between ticks, for drawing and saved games
+    @property
+    def vulnerable_timer(self):
+        return self.vulnerable_end - self.timers.now if self.vulnerable else 0
+
+    @vulnerable_timer.setter
+    def vulnerable_timer(self, value):
+        self.vulnerable_end = self.timers.now + value
+
+    @property
+    def house_timer(self):
+        return self.exit_delay + self.timers.now - self.house_exit if self.in_house else self.exit_delay
+
+    @house_timer.setter
+    def house_timer(self, value):
+        self.house_exit = self.exit_delay + self.timers.now - value
+
+    def enter_house(self, wait):
+        """Wait in the ghost house for wait more frames (at least one) before leaving."""
+        self.in_house = True
+        self.house_exit = self.timers.now + max(1, wait)
+        self.timers.schedule(self.house_exit, self.house_event)
 
     def make_vulnerable(self, duration):
         if not self.eaten:
             self.vulnerable = True
-            self.vulnerable_timer = duration
+            # Runs out during the duration-th update, counting this tick's
+            self.vulnerable_end = self.timers.now + duration - 1
+            self.timers.schedule(self.vulnerable_end, self.vulnerable_event)
+
+    def end_vulnerable(self, tick):
+        """TIMER_VULNERABLE handler."""
+        if self.vulnerable and self.vulnerable_end == tick:
+            self.vulnerable = False
+
+    def leave_house(self, tick):
+        """TIMER_HOUSE handler."""
+        if self.in_house and self.house_exit == tick:
+            self.in_house = False
+            # Exit to position above ghost house
+            self.x = 13 * TILE_SIZE + TILE_SIZE // 2
+            self.y = 11 * TILE_SIZE + TILE_SIZE // 2
+            self.dir_x = -1
+            self.dir_y = 0
+            self.last_tile = (13, 11)
 
     def is_tile_walkable(self, maze, tile_x, tile_y, allow_door=False):
         """Check if a tile can be walked on by ghost."""
@@ -508,61 +1640,28 @@ class Ghost:
         return True
 
     def get_valid_directions(self, maze, tile_x, tile_y, allow_door=False):
-        """Get list of valid movement directions from current tile."""
-        directions = []
-        for dx, dy in [(0, -1), (0, 1), (-1, 0), (1, 0)]:
-            # Don't reverse direction (unless stuck)
-            if (dx, dy) == (-self.dir_x, -self.dir_y) and (self.dir_x != 0 or self.dir_y != 0):
-                continue
-
-            next_x = tile_x + dx
-            next_y = tile_y + dy
-
-            # Handle tunnel wrap
-            if next_x < 0:
-                next_x = MAZE_WIDTH - 1
-            elif next_x >= MAZE_WIDTH:
-                next_x = 0
-
-            if self.is_tile_walkable(maze, next_x, next_y, allow_door):
-                directions.append((dx, dy))
-
-        return directions
+        """Get valid movement directions from current tile, never straight back (a shared tuple)."""
+        return self.exits[allow_door][tile_y][tile_x][(self.dir_y + 1) * 3 + self.dir_x + 1]
 
     def choose_direction(self, directions, target_x, target_y, tile_x, tile_y, flee=False):
-        """Choose best direction toward or away from target."""
+        """Choose best direction toward or away from target. Ties go to the earliest direction."""
         if not directions:
             return (0, 0)
 
-        if flee:
-            # Move away from target
-            return max(directions, key=lambda d:
-                ((tile_x + d[0]) * TILE_SIZE - target_x)**2 +
-                ((tile_y + d[1]) * TILE_SIZE - target_y)**2)
-        else:
-            # Move toward target
-            return min(directions, key=lambda d:
-                ((tile_x + d[0]) * TILE_SIZE - target_x)**2 +
-                ((tile_y + d[1]) * TILE_SIZE - target_y)**2)
+        best = None
+        best_dist = 0
+        for d in directions:
+            ox = (tile_x + d[0]) * TILE_SIZE - target_x
+            oy = (tile_y + d[1]) * TILE_SIZE - target_y
+            dist = ox * ox + oy * oy
+            if best is None or (dist > best_dist if flee else dist < best_dist):
+                best = d
+                best_dist = dist
+        return best
 
     def update(self, maze, pacman_x, pacman_y):
-        # Update vulnerability timer
-        if self.vulnerable:
-            self.vulnerable_timer -= 1
-            if self.vulnerable_timer <= 0:
-                self.vulnerable = False
-
-        # Handle ghost house
+        # Waiting in the ghost house until the Simulation's timers let us out
         if self.in_house:
-            self.house_timer += 1
-            if self.house_timer >= self.exit_delay:
-                self.in_house = False
-                # Exit to position above ghost house
-                self.x = 13 * TILE_SIZE + TILE_SIZE // 2
-                self.y = 11 * TILE_SIZE + TILE_SIZE // 2
-                self.dir_x = -1
-                self.dir_y = 0
-                self.last_tile = (13, 11)
             return
 
         # Get current tile position
@@ -580,7 +1679,7 @@ class Ghost:
 
         # Check if at tile center
         at_center = abs(self.x - center_x) <= speed and abs(self.y - center_y) <= speed
-        current_tile = (tile_x, tile_y)
+        current_tile = TILES[tile_y][tile_x]
 
         # Make decisions only at tile centers, and only once per tile
         if at_center and current_tile != self.last_tile:
@@ -596,8 +1695,7 @@ class Ghost:
 
                 if tile_x == 13 and tile_y == 14:
                     self.eaten = False
-                    self.in_house = True
-                    self.house_timer = self.exit_delay // 2
+                    self.enter_house(self.exit_delay - self.exit_delay // 2)
                     self.x = self.start_x * TILE_SIZE + TILE_SIZE // 2
                     self.y = self.start_y * TILE_SIZE + TILE_SIZE // 2
                     self.dir_x = 0
@@ -607,7 +1705,7 @@ class Ghost:
 
                 directions = self.get_valid_directions(maze, tile_x, tile_y, allow_door=True)
                 if not directions:
-                    directions = [(-self.dir_x, -self.dir_y)]
+                    directions = GHOST_REVERSE[(self.dir_y + 1) * 3 + self.dir_x + 1]
                 self.dir_x, self.dir_y = self.choose_direction(directions, target_x, target_y, tile_x, tile_y)
 
             else:
@@ -616,7 +1714,7 @@ class Ghost:
 
                 if not directions:
                     # Must reverse if stuck
-                    directions = [(-self.dir_x, -self.dir_y)]
+                    directions = GHOST_REVERSE[(self.dir_y + 1) * 3 + self.dir_x + 1]
 
                 if self.vulnerable:
                     # Run away from Pacman
@@ -626,13 +1724,13 @@ class Ghost:
                     self.dir_x, self.dir_y = self.choose_direction(directions, pacman_x, pacman_y, tile_x, tile_y)
                 elif self.behavior == 'random':
                     # Random movement
-                    self.dir_x, self.dir_y = random.choice(directions)
+                    self.dir_x, self.dir_y = self.rng.choice(directions)
                 else:
                     # Mix of chase and random
-                    if random.random() < 0.7:
+                    if self.rng.random() < 0.7:
                         self.dir_x, self.dir_y = self.choose_direction(directions, pacman_x, pacman_y, tile_x, tile_y)
                     else:
-                        self.dir_x, self.dir_y = random.choice(directions)
+                        self.dir_x, self.dir_y = self.rng.choice(directions)
 
         # Move only if we have a valid direction
         if self.dir_x != 0 or self.dir_y != 0:
@@ -647,87 +1745,93 @@ class Ghost:
             self.x = TILE_SIZE // 2
             self.last_tile = None
 
-    def draw(self, surface):
-        x, y = int(self.x), int(self.y)
-
+    def draw(self, surface, scale=1):
+        """Draw the ghost; scale is output pixels per game pixel."""
         if self.eaten:
-            pygame.draw.circle(surface, WHITE, (x - 3, y), 3)
-            pygame.draw.circle(surface, WHITE, (x + 3, y), 3)
-            pygame.draw.circle(surface, BLACK, (x - 2, y), 1)
-            pygame.draw.circle(surface, BLACK, (x + 4, y), 1)
-            return
-
-        if self.vulnerable:
+            key = (None, None, scale)   # just the eyes
+        elif self.vulnerable:
             color = GHOST_FLASH if (self.vulnerable_timer < 120 and (self.vulnerable_timer // 15) % 2 == 0) else GHOST_VULNERABLE
+            key = (color, None, scale)
         else:
-            color = self.color
-
-        size = TILE_SIZE // 3
-        pygame.draw.circle(surface, color, (x, y - 2), size)
-        pygame.draw.rect(surface, color, (x - size, y - 2, size * 2, size))
+            key = (self.color, (self.dir_x, self.dir_y), scale)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            # All at once, so the cache stops growing after the first frame at a scale
+            looks = [(self.color, direction) for direction in ((0, 0),) + GHOST_DIRECTIONS]
+            looks += [(GHOST_VULNERABLE, None), (GHOST_FLASH, None), (None, None)]
+            for color, look in looks:
+                self.sprites[(color, look, scale)] = self.make_sprite(color, look, scale)
+            sprite = self.sprites[key]
+        half = sprite.get_width() // 2
+        surface.blit(sprite, (int(self.x * scale) - half, int(self.y * scale) - half))
+
+    # Drawn sprites by (color, direction looked in, scale); color None is an eaten ghost's eyes
+    sprites = {}
+
+    @staticmethod
+    def make_sprite(color, look, scale=1):
+        def px(v):
+            return round(v * scale)
+
+        x = y = int(TILE_SIZE * scale) // 2 + 2
+        surface = pygame.Surface((x * 2, y * 2), pygame.SRCALPHA)
+        dot = max(1, px(1))
+        if color is None:
+            pygame.draw.circle(surface, WHITE, (x - px(3), y), px(3))
+            pygame.draw.circle(surface, WHITE, (x + px(3), y), px(3))
+            pygame.draw.circle(surface, BLACK, (x - px(2), y), dot)
+            pygame.draw.circle(surface, BLACK, (x + px(4), y), dot)
+            return surface
+
+        size = int(TILE_SIZE * scale) // 3
+        pygame.draw.circle(surface, color, (x, y - px(2)), size)
+        pygame.draw.rect(surface, color, (x - size, y - px(2), size * 2, size))
         for i in range(3):
             wx = x - size + i * (size * 2 // 3) + size // 3
-            pygame.draw.circle(surface, color, (wx, y + size - 3), size // 3 + 1)
+            pygame.draw.circle(surface, color, (wx, y + size - px(3)), size // 3 + px(1))
 
-        pygame.draw.circle(surface, WHITE, (x - 3, y - 3), 3)
-        pygame.draw.circle(surface, WHITE, (x + 3, y - 3), 3)
-        if not self.vulnerable:
-            pygame.draw.circle(surface, BLUE, (x - 3 + self.dir_x, y - 3 + self.dir_y), 1)
-            pygame.draw.circle(surface, BLUE, (x + 3 + self.dir_x, y - 3 + self.dir_y), 1)
+        pygame.draw.circle(surface, WHITE, (x - px(3), y - px(3)), px(3))
+        pygame.draw.circle(surface, WHITE, (x + px(3), y - px(3)), px(3))
+        if look:
+            dx, dy = look
+            pygame.draw.circle(surface, BLUE, (x - px(3) + dx * dot, y - px(3) + dy * dot), dot)
+            pygame.draw.circle(surface, BLUE, (x + px(3) + dx * dot, y - px(3) + dy * dot), dot)
+        return surface
 
 
-class Game:
-    def __init__(self):
-        self.game_surface = pygame.Surface((GAME_WIDTH, GAME_HEIGHT))
-        self.fullscreen = False
-        self.screen = pygame.display.set_mode((GAME_WIDTH, GAME_HEIGHT), pygame.RESIZABLE)
-        pygame.display.set_caption("Pacman")
-        self.clock = pygame.time.Clock()
-        self.font = pygame.font.Font(None, 36)
-        self.small_font = pygame.font.Font(None, 24)
-        self.high_score_manager = HighScoreManager()
-
-        # Initialize update checker and start background check
-        self.update_checker = UpdateChecker()
-        self.update_checker.start_check()
+class Simulation:
+    """Game rules and entities for one game, independent of input and display."""
 
-        self.state = 'checking_updates'
-        self.pacman_color_name = 'yellow'
-        self.pacman_color = PACMAN_COLORS['yellow']
-        self.color_options = list(PACMAN_COLORS.keys())
-        self.selected_color_index = 0
-        self.player_name = ""
+    def __init__(self, pacman_color=PACMAN_COLORS['yellow'], seed=None):
+        self.pacman_color = pacman_color
+        self.rng = random.Random(seed)
+        self.reset()
 
-        self.reset_game()
+    def reset(self):
+        self.maze = MAZE_CELLS
+        self.reload_pellets()
 
-    def reset_game(self):
-        self.maze = []
-        self.pellets = set()
-        self.power_pellets = set()
-
-        for y, row in enumerate(MAZE_LAYOUT):
-            maze_row = []
-            for x, char in enumerate(row):
-                maze_row.append(int(char))
-                if char == '2':
-                    self.pellets.add((x, y))
-                elif char == '3':
-                    self.power_pellets.add((x, y))
-            self.maze.append(maze_row)
+        # Every timed event in the game (mouth animation, vulnerability, leaving the house)
+        self.timers = TimerWheel()
 
         # Start Pacman at a good position
-        self.pacman = Pacman(1, 1, self.pacman_color)
+        self.pacman = Pacman(1, 1, self.pacman_color, self.timers)
 
         self.ghosts = [
-            Ghost(12, 14, GHOST_COLORS['blinky'], 'blinky', 'chase', 1),
-            Ghost(13, 14, GHOST_COLORS['pinky'], 'pinky', 'ambush', 60),
-            Ghost(14, 14, GHOST_COLORS['inky'], 'inky', 'random', 120),
-            Ghost(15, 14, GHOST_COLORS['clyde'], 'clyde', 'random', 180),
+            Ghost(12, 14, GHOST_COLORS['blinky'], 'blinky', 'chase', 1, self.rng, self.timers, 0),
+            Ghost(13, 14, GHOST_COLORS['pinky'], 'pinky', 'ambush', 60, self.rng, self.timers, 1),
+            Ghost(14, 14, GHOST_COLORS['inky'], 'inky', 'random', 120, self.rng, self.timers, 2),
+            Ghost(15, 14, GHOST_COLORS['clyde'], 'clyde', 'random', 180, self.rng, self.timers, 3),
         ]
 
         self.score = 0
         self.lives = 3
         self.ghost_eat_streak = 0
+        self.game_over = False
+        self.tick = 0
+        # What happened during the last step, as (kind, detail) pairs:
+        # ('pellet', tile), ('power', tile), ('ghost', name), ('death', tile), ('level', None)
+        self.events = []
 
     def reset_positions(self):
         self.pacman.reset()
@@ -735,21 +1839,1429 @@ class Game:
             g.reset()
 
     def reload_pellets(self):
-        self.pellets = set()
-        self.power_pellets = set()
-        for y, row in enumerate(MAZE_LAYOUT):
-            for x, char in enumerate(row):
-                if char == '2':
-                    self.pellets.add((x, y))
-                elif char == '3':
-                    self.power_pellets.add((x, y))
+        self.pellets = set(PELLET_TILES)
+        self.power_pellets = set(POWER_TILES)
+
+    def clone(self):
+        """Independent copy of the game state. The maze is never modified, so it is shared."""
+        other = copy.copy(self)
+        other.rng = random.Random()
+        other.rng.setstate(self.rng.getstate())
+        other.pellets = set(self.pellets)
+        other.power_pellets = set(self.power_pellets)
+        other.events = []
+        other.timers = self.timers.copy()
+        other.pacman = copy.copy(self.pacman)
+        other.pacman.timers = other.timers
+        other.ghosts = [copy.copy(g) for g in self.ghosts]
+        for g in other.ghosts:
+            g.rng = other.rng
+            g.timers = other.timers
+        return other
+
+    def snapshot(self):
+        """Read-only copy of what is drawn (pellets, entities, score, lives) for another
+        thread to draw while this game plays on. It has no random numbers or timers to
+        step with; treat it as immutable."""
+        other = copy.copy(self)
+        other.rng = None
+        other.events = ()
+        other.pellets = frozenset(self.pellets)
+        other.power_pellets = frozenset(self.power_pellets)
+        # Only the current tick, which drawing reads the timers against
+        other.timers = TimerWheel()
+        other.timers.now = self.timers.now
+        other.pacman = copy.copy(self.pacman)
+        other.pacman.timers = other.timers
+        other.ghosts = tuple(copy.copy(g) for g in self.ghosts)
+        for g in other.ghosts:
+            g.rng = None
+            g.timers = other.timers
+        return other
+
+    def schedule_timers(self):
+        """Rebuild the timer wheel from the entities' deadlines, after they were set directly."""
+        self.timers.clear()
+        self.timers.schedule(self.pacman.mouth_due, self.pacman.mouth_event)
+        for g in self.ghosts:
+            if g.vulnerable:
+                self.timers.schedule(g.vulnerable_end, g.vulnerable_event)
+            if g.in_house:
+                self.timers.schedule(g.house_exit, g.house_event)
+
+    def to_bytes(self):
+        """The whole game state as a fixed-size, versioned binary blob (SAVE_SIZE bytes)."""
+        p = self.pacman
+        fields = [*self.pacman_color,
+                  self.tick, self.score, self.lives, self.ghost_eat_streak, self.game_over,
+                  p.tile_x, p.tile_y, p.x, p.y, p.target_x, p.target_y, *p.face_dir,
+                  p.moving, *p.input_dir, p.mouth_open, p.anim_timer]
+        for g in self.ghosts:
+            fields += [g.x, g.y, g.dir_x, g.dir_y, g.vulnerable, g.eaten, g.in_house,
+                       g.vulnerable_timer, g.house_timer, *(g.last_tile or (-1, -1))]
+        fields.append(pack_bits(PELLET_TILES, self.pellets))
+        fields.append(pack_bits(POWER_TILES, self.power_pellets))
+        _, mt, gauss = self.rng.getstate()
+        fields += mt
+        fields += [gauss is not None, gauss or 0.0]
+        data = SAVE_HEADER.pack(SAVE_MAGIC, SAVE_VERSION) + SAVE_BODY.pack(*fields)
+        return data + SAVE_CRC.pack(zlib.crc32(data))
+
+    def restore(self, data):
+        """Load a blob from to_bytes() into this simulation. Raises ValueError if it is not valid."""
+        if len(data) != SAVE_SIZE:
+            raise ValueError(f"save is {len(data)} bytes, expected {SAVE_SIZE}")
+        magic, version = SAVE_HEADER.unpack_from(data)
+        if magic != SAVE_MAGIC or version != SAVE_VERSION:
+            raise ValueError(f"unsupported save format {magic!r} version {version}")
+        crc, = SAVE_CRC.unpack_from(data, SAVE_SIZE - SAVE_CRC.size)
+        if zlib.crc32(data[:-SAVE_CRC.size]) != crc:
+            raise ValueError("save is corrupt (checksum mismatch)")
+
+        f = SAVE_BODY.unpack_from(data, SAVE_HEADER.size)
+        self.pacman_color = f[0:3]
+        self.tick, self.score, self.lives, self.ghost_eat_streak = f[3:7]
+        # The saved timers count frames from here
+        self.timers.now = self.tick - 1
+        self.game_over = bool(f[7])
+        p = self.pacman
+        p.color = self.pacman_color
+        p.tile_x, p.tile_y, p.x, p.y, p.target_x, p.target_y = f[8:14]
+        p.face_dir = f[14:16]
+        p.moving = bool(f[16])
+        p.input_dir = f[17:19]
+        p.mouth_open = bool(f[19])
+        p.anim_timer = f[20]
+        i = 21
+        for g in self.ghosts:
+            g.x, g.y, g.dir_x, g.dir_y = f[i:i + 4]
+            g.vulnerable, g.eaten, g.in_house = bool(f[i + 4]), bool(f[i + 5]), bool(f[i + 6])
+            g.vulnerable_timer, g.house_timer = f[i + 7:i + 9]
+            g.last_tile = f[i + 9:i + 11] if f[i + 9] >= 0 else None
+            i += 11
+        self.pellets, _ = unpack_bits(PELLET_TILES, f[i])
+        self.power_pellets, _ = unpack_bits(POWER_TILES, f[i + 1])
+        mt = f[i + 2:i + 627]
+        self.rng.setstate((3, mt, f[i + 628] if f[i + 627] else None))
+        self.schedule_timers()
+        self.events.clear()
+
+    @classmethod
+    def from_bytes(cls, data):
+        sim = cls()
+        sim.restore(data)
+        return sim
+
+    def step(self, direction=None):
+        """Advance the game by one frame, steering Pacman first if a direction is given."""
+        self.events.clear()
+        if direction is not None:
+            self.pacman.request_direction(*direction)
+
+        # Timers that run out this tick act before anything moves, except leaving the
+        # ghost house, which happens once the ghosts have moved
+        now = self.tick
+        due = self.timers.advance(now)
+        for kind, i in due:
+            if kind == TIMER_MOUTH:
+                self.pacman.toggle_mouth(now)
+            elif kind == TIMER_VULNERABLE:
+                self.ghosts[i].end_vulnerable(now)
+
+        # Update Pacman
+        self.pacman.update(self.maze)
+
+        # Check pellet collection
+        tile = self.pacman.get_tile()
+        if tile in self.pellets:
+            self.pellets.remove(tile)
+            self.score += 10
+            self.events.append(('pellet', tile))
+        if tile in self.power_pellets:
+            self.power_pellets.remove(tile)
+            self.score += 50
+            self.events.append(('power', tile))
+            self.ghost_eat_streak = 0
+            for g in self.ghosts:
+                g.make_vulnerable(360)
+
+        # Update ghosts
+        for g in self.ghosts:
+            g.update(self.maze, self.pacman.x, self.pacman.y)
+        for kind, i in due:
+            if kind == TIMER_HOUSE:
+                self.ghosts[i].leave_house(now)
 
-    def toggle_fullscreen(self):
-        self.fullscreen = not self.fullscreen
+        # Check ghost collision
+        for g in self.ghosts:
+            if g.eaten or g.in_house:
+                continue
+            dx = self.pacman.x - g.x
+            dy = self.pacman.y - g.y
+            if dx * dx + dy * dy < TOUCH_DISTANCE_SQ:
+                if g.vulnerable:
+                    g.eaten = True
+                    self.ghost_eat_streak += 1
+                    self.score += 200 * (2 ** (self.ghost_eat_streak - 1))
+                    self.events.append(('ghost', g.name))
+                else:
+                    self.events.append(('death', self.pacman.get_tile()))
+                    self.lives -= 1
+                    if self.lives <= 0:
+                        self.game_over = True
+                    else:
+                        self.reset_positions()
+                    break
+
+        # Level complete
+        if not self.pellets and not self.power_pellets:
+            self.reload_pellets()
+            self.reset_positions()
+            self.events.append(('level', None))
+
+        self.tick += 1
+
+    def draw_maze(self, surface, ticks=None, scale=1):
+        """Draw walls and pellets. ticks drives the power pellet pulse (default: wall clock),
+        scale is output pixels per game pixel."""
+        surface.blit(wall_layer(MAZE_LAYOUT, scale), (0, 0))
+
+        centre = TILE_SIZE // 2
+        radius = round(3 * scale)
+        for x, y in self.pellets:
+            pygame.draw.circle(surface, PELLET_COLOR,
+                (round((x * TILE_SIZE + centre) * scale), round((y * TILE_SIZE + centre) * scale)), radius)
+
+        if ticks is None:
+            # Any millisecond clock will do; pygame's only runs once its timer is initialised
+            ticks = int(time.monotonic() * 1000)
+        radius = round((6 + abs((ticks // 100) % 10 - 5)) * scale)
+        for x, y in self.power_pellets:
+            pygame.draw.circle(surface, POWER_PELLET_COLOR,
+                (round((x * TILE_SIZE + centre) * scale), round((y * TILE_SIZE + centre) * scale)), radius)
+
+    def draw(self, surface, ticks=None, scale=1):
+        """Draw the maze, Pacman and the ghosts, scale output pixels per game pixel."""
+        self.draw_maze(surface, ticks, scale)
+        self.pacman.draw(surface, scale)
+        for g in self.ghosts:
+            g.draw(surface, scale)
+
+
+class FastForward:
+    """Advances a Simulation between inputs by jumping from one event to the next.
+
+    Almost every tick of a headless run only slides Pacman and the ghosts a few
+    pixels along a corridor. FastForward plans each entity's path ahead and skips
+    to the next tick where something can happen:
+    - Pacman sets off through the tunnel (his straight runs, pellets included,
+      are planned whole);
+    - a ghost reaches a junction, the tunnel or the ghost house (the corridors in
+      between are planned whole from ghost_corridors);
+    - a timer other than the mouth (which is toggled arithmetically) runs out;
+    - Pacman reaches a power pellet or the last pellet;
+    - a ghost gets close enough to Pacman that they could touch.
+    A ghost or Pacman event updates only that entity, with its own update method.
+    The rest (timers, power pellets, the last pellet and near misses) are played
+    with Simulation.step. Pellets along Pacman's runs and the random draws ghosts
+    make in corridors are applied when needed, in tick and ghost order. The game
+    ends up in exactly the state that stepping it tick by tick with no direction
+    gives, random number generator included.
+
+    The gain is bounded by how often something happens. The maze has a junction
+    every few tiles, so with four ghosts out an event comes about every 7 ticks,
+    and planning one costs several times a plain Simulation.step. Headless games
+    run about 2.2x as fast as stepping when key presses are rarer than one a
+    second, falling to about 1.25x with one every 20 ticks, since every run()
+    call brings the whole game up to date. Skipping further would mean planning
+    ghost decisions across junctions, which depend on Pacman's position and the
+    random number generator at the tick they are made.
+    """
+
+    def __init__(self, sim):
+        self.sim = sim
+        self.tick = None
+        self.corridors = ghost_corridors(MAZE_LAYOUT)
+        # What happened during the last run(): (tick, kind, detail) like Simulation.events,
+        # and (tick, score, lives) after every tick that changed the score or lives.
+        # Ticks are the simulation's tick after the step, as in replay checkpoints.
+        self.events = []
+        self.changes = []
+
+    def sync(self):
+        """Start again from the simulation's state. run() does this when the tick has changed;
+        call it after changing the simulation some other way (restore, say)."""
+        sim = self.sim
+        t = self.tick = sim.tick
+        self.predict_pacman(t)
+        count = len(sim.ghosts)
+        self.ghost_t0 = [t] * count
+        self.ghost_bx = [0] * count
+        self.ghost_by = [0] * count
+        self.ghost_vx = [0] * count
+        self.ghost_vy = [0] * count
+        self.ghost_speed = [0] * count
+        self.ghost_path = [()] * count
+        self.ghost_first = [NEVER] * count
+        self.ghost_period = [1] * count
+        self.ghost_draw = [0] * count
+        self.ghost_drawn = [0] * count
+        self.ghost_next = [NEVER] * count
+        self.draw_next = NEVER
+        for i in range(count):
+            self.predict_ghost(i, t)
+        self.scan_timers()
+        # Ticks before which each ghost cannot touch Pacman, and the earliest of them
+        self.ghost_safe = [t] * count
+        self.safe = t
+        self.safe_still = False
+
+    def run(self, until, direction=None):
+        """Advance to tick until, or stop early when the game ends. Returns the events.
+
+        A direction steers Pacman on the first tick, as Simulation.step(direction) does.
+        """
+        sim = self.sim
+        if self.tick != sim.tick:
+            self.sync()
+        self.events = []
+        self.changes = []
+        if direction is not None and self.tick < until:
+            # Only Pacman's plan depends on his input
+            t = self.tick
+            self.eat_until(t)
+            self.place_pacman(t)
+            if self.safe_still:
+                self.reset_safe(t)   # horizons that counted on him standing still
+            sim.pacman.request_direction(*direction)
+            self.predict_pacman(t)
+        while self.tick < until and not sim.game_over:
+            t = self.tick
+            if self.safe <= t:
+                self.safe = self.collision_horizon(t)
+                if self.safe <= t:
+                    self.step_exact(t, until)
+                    continue
+            nxt = min(self.pacman_next, min(self.ghost_next), self.timer_next, until)
+            if nxt >= self.safe:
+                self.tick = self.safe
+            elif nxt == until:
+                self.tick = until
+            elif nxt == self.timer_next or (nxt == self.pacman_next and self.pacman_hard):
+                self.step_exact(nxt)
+            else:
+                self.step_events(nxt)
+        self.materialize(self.tick)
+        return self.events
+
+    def materialize(self, t):
+        """Bring the whole simulation to the start of tick t."""
+        sim = self.sim
+        self.eat_until(t)
+        self.draw_until(t, 0)
+        self.place_pacman(t)
+        for i in range(len(sim.ghosts)):
+            self.place_ghost(i, t)
+        p = sim.pacman
+        timers = sim.timers
+        if p.mouth_due < t:
+            toggles = (t - 1 - p.mouth_due) // MOUTH_INTERVAL + 1
+            if toggles & 1:
+                p.mouth_open = not p.mouth_open
+            p.mouth_due += toggles * MOUTH_INTERVAL
+            timers.schedule(p.mouth_due, p.mouth_event)
+            for tick in [tick for tick in timers.buckets if tick < t]:
+                del timers.buckets[tick]   # skipped mouth events
+        timers.now = t - 1
+        sim.tick = self.tick = t
+
+    def step_exact(self, t, until=None):
+        """Play tick t with Simulation.step. With until, carry on stepping while a ghost is
+        within a tile of touching Pacman, rather than planning again after every tick."""
+        sim = self.sim
+        self.materialize(t)
+        p = sim.pacman
+        while True:
+            score, lives = sim.score, sim.lives
+            sim.step()
+            for kind, detail in sim.events:
+                self.events.append((sim.tick, kind, detail))
+            if sim.score != score or sim.lives != lives:
+                self.changes.append((sim.tick, sim.score, sim.lives))
+            if until is None or sim.tick >= until or sim.game_over:
+                break
+            reach = TOUCH_REACH + TILE_SIZE
+            if not any(max(abs(p.x - g.x), abs(p.y - g.y)) < reach
+                       for g in sim.ghosts if not g.in_house and not g.eaten):
+                break
+        self.sync()
+
+    def step_events(self, t):
+        """Play tick t, where only Pacman and ghosts with an event due need updating."""
+        sim = self.sim
+        p = sim.pacman
+        if self.pacman_next == t:
+            self.eat_until(t)
+            self.place_pacman(t)
+            x = p.x
+            p.update(sim.maze)
+            tile = TILES[p.tile_y][p.tile_x]
+            if tile in sim.pellets:
+                # Never the last one, nor a power pellet: those ticks are stepped
+                sim.pellets.remove(tile)
+                sim.score += 10
+                self.events.append((t + 1, 'pellet', tile))
+                self.changes.append((t + 1, sim.score, sim.lives))
+            if abs(p.x - x) > p.speed:
+                self.reset_safe(t + 1)   # through the tunnel
+            self.predict_pacman(t + 1)
+            px, py = p.x, p.y
+        else:
+            px, py = self.pacman_at(t)
+        ghost_next = self.ghost_next
+        ghosts = sim.ghosts
+        for i in range(len(ghosts)):
+            if ghost_next[i] == t:
+                g = ghosts[i]
+                self.draw_until(t, i)
+                self.place_ghost(i, t)
+                x = g.x
+                sim.timers.now = t
+                g.update(sim.maze, px, py)
+                if g.in_house:
+                    self.scan_timers()   # back home, with a timer to leave again
+                elif abs(g.x - x) > TILE_SIZE // 2:
+                    self.ghost_safe[i] = t + 1   # through the tunnel
+                    self.safe = min(self.safe, t + 1)
+                self.predict_ghost(i, t + 1)
+        self.tick = t + 1
+
+    # Pacman's plan: from (bx, by) at the end of tick pacman_from he moves (vx, vy) a tick
+    # for pacman_steps ticks. On a straight run pacman_tiles are the tiles he passes, one
+    # every TILE_SIZE // speed ticks, and pacman_eats the (tick, tile) of pellets eaten.
+
+    def predict_pacman(self, t0):
+        """Plan Pacman's movement from his state at the start of tick t0."""
+        sim = self.sim
+        p = sim.pacman
+        self.pacman_from = t0 - 1
+        self.pacman_bx, self.pacman_by = p.x, p.y
+        self.pacman_vx = self.pacman_vy = 0
+        self.pacman_steps = NEVER
+        self.pacman_tiles = None
+        self.pacman_eats = ()
+        self.pacman_eaten = 0
+        self.pacman_next = NEVER
+        self.pacman_hard = False
+        pellets, power = sim.pellets, sim.power_pellets
+        tile = TILES[p.tile_y][p.tile_x]
+        if tile in pellets or tile in power:
+            self.pacman_next = t0
+            self.pacman_hard = True
+        elif not p.moving:
+            self.plan_run(t0)
+        elif p.input_dir[0] == -p.face_dir[0] and p.input_dir[1] == -p.face_dir[1]:
+            self.pacman_next = t0   # turns back toward the tile he is on
+        else:
+            # Between two tiles: moves straight on until he arrives
+            target_px = p.target_x * TILE_SIZE + TILE_SIZE // 2
+            target_py = p.target_y * TILE_SIZE + TILE_SIZE // 2
+            if p.target_x == 0 and p.tile_x == MAZE_WIDTH - 1:
+                target_px = GAME_WIDTH + TILE_SIZE // 2
+            elif p.target_x == MAZE_WIDTH - 1 and p.tile_x == 0:
+                target_px = -TILE_SIZE // 2
+            diff_x = target_px - p.x
+            diff_y = target_py - p.y
+            speed = p.speed
+            if abs(diff_x) <= speed and abs(diff_y) <= speed or (diff_x and diff_y):
+                self.pacman_next = t0
+            else:
+                # Arrives on the tick the distance left is within one move
+                self.pacman_next = t0 + (abs(diff_x + diff_y) - 1) // speed
+                self.pacman_vx = speed if diff_x > 0 else -speed if diff_x < 0 else 0
+                self.pacman_vy = speed if diff_y > 0 else -speed if diff_y < 0 else 0
+            target = TILES[p.target_y][p.target_x]
+            self.pacman_hard = target in power or (target in pellets and len(pellets) + len(power) == 1)
+
+    def plan_run(self, t0):
+        """Plan Pacman's straight run from a standstill on a tile at the start of tick t0."""
+        sim = self.sim
+        p = sim.pacman
+        x, y = p.tile_x, p.tile_y
+        tx, ty = p.input_dir
+        # Carries on ahead while a requested turn does not fit, as Pacman.update does
+        dx, dy = tx, ty
+        if (tx or ty) and not p.is_walkable(sim.maze, x + tx, y + ty) and p.face_dir != (-tx, -ty):
+            dx, dy = p.face_dir
+        turning = (dx, dy) != (tx, ty)
+        tiles = [TILES[y][x]]
+        eats = []
+        ticks = TILE_SIZE // p.speed   # per tile, arrival included
+        arrive = t0 - 1
+        if (tx or ty) and (dx or dy):
+            pellets, power = sim.pellets, sim.power_pellets
+            remaining = len(pellets) + len(power)
+            while p.is_walkable(sim.maze, x + dx, y + dy):
+                x += dx
+                y += dy
+                if not 0 <= x < MAZE_WIDTH:
+                    self.pacman_next = arrive + 1   # sets off through the tunnel
+                    break
+                tile = TILES[y][x]
+                tiles.append(tile)
+                arrive += ticks
+                if tile in power or (tile in pellets and remaining == 1):
+                    self.pacman_next = arrive
+                    self.pacman_hard = True
+                    break
+                if tile in pellets:
+                    eats.append((arrive, tile))
+                    remaining -= 1
+                if turning and p.is_walkable(sim.maze, x + tx, y + ty):
+                    self.pacman_next = arrive + 1   # takes the buffered turn
+                    break
+        self.pacman_tiles = tiles
+        self.pacman_eats = eats
+        self.pacman_dir = (dx, dy)
+        self.pacman_steps = arrive - self.pacman_from - (self.pacman_hard and 1)
+        self.pacman_vx = dx * p.speed
+        self.pacman_vy = dy * p.speed
+
+    def pacman_at(self, tick):
+        """Pacman's position after tick."""
+        e = min(max(tick - self.pacman_from, 0), self.pacman_steps)
+        return self.pacman_bx + self.pacman_vx * e, self.pacman_by + self.pacman_vy * e
+
+    def place_pacman(self, t):
+        """Set Pacman to his planned state at the start of tick t."""
+        p = self.sim.pacman
+        e = min(max(t - 1 - self.pacman_from, 0), self.pacman_steps)
+        p.x = self.pacman_bx + self.pacman_vx * e
+        p.y = self.pacman_by + self.pacman_vy * e
+        if self.pacman_tiles is not None and e:
+            k, j = divmod(e, TILE_SIZE // p.speed)
+            p.tile_x, p.tile_y = self.pacman_tiles[k]
+            p.target_x, p.target_y = self.pacman_tiles[k + 1] if j else self.pacman_tiles[k]
+            p.moving = j != 0
+            p.face_dir = self.pacman_dir
+
+    def eat_until(self, t):
+        """Eat the pellets Pacman's run reached before tick t."""
+        sim = self.sim
+        eats = self.pacman_eats
+        i = self.pacman_eaten
+        while i < len(eats) and eats[i][0] < t:
+            tick, tile = eats[i]
+            sim.pellets.remove(tile)
+            sim.score += 10
+            self.events.append((tick + 1, 'pellet', tile))
+            self.changes.append((tick + 1, sim.score, sim.lives))
+            i += 1
+        self.pacman_eaten = i
+
+    # A ghost's plan: from (bx, by) at the start of tick t0 it moves (vx, vy) a tick. If it
+    # just turned, path lists the tile centres where its move is forced, ghost_first is the
+    # tick it reaches the first and it reaches one every ghost_period ticks after that.
+
+    def predict_ghost(self, i, t0):
+        """Plan ghost i's movement from its state at the start of tick t0."""
+        g = self.sim.ghosts[i]
+        self.ghost_t0[i] = t0
+        self.ghost_bx[i] = g.x
+        self.ghost_by[i] = g.y
+        self.ghost_path[i] = ()
+        self.ghost_drawn[i] = 0
+        if g.in_house:
+            self.ghost_vx[i] = self.ghost_vy[i] = 0
+            self.ghost_next[i] = NEVER
+            return
+        speed = 1 if g.vulnerable else 4 if g.eaten else g.speed
+        dx, dy = g.dir_x, g.dir_y
+        self.ghost_speed[i] = speed
+        self.ghost_vx[i] = dx * speed
+        self.ghost_vy[i] = dy * speed
+        if (dx == 0) == (dy == 0):
+            self.ghost_next[i] = t0   # standing still: update every tick
+            return
+        last = g.last_tile
+        if (last is not None and g.x == last[0] * TILE_SIZE + TILE_SIZE // 2 + dx * speed
+                and g.y == last[1] * TILE_SIZE + TILE_SIZE // 2 + dy * speed):
+            # Decided on the last tick: follow the corridor ahead
+            path = self.corridors[g.eaten][last[1]][last[0]][(dy + 1) * 3 + dx + 1]
+            if path:
+                period = TILE_SIZE // speed - 1
+                first = t0 - 1 + period
+                self.ghost_path[i] = path
+                self.ghost_first[i] = first
+                self.ghost_period[i] = period
+                draw = (0 if g.vulnerable or g.eaten else
+                        1 if g.behavior == 'random' else 2 if g.behavior == 'ambush' else 0)
+                self.ghost_draw[i] = draw
+                if draw and first < self.draw_next:
+                    self.draw_next = first
+                cx, cy, dx, dy, last = path[-1]
+                t0 = first + (len(path) - 1) * period + 1
+                self.ghost_next[i] = t0 + self.ghost_wait(cx + dx * speed, cy + dy * speed, dx, dy, speed, last)
+                return
+        self.ghost_next[i] = t0 + self.ghost_wait(g.x, g.y, dx, dy, speed, last)
+
+    @staticmethod
+    def ghost_wait(x, y, dx, dy, speed, last_tile):
+        """Ticks of plain movement before a ghost at (x, y) heading (dx, dy) next decides
+        at a tile centre or wraps through the tunnel."""
+        if dx:
+            if (y - TILE_SIZE // 2) % TILE_SIZE:
+                return 0   # off the grid lines: update every tick
+            u, sign, line = x, dx, TILES[y // TILE_SIZE]
+        else:
+            if (x - TILE_SIZE // 2) % TILE_SIZE:
+                return 0
+            u, sign, line = y, dy, TILE_COLUMNS[x // TILE_SIZE]
+        m = u // TILE_SIZE
+        ahead = (m * TILE_SIZE + TILE_SIZE // 2 - u) * sign
+        if ahead >= -speed and line[m] != last_tile:
+            # Decides at this tile's centre, once within one move of it
+            return max(0, (ahead - 1) // speed)
+        m += sign
+        if not 0 <= m < len(line):
+            if dx:
+                # First move that leaves the row
+                return u // speed if sign < 0 else (GAME_WIDTH - u - 1) // speed
+            return 0
+        if line[m] == last_tile:
+            return 0
+        return (ahead + TILE_SIZE - 1) // speed
+
+    def ghost_at(self, i, tick):
+        """Ghost i's position after tick."""
+        path = self.ghost_path[i]
+        first = self.ghost_first[i]
+        if path and tick >= first:
+            period = self.ghost_period[i]
+            k = min((tick - first) // period, len(path) - 1)
+            cx, cy, dx, dy, _ = path[k]
+            e = (tick - first - k * period + 1) * self.ghost_speed[i]
+            return cx + dx * e, cy + dy * e
+        e = tick + 1 - self.ghost_t0[i]
+        return self.ghost_bx[i] + self.ghost_vx[i] * e, self.ghost_by[i] + self.ghost_vy[i] * e
+
+    def place_ghost(self, i, t):
+        """Set ghost i to its planned state at the start of tick t."""
+        g = self.sim.ghosts[i]
+        g.x, g.y = self.ghost_at(i, t - 1)
+        path = self.ghost_path[i]
+        if path and t > self.ghost_first[i]:
+            k = min((t - 1 - self.ghost_first[i]) // self.ghost_period[i], len(path) - 1)
+            _, _, g.dir_x, g.dir_y, g.last_tile = path[k]
+
+    def draw_until(self, t, i):
+        """Make the random draws that ghosts passing through corridors made before ghost i
+        updated on tick t. Their moves there are forced, but the draws still happen."""
+        if self.draw_next > t:
+            return
+        batch = []
+        ghosts = 0
+        following = NEVER
+        for j, kind in enumerate(self.ghost_draw):
+            path = self.ghost_path[j]
+            done = self.ghost_drawn[j]
+            if not kind or done == len(path):
+                continue
+            first = self.ghost_first[j]
+            period = self.ghost_period[j]
+            limit = t + 1 if j < i else t
+            upto = min(len(path), (limit - first - 1) // period + 1)
+            if upto > done:
+                batch += [(first + k * period, j, kind) for k in range(done, upto)]
+                self.ghost_drawn[j] = done = upto
+                ghosts += 1
+            if done < len(path):
+                following = min(following, first + done * period)
+        self.draw_next = following
+        if ghosts > 1:
+            batch.sort()
+        rng = self.sim.rng
+        for _, _, kind in batch:
+            if kind == 1 or rng.random() >= 0.7:
+                rng.choice(GHOST_DIRECTIONS[:1])
+
+    def scan_timers(self):
+        """Find the next tick with a timer other than the mouth's."""
+        t = self.tick
+        self.timer_next = min((tick for tick, bucket in self.sim.timers.buckets.items()
+                               if tick >= t and any(kind != TIMER_MOUTH for kind, _ in bucket)),
+                              default=NEVER)
+
+    def reset_safe(self, t):
+        """Work out every ghost's collision horizon again from tick t."""
+        self.ghost_safe = [t] * len(self.ghost_safe)
+        self.safe = min(self.safe, t)
+        self.safe_still = False
+
+    def collision_horizon(self, t):
+        """First tick from t on where Pacman might touch a ghost.
+
+        Over k ticks Pacman moves at most k times his speed along each axis (none
+        while he stands still), and a ghost k times its own plus one snap to a tile
+        centre per tile, so the larger of their x and y distances cannot shrink faster.
+        Only the ghosts whose last horizon has been reached are looked at again.
+        """
+        sim = self.sim
+        e = min(max(t - 1 - self.pacman_from, 0), self.pacman_steps)
+        px = self.pacman_bx + self.pacman_vx * e
+        py = self.pacman_by + self.pacman_vy * e
+        if e == self.pacman_steps or not (self.pacman_vx or self.pacman_vy):
+            pacman_speed = 0
+            limit = self.pacman_next   # standing still until then
+            self.safe_still = True
+        else:
+            pacman_speed = sim.pacman.speed
+            limit = NEVER
+        ghost_safe = self.ghost_safe
+        for i, g in enumerate(sim.ghosts):
+            if ghost_safe[i] > t:
+                continue
+            if g.in_house or g.eaten:
+                ghost_safe[i] = NEVER   # until a stepped tick lets it out
+                continue
+            gx, gy = self.ghost_at(i, t - 1)
+            speed = self.ghost_speed[i]
+            gap = max(abs(gx - px), abs(gy - py)) - TOUCH_REACH - speed
+            if gap < 0:
+                ghost_safe[i] = t
+                return t
+            rate = pacman_speed + speed + speed / (TILE_SIZE // speed - 1)
+            ghost_safe[i] = min(limit, t + int(gap / rate))
+        return min(ghost_safe)
+
+
+class SearchTimeout(Exception):
+    """Raised inside the autopilot search when its time budget runs out."""
+
+
+class Autopilot:
+    """Plays Pacman by lookahead search over cloned simulations.
+
+    Pacman only picks a direction at tile centres, so one search node is one
+    tile of movement. While Pacman walks to the next tile a worker thread
+    searches the decision due there, deepening one tile at a time until its
+    share of the remaining frames is used up. The game loop never waits for
+    it: if a decision is late Pacman keeps his current heading.
+    """
+
+    DIRECTIONS = [(0, -1), (0, 1), (-1, 0), (1, 0)]
+
+    def __init__(self, budget=0.75, max_depth=12):
+        # Fraction of the frames until the decision is due that the search may use
+        self.budget = budget
+        self.max_depth = max_depth
+        self.neighbours = self.build_neighbours()
+
+        # Statistics
+        self.nodes = 0
+        self.search_time = 0.0
+        self.decisions = 0
+        self.late = 0
+        self.depth_total = 0
+        self.last_depth = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.last_latency = 0.0
+
+        import threading
+        self._lock = threading.Condition()
+        self._request = None
+        self._result = None
+        self._plan_key = None
+        self._late_key = None
+        self._running = False
+
+    def build_neighbours(self):
+        """Walkable neighbour tiles of every walkable tile, with tunnel wrap."""
+        walkable = {(x, y) for y, row in enumerate(MAZE_LAYOUT)
+                    for x, char in enumerate(row) if char not in '14'}
+        neighbours = {}
+        for x, y in walkable:
+            neighbours[(x, y)] = [((x + dx) % MAZE_WIDTH, y + dy) for dx, dy in self.DIRECTIONS
+                                  if ((x + dx) % MAZE_WIDTH, y + dy) in walkable]
+        return neighbours
+
+    def moves(self, sim):
+        """Directions Pacman can take from his tile, current heading first."""
+        p = sim.pacman
+        moves = [d for d in self.DIRECTIONS
+                 if p.is_walkable(sim.maze, (p.tile_x + d[0]) % MAZE_WIDTH, p.tile_y + d[1])]
+        if p.face_dir in moves:
+            moves.remove(p.face_dir)
+            moves.insert(0, p.face_dir)
+        return moves
+
+    def advance(self, sim, direction, deadline):
+        """Copy of sim after Pacman moves one tile in direction (or dies trying)."""
+        if time.perf_counter() > deadline:
+            raise SearchTimeout()
+        child = sim.clone()
+        lives = child.lives
+        child.step(direction)
+        while child.pacman.moving and child.lives == lives and not child.game_over:
+            child.step()
+        self.nodes += 1
+        return child
+
+    def pellet_distance(self, sim):
+        """Maze distance in tiles from Pacman to the nearest pellet."""
+        start = sim.pacman.get_tile()
+        seen = {start}
+        frontier = [start]
+        distance = 0
+        while frontier:
+            next_frontier = []
+            for tile in frontier:
+                if tile in sim.pellets or tile in sim.power_pellets:
+                    return distance
+                for n in self.neighbours.get(tile, ()):
+                    if n not in seen:
+                        seen.add(n)
+                        next_frontier.append(n)
+            frontier = next_frontier
+            distance += 1
+        return 0
+
+    def evaluate(self, sim):
+        if sim.game_over:
+            return -1e9
+        value = sim.score + sim.lives * 10000 - self.pellet_distance(sim)
+        px, py = sim.pacman.x, sim.pacman.y
+        for g in sim.ghosts:
+            if g.vulnerable or g.eaten or g.in_house:
+                continue
+            tiles = (abs(g.x - px) + abs(g.y - py)) / TILE_SIZE
+            if tiles < 4:
+                value -= 200 / (tiles + 1)
+        return value
+
+    def value(self, sim, depth, lives, deadline):
+        if depth == 0 or sim.game_over or sim.lives < lives:
+            return self.evaluate(sim)
+        return max(self.value(self.advance(sim, d, deadline), depth - 1, lives, deadline)
+                   for d in self.moves(sim))
+
+    def decide(self, sim, deadline=float('inf')):
+        """Best direction from a state where Pacman stands on a tile centre.
+
+        deadline is a time.perf_counter() value; the search deepens until it
+        passes or max_depth is reached. Returns (direction, depth searched).
+        """
+        moves = self.moves(sim)
+        best = moves[0] if moves else None
+        depth = 0
+        try:
+            while depth < self.max_depth and len(moves) > 1:
+                best_value = None
+                for d in moves:
+                    v = self.value(self.advance(sim, d, deadline), depth, sim.lives, deadline)
+                    if best_value is None or v > best_value:
+                        best_value, choice = v, d
+                best = choice
+                depth += 1
+        except SearchTimeout:
+            pass
+        return best, depth
+
+    def start(self):
+        import threading
+        self._running = True
+        threading.Thread(target=self._worker, daemon=True).start()
+
+    def stop(self):
+        with self._lock:
+            self._running = False
+            self._lock.notify()
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                while self._running and self._request is None:
+                    self._lock.wait()
+                if not self._running:
+                    return
+                key, sim, submitted = self._request
+                self._request = None
+
+            # Walk the copy to the tile centre where the decision is due
+            frames = 0
+            lives = sim.lives
+            while sim.pacman.moving and sim.lives == lives and not sim.game_over:
+                sim.step()
+                frames += 1
+            deadline = submitted + max(frames, 1) * self.budget / FPS
+
+            start = time.perf_counter()
+            direction, depth = self.decide(sim, deadline)
+            done = time.perf_counter()
+
+            with self._lock:
+                self._result = (key, direction)
+                self.search_time += done - start
+                self.decisions += 1
+                self.depth_total += depth
+                self.last_depth = depth
+                self.last_latency = done - submitted
+                self.latency_total += self.last_latency
+                self.latency_max = max(self.latency_max, self.last_latency)
+
+    def update(self, sim):
+        """Called once per frame with the live game. Returns a direction for Simulation.step, or None."""
+        p = sim.pacman
+        tile = (p.target_x, p.target_y) if p.moving else (p.tile_x, p.tile_y)
+        key = (tile, sim.lives)
+        with self._lock:
+            result = self._result
+            if key != self._plan_key:
+                self._plan_key = key
+                self._request = (key, sim.clone(), time.perf_counter())
+                self._lock.notify()
+
+        if result is not None and result[0] == key:
+            return result[1]
+        if not p.moving and self._late_key != key:
+            self._late_key = key
+            self.late += 1
+        return None
+
+    def nodes_per_second(self):
+        return self.nodes / self.search_time if self.search_time else 0.0
+
+    def stats_text(self):
+        return (f"AUTOPILOT  depth {self.last_depth}  {self.nodes_per_second() / 1000:.1f}k nodes/s  "
+                f"{self.last_latency * 1000:.1f} ms")
+
+    def report(self):
+        decisions = max(self.decisions, 1)
+        return (f"Autopilot: {self.decisions} decisions, {self.nodes} nodes, "
+                f"{self.nodes_per_second():.0f} nodes/s, mean depth {self.depth_total / decisions:.1f}, "
+                f"latency mean {self.latency_total / decisions * 1000:.1f} ms / max {self.latency_max * 1000:.1f} ms, "
+                f"{self.late} late")
+
+
+class InputQueue:
+    """Direction input from key events, timestamped to measure input latency.
+
+    Presses are queued as they arrive instead of polling the keyboard once
+    per frame, so a key tapped and released between two frames still counts.
+    The game takes one press per frame in order; a turn that cannot be made
+    yet stays buffered in Pacman, who carries on ahead until the first tile
+    where it fits.
+
+    Latency runs from the moment a press is read from the event queue to the
+    first displayed frame where Pacman faces that way. Turns shown on the
+    very next frame are 'immediate'; the rest waited for a junction and are
+    'buffered'.
+    """
+
+    def __init__(self):
+        self.keys = {
+            pygame.K_UP: (0, -1), pygame.K_w: (0, -1),
+            pygame.K_DOWN: (0, 1), pygame.K_s: (0, 1),
+            pygame.K_LEFT: (-1, 0), pygame.K_a: (-1, 0),
+            pygame.K_RIGHT: (1, 0), pygame.K_d: (1, 0),
+        }
+        self.held = []
+        # Presses not yet given to the game: (direction, time)
+        self.queue = []
+        # Presses given to the game, not yet on screen: [direction, time, frames shown, tick taken]
+        self.pending = []
+        self.latencies = {'immediate': [], 'buffered': []}
+        self.superseded = 0
+
+    def key_down(self, key):
+        direction = self.keys.get(key)
+        if direction is not None:
+            self.held.append(key)
+            self.queue.append((direction, time.perf_counter()))
+
+    def key_up(self, key):
+        if key not in self.held:
+            return
+        latest = self.held[-1] == key
+        self.held.remove(key)
+        # Releasing the newest key falls back to one still held down
+        if latest and self.held:
+            self.queue.append((self.keys[self.held[-1]], time.perf_counter()))
+
+    def next_direction(self, pacman, tick=0):
+        """The next queued direction for Simulation.step, or None. tick is the game's tick
+        before the step."""
+        if not self.queue:
+            return None
+        direction, pressed = self.queue.pop(0)
+        if self.pending:
+            # Pacman only keeps the newest request, so older ones will never show
+            self.superseded += len(self.pending)
+            self.pending.clear()
+        if direction != pacman.face_dir:
+            self.pending.append([direction, pressed, 0, tick])
+        return direction
+
+    def frame_shown(self, pacman, tick=None):
+        """Call after each display flip to time presses that are now on screen. tick is the
+        tick shown, when the frame may be older than the game (the pipeline is on)."""
+        if not self.pending:
+            return
+        now = time.perf_counter()
+        for entry in self.pending[:]:
+            direction, pressed, frames, taken = entry
+            if tick is not None and tick <= taken:
+                # Drawn before the game took this press
+                continue
+            if pacman.face_dir == direction:
+                kind = 'immediate' if frames == 0 else 'buffered'
+                self.latencies[kind].append(now - pressed)
+                self.pending.remove(entry)
+            else:
+                entry[2] = frames + 1
+
+    def summary(self):
+        """One line for the game over screen: latency of turns shown on the next frame."""
+        values = sorted(self.latencies['immediate'])
+        if not values:
+            return ""
+        return (f"Input latency p50 {values[len(values) // 2] * 1000:.1f} ms, "
+                f"p95 {values[int(len(values) * 0.95)] * 1000:.1f} ms")
+
+    def report(self):
+        parts = []
+        for kind, values in self.latencies.items():
+            if values:
+                values = sorted(values)
+                parts.append(f"{kind} {len(values)} turns p50 {values[len(values) // 2] * 1000:.1f} ms "
+                             f"p95 {values[int(len(values) * 0.95)] * 1000:.1f} ms max {values[-1] * 1000:.1f} ms")
+        if not parts:
+            return "Input latency: no turns"
+        return "Input latency: " + ", ".join(parts) + f", {self.superseded} superseded"
+
+
+class SnapshotBuffer:
+    """Double buffer of game snapshots between the simulation thread and the renderer.
+
+    The writer fills the back slot and then flips which slot is the front in a
+    single assignment, so a reader always gets a whole snapshot and never waits.
+    Snapshots are never changed after they are published.
+    """
+
+    def __init__(self):
+        self.slots = [None, None]
+        self.front = 0
+        self.published = 0
+
+    def publish(self, snapshot):
+        back = 1 - self.front
+        self.slots[back] = snapshot
+        self.front = back
+        self.published += 1
+
+    def latest(self):
+        return self.slots[self.front]
+
+
+class SimulationThread:
+    """Runs the game logic on a worker thread at its own tick rate.
+
+    Every period the worker calls tick() under `lock`; when it returns True the
+    game changed and publish() is called to put a new snapshot in `frames`. The
+    main thread takes the same lock to handle input and state changes, and draws
+    whatever `frames` holds without it. A worker that falls more than a tick
+    behind drops the missed ticks rather than rushing to catch up.
+    """
+
+    def __init__(self, tick, publish, rate=FPS):
+        import threading
+        self.tick = tick
+        self.publish = publish
+        self.period = 1 / rate
+        self.lock = threading.Lock()
+        self.frames = SnapshotBuffer()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._worker, name="simulation", daemon=True)
+
+        # Statistics
+        self.ticks = 0
+        self.late = 0
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._thread.join()
+
+    def _worker(self):
+        deadline = time.perf_counter()
+        while not self._stopping.is_set():
+            with self.lock:
+                if self.tick():
+                    self.publish()
+                    self.ticks += 1
+            deadline += self.period
+            now = time.perf_counter()
+            if now - deadline > self.period:
+                self.late += 1
+                deadline = now
+            self._stopping.wait(max(0.0, deadline - now))
+
+    def report(self):
+        return f"Pipeline: {self.ticks} ticks, {self.late} late, {self.frames.published} snapshots"
+
+
+class FramePacer:
+    """Ends each frame on time and measures how evenly frames are spaced.
+
+    Modes:
+      sleep   pygame Clock.tick: coarse OS sleeps, lowest CPU use
+      busy    pygame Clock.tick_busy_loop: spins for the whole wait
+      hybrid  sleeps until `spin` seconds before the deadline, then spins
+      vsync   the display flip waits for the monitor; no extra waiting
+    """
+
+    MODES = ('sleep', 'busy', 'hybrid', 'vsync')
+
+    def __init__(self, mode='sleep', fps=FPS, spin=0.002, history=600):
+        self.mode = mode
+        self.fps = fps
+        self.period = 1 / fps
+        self.spin = spin
+        self.clock = pygame.time.Clock()
+        self.intervals = collections.deque(maxlen=history)
+        self.frames = 0
+        self.missed = 0
+        self.last = None
+        self.deadline = None
+
+    def set_mode(self, mode):
+        self.mode = mode
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.intervals.clear()
+        self.frames = 0
+        self.missed = 0
+        self.last = None
+        self.deadline = None
+
+    def wait(self):
+        """Call once per frame, after the display flip."""
+        if self.mode == 'sleep':
+            self.clock.tick(self.fps)
+        elif self.mode == 'busy':
+            self.clock.tick_busy_loop(self.fps)
+        elif self.mode == 'hybrid':
+            now = time.perf_counter()
+            if self.deadline is None or now - self.deadline > self.period:
+                # First frame, or far behind: restart the schedule instead of racing to catch up
+                self.deadline = now + self.period
+            remaining = self.deadline - now
+            if remaining > self.spin:
+                time.sleep(remaining - self.spin)
+            while time.perf_counter() < self.deadline:
+                pass
+            self.deadline += self.period
+
+        now = time.perf_counter()
+        if self.last is not None:
+            interval = now - self.last
+            self.intervals.append(interval)
+            self.frames += 1
+            if interval > self.period * 1.5:
+                self.missed += 1
+        self.last = now
+
+        # A flip that does not block means the driver ignored the vsync request
+        if self.mode == 'vsync' and self.frames == 60 and self.stats()['p50_ms'] < self.period * 500:
+            print("vsync is not limiting the frame rate, switching to hybrid frame pacing")
+            self.set_mode('hybrid')
+
+    def stats(self):
+        values = sorted(self.intervals)
+        if not values:
+            return {'frames': 0, 'fps': 0.0, 'mean_ms': 0.0, 'jitter_ms': 0.0,
+                    'p50_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0, 'missed': 0}
+        mean = sum(values) / len(values)
+        jitter = math.sqrt(sum((v - mean) ** 2 for v in values) / len(values))
+        return {
+            'frames': self.frames,
+            'fps': 1 / mean,
+            'mean_ms': mean * 1000,
+            'jitter_ms': jitter * 1000,
+            'p50_ms': values[len(values) // 2] * 1000,
+            'p99_ms': values[int(len(values) * 0.99)] * 1000,
+            'max_ms': values[-1] * 1000,
+            'missed': self.missed,
+        }
+
+    def stats_text(self):
+        s = self.stats()
+        return (f"{self.mode}  {s['fps']:.1f} fps  jitter {s['jitter_ms']:.2f} ms  "
+                f"p99 {s['p99_ms']:.1f} ms  missed {s['missed']}")
+
+    def report(self):
+        """Stats, a 0.25 ms histogram and the recent frame intervals, for export."""
+        histogram = collections.Counter(round(v * 4000) / 4 for v in self.intervals)
+        return {
+            'mode': self.mode,
+            'target_fps': self.fps,
+            'stats': self.stats(),
+            'histogram_ms': {f"{k:.2f}": histogram[k] for k in sorted(histogram)},
+            'intervals_ms': [round(v * 1000, 3) for v in self.intervals],
+        }
+
+    def save_report(self, path):
+        import json
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+
+class Game:
+    RENDER_MODES = ('native', 'scaled')
+
+    def __init__(self, pacing='sleep', pacing_report=None, gc_freeze=False, render='scaled', pipeline=False,
+                 leaderboard=None, cabinet=None):
+        # 'native' draws straight onto the display at its resolution; 'scaled' draws at
+        # GAME_WIDTH x GAME_HEIGHT and stretches that onto the display every frame
+        self.render = render
+        # With the pipeline the game logic runs on its own thread and frames show its latest snapshot
+        self.pipeline = SimulationThread(self.update, self.publish_snapshot) if pipeline else None
+        self.scale = None
+        self.game_surface = None
+        self.fullscreen = False
+        self.pacer = FramePacer(pacing)
+        self.pacing_report = pacing_report
+        self.show_pacing = False
+        self.set_display_mode()
+        pygame.display.set_caption("Pacman")
+        self.high_score_manager = HighScoreManager()
+        # Fleet leaderboard at this URL, if any; it starts in warm_up()
+        self.leaderboard = None
+        if leaderboard:
+            self.leaderboard = LeaderboardClient(leaderboard, Path(__file__).parent / "leaderboard_queue.jsonl", cabinet)
+
+        # The update check starts in warm_up(), once the menu is on screen
+        self.update_checker = UpdateChecker()
+        self.update_prompted = False
+        self.warmed_up = False
+
+        self.state = 'menu'
+        self.pacman_color_name = 'yellow'
+        self.pacman_color = PACMAN_COLORS['yellow']
+        self.color_options = list(PACMAN_COLORS.keys())
+        self.selected_color_index = 0
+        self.player_name = ""
+        self.autopilot = None
+        self.save_writer = SaveWriter(Path(__file__).parent / "savegame.bin")
+        self.has_save = self.save_path.exists()
+        self.sim = None
+        self.practice = False
+        self.game_over_layer = None
+        # With gc_freeze the collector only runs at safe points (see collect_garbage)
+        self.gc_freeze = gc_freeze
+        self.gc_pauses = []
+        # Gameplay statistics of player games (not autopilot or practice), for telemetry.py
+        self.telemetry = Telemetry()
+        self.telemetry_writer = TelemetryWriter(Path(__file__).parent / "telemetry.bin")
+
+    def warm_up(self):
+        """Work deferred until the first frame is shown: network, disk and the first game."""
+        self.warmed_up = True
+        self.update_checker.start_check()
+        self.high_score_manager.get_scores()
+        if self.leaderboard:
+            self.leaderboard.start()
+        if self.pipeline:
+            with self.pipeline.lock:
+                self.warm_up_game()
+        else:
+            self.warm_up_game()
+        if self.gc_freeze:
+            # Everything alive now lives for the whole session; keep it out of every collection
+            gc.collect()
+            gc.freeze()
+            gc.disable()
+
+    def warm_up_game(self):
+        """Create the first game, unless a key in the first frame already started or resumed
+        one, and draw it once off screen."""
+        if self.sim is None:
+            self.reset_game()
+        self.sim.draw(pygame.Surface(self.game_surface.get_size()), ticks=0, scale=self.scale)
+
+    def collect_garbage(self):
+        """In gc_freeze mode, collect now: called where a short pause cannot be seen."""
+        if self.gc_freeze:
+            start = time.perf_counter()
+            gc.collect()
+            self.gc_pauses.append(time.perf_counter() - start)
+
+    def gc_report(self):
+        pauses = self.gc_pauses
+        if not pauses:
+            return "GC: no collections"
+        return (f"GC: {len(pauses)} collections at safe points, mean {sum(pauses) / len(pauses) * 1000:.2f} ms, "
+                f"longest {max(pauses) * 1000:.2f} ms, {gc.get_freeze_count()} objects frozen")
+
+    def reset_game(self, practice=False):
+        """New game. Practice games can be rewound, but are not saved or eligible for high scores."""
+        seed = random.getrandbits(32)
+        self.sim = Simulation(self.pacman_color, seed)
+        self.replay = Replay(seed)
+        self.input = InputQueue()
+        self.practice = practice
+        self.rewinding = False
+        self.rewind = None
+        self.telemetry.start(self.sim)
+        if practice:
+            self.rewind = RewindBuffer()
+            self.rewind.start(self.sim)
+        self.publish_snapshot()
+
+    def publish_snapshot(self):
+        """With the pipeline on, make the game as it is now the one frames show."""
+        if self.pipeline:
+            self.pipeline.frames.publish(self.sim.snapshot())
+
+    @property
+    def save_path(self):
+        return self.save_writer.path
+
+    @save_path.setter
+    def save_path(self, path):
+        self.save_writer.path = path
+
+    def saves_enabled(self):
+        """Whether the current game is suspended and autosaved: not for the autopilot or practice."""
+        return not self.autopilot and not self.practice
+
+    def save_game(self):
+        """Write the current game to the save file now, atomically so a power cut leaves the old save intact."""
+        if self.save_writer.write(self.sim.to_bytes(), self.replay):
+            self.has_save = True
+
+    def autosave(self):
+        """Save the current game from the background writer; only the snapshot is taken here."""
+        self.save_writer.submit(self.sim.to_bytes(), self.replay.copy())
+        self.has_save = True
+
+    def resume_game(self):
+        """Continue the saved game. Returns False if there is no usable save."""
+        try:
+            data = self.save_path.read_bytes()
+            sim = Simulation.from_bytes(data[:SAVE_SIZE])
+            replay = Replay.from_bytes(data[SAVE_SIZE:])
+        except (OSError, ValueError) as e:
+            print(f"Could not resume saved game: {e}")
+            self.discard_save()
+            return False
+        self.sim = sim
+        self.replay = replay
+        self.input = InputQueue()
+        self.practice = False
+        self.rewinding = False
+        self.rewind = None
+        self.telemetry.start(sim)
+        self.publish_snapshot()
+        return True
+
+    def end_session(self):
+        """Hand the current game's telemetry to the writer: at game over, suspend or quit."""
+        if self.saves_enabled():
+            self.telemetry_writer.submit(self.telemetry.finish(self.sim))
+
+    def discard_save(self):
+        self.save_writer.discard()
+        self.has_save = False
+
+    def start_autopilot(self):
+        """Attract mode: the autopilot plays instead of the keyboard."""
+        self.reset_game()
+        self.autopilot = Autopilot()
+        self.autopilot.start()
+        self.state = 'playing'
+
+    def stop_autopilot(self):
+        if self.autopilot:
+            self.autopilot.stop()
+            print(self.autopilot.report())
+            self.autopilot = None
+
+    def set_display_mode(self, size=(GAME_WIDTH, GAME_HEIGHT)):
+        if self.pacer.mode == 'vsync':
+            # pygame only honours vsync for SCALED (or OpenGL) displays
+            flags = pygame.SCALED | (pygame.FULLSCREEN if self.fullscreen else pygame.RESIZABLE)
+            try:
+                self.screen = pygame.display.set_mode((GAME_WIDTH, GAME_HEIGHT), flags, vsync=1)
+                self.fit_display()
+                return
+            except pygame.error as e:
+                print(f"vsync unavailable ({e}), using hybrid frame pacing")
+                self.pacer.set_mode('hybrid')
         if self.fullscreen:
             self.screen = pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
         else:
-            self.screen = pygame.display.set_mode((GAME_WIDTH, GAME_HEIGHT), pygame.RESIZABLE)
+            self.screen = pygame.display.set_mode(size, pygame.RESIZABLE)
+        self.fit_display()
+
+    def fit_display(self):
+        """Set up drawing for the display's new size: called after every change of display mode.
+
+        In native mode the game is drawn into a letterboxed part of the display itself,
+        at the largest scale that fits, and fonts and sprites are made again for that
+        scale. In scaled mode it is drawn at scale 1 and stretched by scale_display.
+        """
+        if self.render == 'native':
+            sw, sh = self.screen.get_size()
+            scale = min(sw / GAME_WIDTH, sh / GAME_HEIGHT)
+            w, h = max(1, int(GAME_WIDTH * scale)), max(1, int(GAME_HEIGHT * scale))
+            self.screen.fill(BLACK)
+            self.game_surface = self.screen.subsurface(((sw - w) // 2, (sh - h) // 2, w, h))
+        else:
+            scale = 1
+            if self.game_surface is None:
+                self.game_surface = pygame.Surface((GAME_WIDTH, GAME_HEIGHT))
+        if scale != self.scale:
+            self.scale = scale
+            self.font = pygame.font.Font(None, max(1, round(36 * scale)))
+            self.small_font = pygame.font.Font(None, max(1, round(24 * scale)))
+            # Sprites of the old size are not needed again
+            Pacman.sprites.clear()
+            Ghost.sprites.clear()
+            _wall_layers.clear()
+            self.game_over_layer = None
+
+    def at(self, x, y):
+        """Where game position (x, y) is drawn on game_surface."""
+        return round(x * self.scale), round(y * self.scale)
+
+    def rect(self, x, y, w, h):
+        """A game-space rectangle, in game_surface pixels."""
+        left, top = self.at(x, y)
+        right, bottom = self.at(x + w, y + h)
+        return pygame.Rect(left, top, right - left, bottom - top)
+
+    def toggle_fullscreen(self):
+        self.fullscreen = not self.fullscreen
+        self.set_display_mode()
+
+    def cycle_pacing(self):
+        """Switch between the pacing modes that need no new display (vsync is chosen at startup)."""
+        if self.pacer.mode != 'vsync':
+            modes = ['sleep', 'busy', 'hybrid']
+            self.pacer.set_mode(modes[(modes.index(self.pacer.mode) + 1) % len(modes)])
+
+    def export_pacing_report(self, path=None):
+        path = path or Path(__file__).parent / f"frame_pacing_{self.pacer.mode}.json"
+        self.pacer.save_report(path)
+        print(f"Frame pacing report written to {path}")
+
+    def draw_pacing(self):
+        self.game_surface.blit(self.small_font.render(self.pacer.stats_text(), True, (0, 255, 0)), self.at(5, 5))
 
     def scale_display(self):
         sw, sh = self.screen.get_size()
@@ -759,340 +3271,430 @@ class Game:
         self.screen.fill(BLACK)
         self.screen.blit(scaled, ((sw - new_w) // 2, (sh - new_h) // 2))
 
-    def draw_maze(self):
-        for y, row in enumerate(self.maze):
-            for x, cell in enumerate(row):
-                if cell == 1:
-                    rect = pygame.Rect(x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE)
-                    pygame.draw.rect(self.game_surface, WALL_BLUE, rect)
-                    pygame.draw.rect(self.game_surface, BLACK, rect.inflate(-4, -4))
-
-        for x, y in self.pellets:
-            pygame.draw.circle(self.game_surface, PELLET_COLOR,
-                (x * TILE_SIZE + TILE_SIZE // 2, y * TILE_SIZE + TILE_SIZE // 2), 3)
-
-        pulse = abs((pygame.time.get_ticks() // 100) % 10 - 5)
-        for x, y in self.power_pellets:
-            pygame.draw.circle(self.game_surface, POWER_PELLET_COLOR,
-                (x * TILE_SIZE + TILE_SIZE // 2, y * TILE_SIZE + TILE_SIZE // 2), 6 + pulse)
-
-    def draw_hud(self):
-        self.game_surface.blit(self.font.render(f"Score: {self.score}", True, WHITE), (10, GAME_HEIGHT - 50))
-        self.game_surface.blit(self.font.render(f"Lives: {self.lives}", True, WHITE), (GAME_WIDTH - 120, GAME_HEIGHT - 50))
-        self.game_surface.blit(self.small_font.render("Arrow Keys/WASD to move, F11 fullscreen", True, (100, 100, 100)), (GAME_WIDTH // 2 - 140, GAME_HEIGHT - 20))
+    def draw_hud(self, sim):
+        self.game_surface.blit(self.font.render(f"Score: {sim.score}", True, WHITE), self.at(10, GAME_HEIGHT - 50))
+        self.game_surface.blit(self.font.render(f"Lives: {sim.lives}", True, WHITE), self.at(GAME_WIDTH - 120, GAME_HEIGHT - 50))
+        # Read once: with the pipeline on, the simulation thread may end the demo meanwhile
+        autopilot, rewind = self.autopilot, self.rewind
+        if autopilot:
+            self.game_surface.blit(self.small_font.render(autopilot.stats_text(), True, (100, 100, 100)), self.at(GAME_WIDTH // 2 - 140, GAME_HEIGHT - 20))
+        elif self.practice and rewind:
+            seconds = (sim.tick - rewind.oldest) / FPS
+            text = f"{'REWINDING' if self.rewinding else 'Practice'} - hold BACKSPACE to rewind ({seconds:.0f}s)"
+            self.game_surface.blit(self.small_font.render(text, True, (100, 100, 100)), self.at(GAME_WIDTH // 2 - 140, GAME_HEIGHT - 20))
+        else:
+            self.game_surface.blit(self.small_font.render("Arrow Keys/WASD to move, F11 fullscreen", True, (100, 100, 100)), self.at(GAME_WIDTH // 2 - 140, GAME_HEIGHT - 20))
 
     def draw_menu(self):
         self.game_surface.fill(BLACK)
         title = self.font.render("PACMAN", True, PACMAN_COLORS['yellow'])
-        self.game_surface.blit(title, title.get_rect(center=(GAME_WIDTH // 2, 100)))
+        self.game_surface.blit(title, title.get_rect(center=self.at(GAME_WIDTH // 2, 100)))
+        if self.has_save:
+            r = self.small_font.render("R - Resume Saved Game", True, PACMAN_COLORS['yellow'])
+            self.game_surface.blit(r, r.get_rect(center=self.at(GAME_WIDTH // 2, 155)))
 
-        for text, y in [("ENTER - Start", 200), ("C - Change Color", 250), ("H - High Scores", 300), ("F11 - Fullscreen", 350), ("Q - Quit", 400)]:
+        for text, y in [("ENTER - Start", 200), ("P - Practice (with rewind)", 245), ("A - Autopilot Demo", 290), ("C - Change Color", 335), ("H - High Scores", 380), ("F11 - Fullscreen", 425), ("Q - Quit", 470)]:
             r = self.small_font.render(text, True, WHITE)
-            self.game_surface.blit(r, r.get_rect(center=(GAME_WIDTH // 2, y)))
+            self.game_surface.blit(r, r.get_rect(center=self.at(GAME_WIDTH // 2, y)))
 
         r = self.small_font.render(f"Color: {self.pacman_color_name.upper()}", True, self.pacman_color)
-        self.game_surface.blit(r, r.get_rect(center=(GAME_WIDTH // 2, 480)))
-        pygame.draw.circle(self.game_surface, self.pacman_color, (GAME_WIDTH // 2, 540), 30)
-        pygame.draw.polygon(self.game_surface, BLACK, [(GAME_WIDTH // 2, 540), (GAME_WIDTH // 2 + 35, 525), (GAME_WIDTH // 2 + 35, 555)])
+        self.game_surface.blit(r, r.get_rect(center=self.at(GAME_WIDTH // 2, 510)))
+        pygame.draw.circle(self.game_surface, self.pacman_color, self.at(GAME_WIDTH // 2, 570), round(30 * self.scale))
+        pygame.draw.polygon(self.game_surface, BLACK, [self.at(GAME_WIDTH // 2, 570), self.at(GAME_WIDTH // 2 + 35, 555), self.at(GAME_WIDTH // 2 + 35, 585)])
+
+        status = f"v{GAME_VERSION}" + (" - checking for updates..." if self.update_checker.checking else "")
+        r = self.small_font.render(status, True, (100, 100, 100))
+        self.game_surface.blit(r, r.get_rect(center=self.at(GAME_WIDTH // 2, GAME_HEIGHT - 20)))
 
     def draw_color_select(self):
         self.game_surface.fill(BLACK)
         self.game_surface.blit(self.font.render("SELECT COLOR", True, WHITE),
-            self.font.render("SELECT COLOR", True, WHITE).get_rect(center=(GAME_WIDTH // 2, 80)))
+            self.font.render("SELECT COLOR", True, WHITE).get_rect(center=self.at(GAME_WIDTH // 2, 80)))
 
         for i, name in enumerate(self.color_options):
             y = 150 + i * 80
             if i == self.selected_color_index:
-                pygame.draw.rect(self.game_surface, WHITE, (GAME_WIDTH // 2 - 150, y - 25, 300, 60), 2)
-            pygame.draw.circle(self.game_surface, PACMAN_COLORS[name], (GAME_WIDTH // 2 - 80, y), 20)
-            self.game_surface.blit(self.font.render(name.upper(), True, PACMAN_COLORS[name]), (GAME_WIDTH // 2 - 40, y - 15))
+                pygame.draw.rect(self.game_surface, WHITE, self.rect(GAME_WIDTH // 2 - 150, y - 25, 300, 60), max(1, round(2 * self.scale)))
+            pygame.draw.circle(self.game_surface, PACMAN_COLORS[name], self.at(GAME_WIDTH // 2 - 80, y), round(20 * self.scale))
+            self.game_surface.blit(self.font.render(name.upper(), True, PACMAN_COLORS[name]), self.at(GAME_WIDTH // 2 - 40, y - 15))
 
         for i, t in enumerate(["UP/DOWN select", "ENTER confirm", "ESC back"]):
-            self.game_surface.blit(self.small_font.render(t, True, WHITE), (GAME_WIDTH // 2 - 60, 560 + i * 25))
+            self.game_surface.blit(self.small_font.render(t, True, WHITE), self.at(GAME_WIDTH // 2 - 60, 560 + i * 25))
 
     def draw_game_over(self):
-        overlay = pygame.Surface((GAME_WIDTH, GAME_HEIGHT))
-        overlay.fill(BLACK)
-        overlay.set_alpha(200)
+        # The overlay and text do not change while the screen is up, so they are built once per game
+        if self.game_over_layer is None or self.game_over_layer[0] != (self.sim, self.sim.tick):
+            overlay = pygame.Surface(self.game_surface.get_size())
+            overlay.fill(BLACK)
+            overlay.set_alpha(200)
+            lines = [(self.font, "GAME OVER", (255, 0, 0), -50), (self.font, f"Score: {self.sim.score}", WHITE, 0)]
+            if self.practice:
+                msg = "ENTER menu, R retry, BACKSPACE rewind"
+            elif self.high_score_manager.is_high_score(self.sim.score):
+                msg = "NEW HIGH SCORE! ENTER to save"
+            else:
+                msg = "ENTER menu, R retry"
+            lines.append((self.small_font, msg, WHITE, 50))
+            latency = self.input.summary()
+            if latency:
+                lines.append((self.small_font, latency, (100, 100, 100), 90))
+            texts = []
+            for font, text, color, dy in lines:
+                r = font.render(text, True, color)
+                texts.append((r, r.get_rect(center=self.at(GAME_WIDTH // 2, GAME_HEIGHT // 2 + dy))))
+            self.game_over_layer = ((self.sim, self.sim.tick), overlay, texts)
+        _, overlay, texts = self.game_over_layer
         self.game_surface.blit(overlay, (0, 0))
-
-        self.game_surface.blit(self.font.render("GAME OVER", True, (255, 0, 0)),
-            self.font.render("GAME OVER", True, (255, 0, 0)).get_rect(center=(GAME_WIDTH // 2, GAME_HEIGHT // 2 - 50)))
-        self.game_surface.blit(self.font.render(f"Score: {self.score}", True, WHITE),
-            self.font.render(f"Score: {self.score}", True, WHITE).get_rect(center=(GAME_WIDTH // 2, GAME_HEIGHT // 2)))
-
-        msg = "NEW HIGH SCORE! ENTER to save" if self.high_score_manager.is_high_score(self.score) else "ENTER menu, R retry"
-        self.game_surface.blit(self.small_font.render(msg, True, WHITE),
-            self.small_font.render(msg, True, WHITE).get_rect(center=(GAME_WIDTH // 2, GAME_HEIGHT // 2 + 50)))
+        self.game_surface.blits(texts, False)
 
     def draw_high_score_entry(self):
         self.game_surface.fill(BLACK)
         self.game_surface.blit(self.font.render("NEW HIGH SCORE!", True, PACMAN_COLORS['yellow']),
-            self.font.render("NEW HIGH SCORE!", True, PACMAN_COLORS['yellow']).get_rect(center=(GAME_WIDTH // 2, 100)))
-        self.game_surface.blit(self.font.render(f"Score: {self.score}", True, WHITE),
-            self.font.render(f"Score: {self.score}", True, WHITE).get_rect(center=(GAME_WIDTH // 2, 160)))
+            self.font.render("NEW HIGH SCORE!", True, PACMAN_COLORS['yellow']).get_rect(center=self.at(GAME_WIDTH // 2, 100)))
+        self.game_surface.blit(self.font.render(f"Score: {self.sim.score}", True, WHITE),
+            self.font.render(f"Score: {self.sim.score}", True, WHITE).get_rect(center=self.at(GAME_WIDTH // 2, 160)))
         self.game_surface.blit(self.small_font.render("Enter name:", True, WHITE),
-            self.small_font.render("Enter name:", True, WHITE).get_rect(center=(GAME_WIDTH // 2, 250)))
-        pygame.draw.rect(self.game_surface, WHITE, (GAME_WIDTH // 2 - 100, 280, 200, 40), 2)
+            self.small_font.render("Enter name:", True, WHITE).get_rect(center=self.at(GAME_WIDTH // 2, 250)))
+        pygame.draw.rect(self.game_surface, WHITE, self.rect(GAME_WIDTH // 2 - 100, 280, 200, 40), max(1, round(2 * self.scale)))
         self.game_surface.blit(self.font.render(self.player_name + "_", True, WHITE),
-            self.font.render(self.player_name + "_", True, WHITE).get_rect(center=(GAME_WIDTH // 2, 300)))
+            self.font.render(self.player_name + "_", True, WHITE).get_rect(center=self.at(GAME_WIDTH // 2, 300)))
+
+    def show_high_scores(self):
+        self.state = 'high_scores'
+        if self.leaderboard:
+            self.leaderboard.refresh()
 
     def draw_high_scores(self):
         self.game_surface.fill(BLACK)
         self.game_surface.blit(self.font.render("HIGH SCORES", True, PACMAN_COLORS['yellow']),
-            self.font.render("HIGH SCORES", True, PACMAN_COLORS['yellow']).get_rect(center=(GAME_WIDTH // 2, 60)))
-
-        scores = self.high_score_manager.get_scores()
+            self.font.render("HIGH SCORES", True, PACMAN_COLORS['yellow']).get_rect(center=self.at(GAME_WIDTH // 2, 60)))
+
+        # The fleet's scores once fetched (never waited for), this cabinet's until then
+        scores = self.leaderboard and self.leaderboard.top()
+        if self.leaderboard:
+            status = self.small_font.render(self.leaderboard.status_text(), True, (100, 100, 100))
+            self.game_surface.blit(status, status.get_rect(center=self.at(GAME_WIDTH // 2, 90)))
+        if scores is None:
+            scores = self.high_score_manager.get_scores()
         if not scores:
             self.game_surface.blit(self.small_font.render("No scores yet!", True, WHITE),
-                self.small_font.render("No scores yet!", True, WHITE).get_rect(center=(GAME_WIDTH // 2, 200)))
+                self.small_font.render("No scores yet!", True, WHITE).get_rect(center=self.at(GAME_WIDTH // 2, 200)))
         else:
             for i, e in enumerate(scores):
                 y = 120 + i * 40
-                self.game_surface.blit(self.small_font.render(f"{i+1}. {e['name'][:10]}", True, WHITE), (GAME_WIDTH // 2 - 100, y))
-                self.game_surface.blit(self.small_font.render(str(e['score']), True, WHITE), (GAME_WIDTH // 2 + 50, y))
+                self.game_surface.blit(self.small_font.render(f"{i+1}. {e['name'][:10]}", True, WHITE), self.at(GAME_WIDTH // 2 - 100, y))
+                self.game_surface.blit(self.small_font.render(str(e['score']), True, WHITE), self.at(GAME_WIDTH // 2 + 50, y))
 
         self.game_surface.blit(self.small_font.render("ESC to go back", True, WHITE),
-            self.small_font.render("ESC to go back", True, WHITE).get_rect(center=(GAME_WIDTH // 2, GAME_HEIGHT - 60)))
-
-    def draw_update_check(self):
-        self.game_surface.fill(BLACK)
-        text = self.font.render("Checking for updates...", True, WHITE)
-        self.game_surface.blit(text, text.get_rect(center=(GAME_WIDTH // 2, GAME_HEIGHT // 2)))
-        ver = self.small_font.render(f"Current version: {GAME_VERSION}", True, (100, 100, 100))
-        self.game_surface.blit(ver, ver.get_rect(center=(GAME_WIDTH // 2, GAME_HEIGHT // 2 + 50)))
+            self.small_font.render("ESC to go back", True, WHITE).get_rect(center=self.at(GAME_WIDTH // 2, GAME_HEIGHT - 60)))
 
     def draw_update_prompt(self):
         self.game_surface.fill(BLACK)
         title = self.font.render("Update Available!", True, PACMAN_COLORS['yellow'])
-        self.game_surface.blit(title, title.get_rect(center=(GAME_WIDTH // 2, 150)))
+        self.game_surface.blit(title, title.get_rect(center=self.at(GAME_WIDTH // 2, 150)))
 
         cur = self.small_font.render(f"Current: v{GAME_VERSION}", True, WHITE)
         new = self.small_font.render(f"New: v{self.update_checker.remote_version}", True, (0, 255, 0))
-        self.game_surface.blit(cur, cur.get_rect(center=(GAME_WIDTH // 2, 220)))
-        self.game_surface.blit(new, new.get_rect(center=(GAME_WIDTH // 2, 250)))
+        self.game_surface.blit(cur, cur.get_rect(center=self.at(GAME_WIDTH // 2, 220)))
+        self.game_surface.blit(new, new.get_rect(center=self.at(GAME_WIDTH // 2, 250)))
 
         y_text = self.font.render("Y - Download Update", True, WHITE)
         n_text = self.font.render("N - Skip", True, WHITE)
-        self.game_surface.blit(y_text, y_text.get_rect(center=(GAME_WIDTH // 2, 350)))
-        self.game_surface.blit(n_text, n_text.get_rect(center=(GAME_WIDTH // 2, 400)))
+        self.game_surface.blit(y_text, y_text.get_rect(center=self.at(GAME_WIDTH // 2, 350)))
+        self.game_surface.blit(n_text, n_text.get_rect(center=self.at(GAME_WIDTH // 2, 400)))
 
     def draw_downloading(self):
         self.game_surface.fill(BLACK)
         text = self.font.render("Downloading update...", True, WHITE)
-        self.game_surface.blit(text, text.get_rect(center=(GAME_WIDTH // 2, GAME_HEIGHT // 2)))
+        self.game_surface.blit(text, text.get_rect(center=self.at(GAME_WIDTH // 2, GAME_HEIGHT // 2)))
 
     def draw_update_complete(self):
         self.game_surface.fill(BLACK)
         title = self.font.render("Update Complete!", True, (0, 255, 0))
-        self.game_surface.blit(title, title.get_rect(center=(GAME_WIDTH // 2, GAME_HEIGHT // 2 - 50)))
+        self.game_surface.blit(title, title.get_rect(center=self.at(GAME_WIDTH // 2, GAME_HEIGHT // 2 - 50)))
 
         msg = self.small_font.render("Please restart the game to use the new version.", True, WHITE)
-        self.game_surface.blit(msg, msg.get_rect(center=(GAME_WIDTH // 2, GAME_HEIGHT // 2 + 20)))
+        self.game_surface.blit(msg, msg.get_rect(center=self.at(GAME_WIDTH // 2, GAME_HEIGHT // 2 + 20)))
 
         key = self.small_font.render("Press any key to exit", True, (100, 100, 100))
-        self.game_surface.blit(key, key.get_rect(center=(GAME_WIDTH // 2, GAME_HEIGHT // 2 + 80)))
-
-    def run(self):
-        running = True
+        self.game_surface.blit(key, key.get_rect(center=self.at(GAME_WIDTH // 2, GAME_HEIGHT // 2 + 80)))
 
-        while running:
-            # Handle events
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
+    def draw_frame(self, sim=None):
+        """Draw the current screen, ready for the display to be flipped. sim is the game to
+        show (default: the live one), a snapshot of it when the pipeline is on."""
+        sim = sim or self.sim
+        self.game_surface.fill(BLACK)
 
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_F11:
-                        self.toggle_fullscreen()
+        if self.state == 'menu':
+            self.draw_menu()
+        elif self.state == 'color_select':
+            self.draw_color_select()
+        elif self.state == 'playing':
+            sim.draw(self.game_surface, scale=self.scale)
+            self.draw_hud(sim)
+        elif self.state == 'game_over':
+            sim.draw(self.game_surface, scale=self.scale)
+            self.draw_hud(sim)
+            self.draw_game_over()
+        elif self.state == 'high_score_entry':
+            self.draw_high_score_entry()
+        elif self.state == 'high_scores':
+            self.draw_high_scores()
+        elif self.state == 'update_available':
+            self.draw_update_prompt()
+        elif self.state == 'downloading_update':
+            self.draw_downloading()
+        elif self.state == 'update_complete':
+            self.draw_update_complete()
+
+        if self.show_pacing:
+            self.draw_pacing()
+
+        if self.render == 'scaled':
+            self.scale_display()
 
-                    elif self.state == 'menu':
-                        if event.key == pygame.K_RETURN:
-                            self.reset_game()
+    def handle_events(self):
+        """Act on window and keyboard events, and on what the update checker found."""
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                if self.state == 'playing' and self.saves_enabled():
+                    self.save_game()
+                    self.end_session()
+                self.running = False
+
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_F11:
+                    self.toggle_fullscreen()
+                elif event.key == pygame.K_F3:
+                    self.show_pacing = not self.show_pacing
+                elif event.key == pygame.K_F9:
+                    self.cycle_pacing()
+                elif event.key == pygame.K_F12:
+                    self.export_pacing_report()
+
+                elif self.state == 'menu':
+                    if event.key == pygame.K_RETURN:
+                        self.reset_game()
+                        self.state = 'playing'
+                    elif event.key == pygame.K_p:
+                        self.reset_game(practice=True)
+                        self.state = 'playing'
+                    elif event.key == pygame.K_r and self.has_save:
+                        if self.resume_game():
                             self.state = 'playing'
-                        elif event.key == pygame.K_c:
-                            self.state = 'color_select'
-                        elif event.key == pygame.K_h:
-                            self.state = 'high_scores'
-                        elif event.key == pygame.K_q:
-                            running = False
-
-                    elif self.state == 'color_select':
-                        if event.key == pygame.K_UP:
-                            self.selected_color_index = (self.selected_color_index - 1) % len(self.color_options)
-                        elif event.key == pygame.K_DOWN:
-                            self.selected_color_index = (self.selected_color_index + 1) % len(self.color_options)
-                        elif event.key == pygame.K_RETURN:
-                            self.pacman_color_name = self.color_options[self.selected_color_index]
-                            self.pacman_color = PACMAN_COLORS[self.pacman_color_name]
-                            self.state = 'menu'
-                        elif event.key == pygame.K_ESCAPE:
-                            self.state = 'menu'
-
-                    elif self.state == 'playing':
-                        if event.key == pygame.K_ESCAPE:
-                            self.state = 'menu'
+                    elif event.key == pygame.K_a:
+                        self.start_autopilot()
+                    elif event.key == pygame.K_c:
+                        self.state = 'color_select'
+                    elif event.key == pygame.K_h:
+                        self.show_high_scores()
+                    elif event.key == pygame.K_q:
+                        self.running = False
+
+                elif self.state == 'color_select':
+                    if event.key == pygame.K_UP:
+                        self.selected_color_index = (self.selected_color_index - 1) % len(self.color_options)
+                    elif event.key == pygame.K_DOWN:
+                        self.selected_color_index = (self.selected_color_index + 1) % len(self.color_options)
+                    elif event.key == pygame.K_RETURN:
+                        self.pacman_color_name = self.color_options[self.selected_color_index]
+                        self.pacman_color = PACMAN_COLORS[self.pacman_color_name]
+                        self.state = 'menu'
+                    elif event.key == pygame.K_ESCAPE:
+                        self.state = 'menu'
 
-                    elif self.state == 'game_over':
-                        if event.key == pygame.K_RETURN:
-                            if self.high_score_manager.is_high_score(self.score):
-                                self.player_name = ""
-                                self.state = 'high_score_entry'
-                            else:
-                                self.state = 'menu'
-                        elif event.key == pygame.K_r:
-                            self.reset_game()
-                            self.state = 'playing'
+                elif self.state == 'playing':
+                    if event.key == pygame.K_ESCAPE:
+                        if self.saves_enabled():
+                            # Suspend: the game can be resumed from the menu
+                            self.save_game()
+                            self.end_session()
+                        if not self.autopilot:
+                            print(self.input.report())
+                        self.stop_autopilot()
+                        self.collect_garbage()
+                        self.state = 'menu'
+                    elif event.key == pygame.K_BACKSPACE and self.practice:
+                        self.rewinding = True
+                    else:
+                        self.input.key_down(event.key)
 
-                    elif self.state == 'high_score_entry':
-                        if event.key == pygame.K_RETURN and self.player_name:
-                            self.high_score_manager.add_score(self.player_name, self.score)
-                            self.state = 'high_scores'
-                        elif event.key == pygame.K_BACKSPACE:
-                            self.player_name = self.player_name[:-1]
-                        elif len(self.player_name) < 10 and (event.unicode.isalnum() or event.unicode == ' '):
-                            self.player_name += event.unicode
-
-                    elif self.state == 'high_scores':
-                        if event.key in (pygame.K_ESCAPE, pygame.K_RETURN):
+                elif self.state == 'game_over':
+                    if event.key == pygame.K_RETURN:
+                        if not self.practice and self.high_score_manager.is_high_score(self.sim.score):
+                            self.player_name = ""
+                            self.state = 'high_score_entry'
+                        else:
                             self.state = 'menu'
+                    elif event.key == pygame.K_r:
+                        self.reset_game(self.practice)
+                        self.state = 'playing'
+                    elif event.key == pygame.K_BACKSPACE and self.practice:
+                        self.rewinding = True
+                        self.state = 'playing'
+
+                elif self.state == 'high_score_entry':
+                    if event.key == pygame.K_RETURN and self.player_name:
+                        replay = self.replay.to_bytes()
+                        result = self.high_score_manager.add_score(self.player_name, self.sim.score, replay)
+                        if not result['accepted']:
+                            print(f"Score rejected: {result['reason']}")
+                        elif self.leaderboard:
+                            self.leaderboard.submit(self.player_name, self.sim.score, replay)
+                        self.show_high_scores()
+                    elif event.key == pygame.K_BACKSPACE:
+                        self.player_name = self.player_name[:-1]
+                    elif len(self.player_name) < 10 and (event.unicode.isalnum() or event.unicode == ' '):
+                        self.player_name += event.unicode
+
+                elif self.state == 'high_scores':
+                    if event.key in (pygame.K_ESCAPE, pygame.K_RETURN):
+                        self.state = 'menu'
 
-                    elif self.state == 'update_available':
-                        if event.key == pygame.K_y:
-                            self.update_checker.start_download()
-                            self.state = 'downloading_update'
-                        elif event.key == pygame.K_n:
-                            self.state = 'menu'
+                elif self.state == 'update_available':
+                    if event.key == pygame.K_y:
+                        self.update_checker.start_download()
+                        self.state = 'downloading_update'
+                    elif event.key == pygame.K_n:
+                        self.state = 'menu'
 
-                    elif self.state == 'update_complete':
-                        running = False  # Any key exits
+                elif self.state == 'update_complete':
+                    self.running = False  # Any key exits
+
+            if event.type == pygame.KEYUP and self.state == 'playing':
+                if event.key == pygame.K_BACKSPACE:
+                    self.rewinding = False
+                self.input.key_up(event.key)
+
+            if event.type == pygame.VIDEORESIZE and not self.fullscreen and self.pacer.mode != 'vsync':
+                self.set_display_mode((event.w, event.h))
+
+        # Update checker state logic: offer an update once, when it is found while on the menu
+        if self.state == 'menu':
+            if self.update_checker.update_available and not self.update_prompted:
+                self.update_prompted = True
+                self.state = 'update_available'
+
+        elif self.state == 'downloading_update':
+            if not self.update_checker.downloading:
+                if self.update_checker.download_complete:
+                    self.state = 'update_complete'
+                elif self.update_checker.download_error:
+                    self.state = 'menu'  # Go to menu on error
+
+    def update(self):
+        """Play one tick of the game, if one is on. Returns whether the game changed."""
+        if self.state != 'playing':
+            return False
+        if self.rewinding:
+            # Practice: one tick back per update while BACKSPACE is held
+            if self.sim.tick > self.rewind.oldest:
+                self.rewind.seek(self.sim.tick - 1, self.sim)
+            return True
 
-                if event.type == pygame.VIDEORESIZE and not self.fullscreen:
-                    self.screen = pygame.display.set_mode((event.w, event.h), pygame.RESIZABLE)
+        # Movement comes from the autopilot or the queued key presses
+        if self.autopilot:
+            direction = self.autopilot.update(self.sim)
+        else:
+            direction = self.input.next_direction(self.sim.pacman, self.sim.tick)
 
-            # Update checker state logic
-            if self.state == 'checking_updates':
-                if not self.update_checker.checking:
-                    if self.update_checker.update_available:
-                        self.state = 'update_available'
-                    else:
-                        self.state = 'menu'
+        self.sim.step(direction)
+        if self.rewind:
+            self.rewind.record(self.sim, direction)
+        else:
+            self.replay.record(self.sim, direction)
+            if not self.autopilot:
+                self.telemetry.record(self.sim)
+        for kind, _ in self.sim.events:
+            # Pacman and the ghosts restart after a death or a cleared level
+            if kind == 'death' or kind == 'level':
+                self.collect_garbage()
+        if self.sim.game_over:
+            if self.autopilot:
+                # Attract mode goes straight back to the menu
+                self.stop_autopilot()
+                self.state = 'menu'
+            else:
+                print(self.input.report())
+                if self.saves_enabled():
+                    self.discard_save()
+                    self.end_session()
+                self.state = 'game_over'
+        elif self.saves_enabled() and self.sim.tick % AUTOSAVE_INTERVAL == 0:
+            self.autosave()
+        return True
 
-            elif self.state == 'downloading_update':
-                if not self.update_checker.downloading:
-                    if self.update_checker.download_complete:
-                        self.state = 'update_complete'
-                    elif self.update_checker.download_error:
-                        self.state = 'menu'  # Go to menu on error
-
-            # Game logic
-            if self.state == 'playing':
-                # Read keyboard for movement
-                keys = pygame.key.get_pressed()
-
-                # RIGHT
-                if keys[pygame.K_RIGHT] or keys[pygame.K_d]:
-                    self.pacman.request_direction(1, 0)
-                # LEFT
-                elif keys[pygame.K_LEFT] or keys[pygame.K_a]:
-                    self.pacman.request_direction(-1, 0)
-                # UP
-                elif keys[pygame.K_UP] or keys[pygame.K_w]:
-                    self.pacman.request_direction(0, -1)
-                # DOWN
-                elif keys[pygame.K_DOWN] or keys[pygame.K_s]:
-                    self.pacman.request_direction(0, 1)
-
-                # Update Pacman
-                self.pacman.update(self.maze)
-
-                # Check pellet collection
-                tile = self.pacman.get_tile()
-                if tile in self.pellets:
-                    self.pellets.remove(tile)
-                    self.score += 10
-                if tile in self.power_pellets:
-                    self.power_pellets.remove(tile)
-                    self.score += 50
-                    self.ghost_eat_streak = 0
-                    for g in self.ghosts:
-                        g.make_vulnerable(360)
-
-                # Update ghosts
-                for g in self.ghosts:
-                    g.update(self.maze, self.pacman.x, self.pacman.y)
-
-                # Check ghost collision
-                for g in self.ghosts:
-                    if g.eaten or g.in_house:
-                        continue
-                    dist = math.sqrt((self.pacman.x - g.x)**2 + (self.pacman.y - g.y)**2)
-                    if dist < TILE_SIZE * 0.6:
-                        if g.vulnerable:
-                            g.eaten = True
-                            self.ghost_eat_streak += 1
-                            self.score += 200 * (2 ** (self.ghost_eat_streak - 1))
-                        else:
-                            self.lives -= 1
-                            if self.lives <= 0:
-                                self.state = 'game_over'
-                            else:
-                                self.reset_positions()
-                            break
-
-                # Level complete
-                if not self.pellets and not self.power_pellets:
-                    self.reload_pellets()
-                    self.reset_positions()
+    def run(self):
+        self.running = True
+        shown = None
+        if self.pipeline:
+            self.pipeline.start()
+
+        while self.running:
+            if self.pipeline:
+                # The simulation thread plays the ticks; it holds the same lock while it does
+                with self.pipeline.lock:
+                    self.handle_events()
+            else:
+                self.handle_events()
+                self.update()
 
             # Draw
-            self.game_surface.fill(BLACK)
-
-            if self.state == 'menu':
-                self.draw_menu()
-            elif self.state == 'color_select':
-                self.draw_color_select()
-            elif self.state == 'playing':
-                self.draw_maze()
-                self.pacman.draw(self.game_surface)
-                for g in self.ghosts:
-                    g.draw(self.game_surface)
-                self.draw_hud()
-            elif self.state == 'game_over':
-                self.draw_maze()
-                self.pacman.draw(self.game_surface)
-                for g in self.ghosts:
-                    g.draw(self.game_surface)
-                self.draw_hud()
-                self.draw_game_over()
-            elif self.state == 'high_score_entry':
-                self.draw_high_score_entry()
-            elif self.state == 'high_scores':
-                self.draw_high_scores()
-            elif self.state == 'checking_updates':
-                self.draw_update_check()
-            elif self.state == 'update_available':
-                self.draw_update_prompt()
-            elif self.state == 'downloading_update':
-                self.draw_downloading()
-            elif self.state == 'update_complete':
-                self.draw_update_complete()
-
-            self.scale_display()
+            sim = self.pipeline.frames.latest() if self.pipeline else self.sim
+            self.draw_frame(sim)
             pygame.display.flip()
-            self.clock.tick(60)
-
+            if self.state == 'playing' and not self.autopilot:
+                if self.pipeline:
+                    # Count only frames that showed a new tick, as the single-threaded loop does
+                    if sim is not shown:
+                        with self.pipeline.lock:
+                            self.input.frame_shown(sim.pacman, sim.tick)
+                else:
+                    self.input.frame_shown(sim.pacman)
+            shown = sim
+            if not self.warmed_up:
+                self.warm_up()
+            self.pacer.wait()
+
+        if self.pipeline:
+            self.pipeline.stop()
+            print(self.pipeline.report())
+        self.stop_autopilot()
+        self.save_writer.close()
+        self.telemetry_writer.close()
+        if self.leaderboard:
+            self.leaderboard.close()
+        if self.pacing_report:
+            self.export_pacing_report(self.pacing_report)
+        if self.gc_freeze:
+            print(self.gc_report())
         pygame.quit()
 
 
 def main():
     """Main entry point with dependency checking."""
-    global pygame
+    import argparse
+    parser = argparse.ArgumentParser(description="Pacman")
+    parser.add_argument('--pacing', choices=FramePacer.MODES, default='sleep',
+                        help="how each frame waits for the next (default: sleep)")
+    parser.add_argument('--pacing-report', metavar='PATH',
+                        help="write a frame pacing report to PATH on exit")
+    parser.add_argument('--gc-freeze', action='store_true',
+                        help="freeze startup objects and only collect garbage between lives and levels")
+    parser.add_argument('--render', choices=Game.RENDER_MODES, default='scaled',
+                        help="draw at game size and stretch it, or straight at the display's resolution "
+                             "(default: scaled)")
+    parser.add_argument('--pipeline', action='store_true',
+                        help="run the game logic on its own thread, drawing its latest snapshot each frame")
+    parser.add_argument('--leaderboard', metavar='URL',
+                        help="also send high scores to a fleet leaderboard (leaderboard.py), e.g. http://127.0.0.1:8766")
+    parser.add_argument('--cabinet', help="this cabinet's name on the leaderboard (default: the host name)")
+    args = parser.parse_args()
+
     if check_dependencies():
-        import pygame as pg
-        pygame = pg
-        pygame.init()
-        game = Game()
+        init_pygame()
+        game = Game(args.pacing, args.pacing_report, args.gc_freeze, args.render, args.pipeline,
+                    args.leaderboard, args.cabinet)
         game.run()
 
 
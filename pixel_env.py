@@ -0,0 +1,123 @@
+"""
+Headless pixel observations for Pacman agents.
+
+Frames are read straight out of the playfield surface through
+pygame.surfarray views, downsampled and converted to grayscale into
+preallocated numpy buffers, and kept in a ring buffer of the last N frames.
+Requires numpy (pip install numpy).
+"""
+
+import numpy as np
+
+import pacman
+from pacman import GAME_WIDTH, PLAYFIELD_HEIGHT, FPS, Simulation
+
+
+class FrameStack:
+    """Ring buffer of the last `stack` grayscale frames of a surface.
+
+    Frames are sampled every `downsample` pixels, starting half a step in so
+    that samples land on tile centres where the pellets are drawn.
+    """
+
+    # Integer luma weights (ITU-R BT.601), summing to 256
+    WEIGHTS = (77, 150, 29)
+
+    def __init__(self, surface, stack=4, downsample=8):
+        self.surface = surface
+        self.stack = stack
+        self.step = downsample
+        self.offset = downsample // 2
+
+        w, h = surface.get_size()
+        self.width = len(range(self.offset, w, downsample))
+        self.height = len(range(self.offset, h, downsample))
+
+        # frames[i] is (height, width) like any image; surfarray is (width, height)
+        self.frames = np.zeros((stack, self.height, self.width), dtype=np.uint8)
+        self._acc = np.empty((self.width, self.height), dtype=np.uint16)
+        self._tmp = np.empty((self.width, self.height), dtype=np.uint16)
+        # Chronological index order for each possible ring head
+        self._orders = [np.array([(head + 1 + i) % stack for i in range(stack)], dtype=np.intp)
+                        for head in range(stack)]
+        self.head = stack - 1
+        self.count = 0
+
+    def reset(self):
+        self.frames.fill(0)
+        self.head = self.stack - 1
+        self.count = 0
+
+    def capture(self):
+        """Grab the surface's current contents as the newest frame."""
+        self.head = (self.head + 1) % self.stack
+        out = self.frames[self.head].T
+
+        # The view locks the surface, so it must be dropped before the next draw
+        view = pacman.pygame.surfarray.pixels3d(self.surface)
+        sampled = view[self.offset::self.step, self.offset::self.step]
+        r, g, b = self.WEIGHTS
+        np.multiply(sampled[..., 0], r, out=self._acc, dtype=np.uint16)
+        np.multiply(sampled[..., 1], g, out=self._tmp, dtype=np.uint16)
+        np.add(self._acc, self._tmp, out=self._acc)
+        np.multiply(sampled[..., 2], b, out=self._tmp, dtype=np.uint16)
+        np.add(self._acc, self._tmp, out=self._acc)
+        np.right_shift(self._acc, 8, out=out, casting='unsafe')
+        del sampled, view
+
+        self.count = min(self.count + 1, self.stack)
+        return self.frames[self.head]
+
+    def latest(self):
+        """View of the newest frame."""
+        return self.frames[self.head]
+
+    def stacked(self, out=None):
+        """Frames oldest to newest as a (stack, height, width) array.
+
+        Pass a preallocated `out` array to avoid allocating on every call.
+        """
+        return np.take(self.frames, self._orders[self.head], axis=0, out=out)
+
+
+class PixelEnv:
+    """Pacman as a pixel-observation environment, running headless.
+
+    Actions index ACTIONS; the reward is the score gained during the step.
+    The observation array is reused between steps, so copy it to keep it.
+    """
+
+    ACTIONS = [None, (0, -1), (0, 1), (-1, 0), (1, 0)]
+
+    def __init__(self, stack=4, downsample=8, seed=None):
+        pacman.init_pygame(headless=True)
+        self.surface = pacman.pygame.Surface((GAME_WIDTH, PLAYFIELD_HEIGHT), 0, 32)
+        self.frames = FrameStack(self.surface, stack, downsample)
+        self.observation = np.zeros_like(self.frames.frames)
+        self.seed = seed
+        self.sim = None
+
+    @property
+    def observation_shape(self):
+        return self.observation.shape
+
+    def render(self):
+        self.surface.fill(pacman.BLACK)
+        self.sim.draw(self.surface, ticks=self.sim.tick * 1000 // FPS)
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.seed = seed
+        self.sim = Simulation(seed=self.seed)
+        self.frames.reset()
+        self.render()
+        self.frames.capture()
+        return self.frames.stacked(out=self.observation)
+
+    def step(self, action):
+        """Apply an action for one frame. Returns (observation, reward, done)."""
+        score = self.sim.score
+        self.sim.step(self.ACTIONS[action])
+        self.render()
+        self.frames.capture()
+        return self.frames.stacked(out=self.observation), self.sim.score - score, self.sim.game_over
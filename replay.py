@@ -0,0 +1,109 @@
+"""
+Batch verification of recorded Pacman replays for the leaderboard.
+
+Every replay is re-simulated headlessly from its seed and recorded inputs,
+spread across a pool of worker processes. A replay is accepted when the
+re-simulated game passes through every recorded checkpoint and ends on the
+score the replay claims; otherwise it is rejected with the first tick where
+the re-simulation disagrees. The replay format is described in pacman.py
+(Replay); the game writes one for every accepted high score under replays/.
+
+Usage: python replay.py [--workers N] [--json] PATH...
+
+PATH may be a replay file or a folder of .pmr files. One line is printed per
+replay, in completion order, then a summary.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import struct
+import sys
+import time
+
+from pacman import REPLAY_HEADER, verify_replay
+
+# Batches claiming fewer ticks than this are verified in this process: about a
+# second of work, less than starting a pool and handing the replays to it costs
+SERIAL_TICKS = 200_000
+# Chunks per worker: enough to even out the load, few enough to keep the overhead down
+CHUNKS_PER_WORKER = 4
+
+
+def load_replays(paths):
+    """(name, data) for every replay file named in paths or found in the folders among them."""
+    replays = []
+    for path in paths:
+        if os.path.isdir(path):
+            names = sorted(os.path.join(path, n) for n in os.listdir(path) if n.endswith('.pmr'))
+        else:
+            names = [path]
+        for name in names:
+            with open(name, 'rb') as f:
+                replays.append((name, f.read()))
+    return replays
+
+
+def claimed_ticks(data):
+    """Length of a replay according to its header, used to schedule the longest first."""
+    try:
+        return REPLAY_HEADER.unpack_from(data)[3]
+    except struct.error:
+        return 0
+
+
+def verify_item(item):
+    name, data = item
+    result = verify_replay(data)
+    result['replay'] = name
+    return result
+
+
+def verify_batch(replays, workers=None):
+    """Verify (name, data) pairs across a process pool, yielding results as they complete.
+
+    The longest replays are handed out first so that a few long games at the end
+    cannot leave the other workers idle. Batches claiming fewer than SERIAL_TICKS
+    ticks in all are verified serially, where a pool would only add its start-up.
+    """
+    workers = min(workers or os.cpu_count() or 1, len(replays))
+    ticks = [claimed_ticks(data) for _, data in replays]
+    ordered = [item for _, item in sorted(zip(ticks, replays), key=lambda pair: pair[0], reverse=True)]
+    if workers <= 1 or sum(ticks) < SERIAL_TICKS:
+        yield from map(verify_item, ordered)
+        return
+    chunksize = max(1, len(ordered) // (workers * CHUNKS_PER_WORKER))
+    with multiprocessing.Pool(workers) as pool:
+        yield from pool.imap_unordered(verify_item, ordered, chunksize)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify Pacman replays by re-simulating them")
+    parser.add_argument('paths', nargs='+', metavar='PATH', help="replay files or folders of .pmr files")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument('--json', action='store_true', help="print one JSON object per replay")
+    args = parser.parse_args()
+
+    replays = load_replays(args.paths)
+    accepted = ticks = 0
+    start = time.perf_counter()
+    for result in verify_batch(replays, args.workers):
+        accepted += result['accepted']
+        ticks += result['ticks']
+        if args.json:
+            print(json.dumps(result))
+        elif result['accepted']:
+            print(f"ACCEPT {result['replay']}: score {result['score']} in {result['ticks']} ticks")
+        else:
+            at = f" at tick {result['divergence']}" if result['divergence'] is not None else ""
+            print(f"REJECT {result['replay']}{at}: {result['reason']}")
+    elapsed = time.perf_counter() - start
+
+    print(f"{accepted}/{len(replays)} accepted in {elapsed:.2f}s "
+          f"({len(replays) / elapsed:.1f} replays/s, {ticks / elapsed:,.0f} ticks/s)", file=sys.stderr)
+    sys.exit(0 if accepted == len(replays) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+"""
+Authoritative Pacman game server.
+
+Every client that joins gets its own game. All games in a process advance
+together on one fixed-rate tick loop: clients send direction changes, and
+after each tick the server sends every client the state of its game.
+
+Clients speak newline-delimited JSON over plain TCP, or the same JSON in
+WebSocket text frames. Messages from the client:
+
+    {"cmd": "join", "seed": 123}    start a game (seed optional)
+    {"dir": "left"}                 up / down / left / right
+    {"cmd": "restart"}              new game after game over
+    {"cmd": "stats"}                server statistics (no join needed)
+    {"cmd": "watch", "session": N}  spectate game N (0 = newest) using the
+                                    binary stream described in spectate.py
+
+Usage: python server.py [--host 127.0.0.1] [--port 8765] [--tick-rate 60] [--workers 1]
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import multiprocessing
+import random
+import struct
+import time
+from collections import deque
+
+from pacman import Simulation, FPS
+from spectate import StateEncoder, frame
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+DIRECTIONS = {'up': (0, -1), 'down': (0, 1), 'left': (-1, 0), 'right': (1, 0)}
+# Stop sending state to a client whose unsent output exceeds this
+MAX_WRITE_BUFFER = 64 * 1024
+# Largest WebSocket frame a client may send; a message is a few dozen bytes
+MAX_MESSAGE = 4096
+# RFC 6455 close status for a message too big to process
+WS_TOO_BIG = 1009
+
+
+class TcpConnection:
+    """Newline-delimited JSON over a plain TCP stream."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    async def recv(self):
+        line = await self.reader.readline()
+        return line or None
+
+    def send(self, payload):
+        self.writer.write(payload + b'\n')
+        return len(payload) + 1
+
+    def send_binary(self, payload):
+        data = frame(payload)
+        self.writer.write(data)
+        return len(data)
+
+
+class WebSocketConnection:
+    """Minimal RFC 6455 server side: unfragmented text and binary frames, ping and close."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    async def handshake(self):
+        key = None
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.strip().lower() == 'sec-websocket-key':
+                key = value.strip()
+        if key is None:
+            self.writer.write(b"HTTP/1.1 400 Bad Request\r\n\r\n")
+            return False
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        self.writer.write(("HTTP/1.1 101 Switching Protocols\r\n"
+                           "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+                           f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        return True
+
+    @staticmethod
+    def frame(payload, opcode=0x1):
+        n = len(payload)
+        if n < 126:
+            header = struct.pack('!BB', 0x80 | opcode, n)
+        elif n < 65536:
+            header = struct.pack('!BBH', 0x80 | opcode, 126, n)
+        else:
+            header = struct.pack('!BBQ', 0x80 | opcode, 127, n)
+        return header + payload
+
+    async def recv(self):
+        try:
+            while True:
+                b0, b1 = await self.reader.readexactly(2)
+                opcode = b0 & 0x0f
+                n = b1 & 0x7f
+                if n == 126:
+                    n = struct.unpack('!H', await self.reader.readexactly(2))[0]
+                elif n == 127:
+                    n = struct.unpack('!Q', await self.reader.readexactly(8))[0]
+                if n > MAX_MESSAGE:
+                    self.writer.write(self.frame(struct.pack('!H', WS_TOO_BIG), 0x8))
+                    return None
+                mask = await self.reader.readexactly(4) if b1 & 0x80 else None
+                payload = await self.reader.readexactly(n)
+                if mask:
+                    payload = bytes(b ^ mask[i & 3] for i, b in enumerate(payload))
+                if opcode == 0x8:
+                    self.writer.write(self.frame(b'', 0x8))
+                    return None
+                if opcode == 0x9:
+                    self.writer.write(self.frame(payload, 0xA))
+                    continue
+                if opcode in (0x0, 0x1, 0x2):
+                    return payload
+        except asyncio.IncompleteReadError:
+            return None
+
+    def send(self, payload):
+        data = self.frame(payload)
+        self.writer.write(data)
+        return len(data)
+
+    def send_binary(self, payload):
+        data = self.frame(payload, 0x2)
+        self.writer.write(data)
+        return len(data)
+
+
+class Session:
+    """One authoritative game and the client playing it."""
+
+    def __init__(self, session_id, conn, seed):
+        self.id = session_id
+        self.conn = conn
+        self.seed = seed
+        self.sim = Simulation(seed=seed)
+        self.direction = None
+        self.eaten = []
+        self.reload = False
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        # Spectators, and the viewers among them that fell behind and need a keyframe
+        self.watchers = []
+        self.lagging = set()
+        self.encoder = StateEncoder()
+
+    def restart(self):
+        self.sim = Simulation(seed=self.seed)
+        self.direction = None
+        self.eaten.clear()
+        self.reload = True
+
+    def step(self):
+        sim = self.sim
+        sim.step(self.direction)
+        self.direction = None
+        for kind, detail in sim.events:
+            if kind == 'pellet' or kind == 'power':
+                self.eaten.append(detail)
+            elif kind == 'level':
+                self.eaten.clear()
+                self.reload = True
+
+    def add_watcher(self, conn):
+        self.watchers.append(conn)
+        return conn.send_binary(self.encoder.keyframe(self.sim))
+
+    def remove_watcher(self, conn):
+        if conn in self.watchers:
+            self.watchers.remove(conn)
+        self.lagging.discard(conn)
+
+    def broadcast(self):
+        """Send the latest spectator message to every watcher. Returns bytes sent."""
+        message = self.encoder.encode(self.sim)
+        sent = 0
+        for conn in self.watchers:
+            if conn.writer.transport.get_write_buffer_size() >= MAX_WRITE_BUFFER:
+                self.lagging.add(conn)
+            elif conn in self.lagging:
+                # Deltas were skipped, so resynchronise this viewer
+                self.lagging.discard(conn)
+                sent += conn.send_binary(self.encoder.keyframe(self.sim))
+            else:
+                sent += conn.send_binary(message)
+        return sent
+
+    def encode_state(self):
+        """Compact JSON state. Pellets are sent as the tiles eaten since the last state."""
+        sim = self.sim
+        p = sim.pacman
+        state = {
+            't': sim.tick,
+            's': sim.score,
+            'l': sim.lives,
+            'p': [p.x, p.y, p.face_dir[0], p.face_dir[1]],
+            'g': [[g.x, g.y, g.dir_x, g.dir_y, g.vulnerable | g.eaten << 1 | g.in_house << 2]
+                  for g in sim.ghosts],
+        }
+        if self.eaten:
+            state['e'] = self.eaten
+        if self.reload:
+            state['r'] = 1
+        if sim.game_over:
+            state['o'] = 1
+        payload = json.dumps(state, separators=(',', ':')).encode()
+        self.eaten = []
+        self.reload = False
+        return payload
+
+
+class GameServer:
+    """Runs every session in this process on one fixed-rate tick loop."""
+
+    def __init__(self, tick_rate=FPS, send_every=1):
+        self.tick_rate = tick_rate
+        self.send_every = send_every
+        self.sessions = {}
+        self.next_id = 1
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.ticks = 0
+        self.overruns = 0
+        self.lateness = deque(maxlen=100000)
+        self.busy = 0.0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.stats_wall = time.perf_counter()
+        self.stats_cpu = time.process_time()
+
+    def stats(self):
+        lateness = sorted(self.lateness)
+        wall = time.perf_counter() - self.stats_wall
+
+        def pct(q):
+            return lateness[min(int(q * len(lateness)), len(lateness) - 1)] * 1000 if lateness else 0.0
+
+        return {
+            'sessions': len(self.sessions),
+            'tick_rate': self.tick_rate,
+            'ticks': self.ticks,
+            'overruns': self.overruns,
+            'wall_s': wall,
+            'cpu_s': time.process_time() - self.stats_cpu,
+            'busy_s': self.busy,
+            'jitter_ms': {'p50': pct(0.5), 'p99': pct(0.99), 'max': pct(1.0)},
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+        }
+
+    async def tick_loop(self):
+        loop = asyncio.get_running_loop()
+        period = 1 / self.tick_rate
+        next_tick = loop.time()
+        while True:
+            self.lateness.append(max(loop.time() - next_tick, 0.0))
+            start = time.perf_counter()
+            send = self.ticks % self.send_every == 0
+            for session in self.sessions.values():
+                if session.sim.game_over:
+                    continue
+                session.step()
+                if send and session.conn.writer.transport.get_write_buffer_size() < MAX_WRITE_BUFFER:
+                    sent = session.conn.send(session.encode_state())
+                    session.bytes_sent += sent
+                    self.bytes_sent += sent
+                if session.watchers:
+                    self.bytes_sent += session.broadcast()
+            self.busy += time.perf_counter() - start
+            self.ticks += 1
+
+            next_tick += period
+            delay = next_tick - loop.time()
+            if delay < 0:
+                # Fell behind: count it and restart the schedule from now rather than bursting
+                self.overruns += 1
+                next_tick = loop.time()
+                delay = 0
+            await asyncio.sleep(delay)
+
+    async def handle(self, reader, writer):
+        session = None
+        watching = None
+        try:
+            first = await reader.readline()
+            if first.startswith(b'GET '):
+                conn = WebSocketConnection(reader, writer)
+                if not await conn.handshake():
+                    return
+                first = await conn.recv()
+            else:
+                conn = TcpConnection(reader, writer)
+
+            message = first
+            while message:
+                self.bytes_received += len(message)
+                if session:
+                    session.bytes_received += len(message)
+                try:
+                    msg = json.loads(message)
+                except ValueError:
+                    msg = {}
+                if not isinstance(msg, dict):
+                    msg = {}
+                cmd = msg.get('cmd')
+                if 'dir' in msg and session:
+                    direction = msg['dir']
+                    session.direction = DIRECTIONS.get(direction) if isinstance(direction, str) else None
+                elif cmd == 'join' and session is None:
+                    seed = msg.get('seed')
+                    if not isinstance(seed, int) or isinstance(seed, bool) or not 0 <= seed < 2 ** 32:
+                        seed = random.getrandbits(32)
+                    session = Session(self.next_id, conn, seed)
+                    self.next_id += 1
+                    self.sessions[session.id] = session
+                    conn.send(json.dumps({'hello': session.id, 'tick_rate': self.tick_rate}).encode())
+                elif cmd == 'restart' and session:
+                    session.restart()
+                elif cmd == 'watch' and watching is None and self.sessions:
+                    target = msg.get('session')
+                    if not isinstance(target, int) or isinstance(target, bool):
+                        target = None
+                    watching = self.sessions.get(target or max(self.sessions))
+                    if watching:
+                        self.bytes_sent += watching.add_watcher(conn)
+                elif cmd == 'stats':
+                    stats = self.stats()
+                    if msg.get('reset'):
+                        self.reset_stats()
+                    conn.send(json.dumps(stats).encode())
+                await writer.drain()
+                message = await conn.recv()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            # ValueError (LimitOverrunError among them): a line longer than the stream
+            # limit; there is no telling where the next message starts, so hang up
+            pass
+        finally:
+            if session:
+                del self.sessions[session.id]
+                for watcher in session.watchers:
+                    watcher.writer.close()
+            if watching:
+                watching.remove_watcher(conn)
+            writer.close()
+
+
+async def serve(host, port, tick_rate, send_every, reuse_port=False):
+    server = GameServer(tick_rate, send_every)
+    listener = await asyncio.start_server(server.handle, host, port, reuse_port=reuse_port)
+    async with listener:
+        await asyncio.gather(listener.serve_forever(), server.tick_loop())
+
+
+def run_worker(host, port, tick_rate, send_every, reuse_port):
+    try:
+        asyncio.run(serve(host, port, tick_rate, send_every, reuse_port))
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Authoritative Pacman game server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--tick-rate', type=int, default=FPS)
+    parser.add_argument('--send-every', type=int, default=1, help="send state every N ticks")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="processes sharing the port (SO_REUSEPORT, Linux only)")
+    args = parser.parse_args()
+
+    print(f"Pacman server on {args.host}:{args.port}, {args.tick_rate} ticks/s, {args.workers} worker(s)")
+    if args.workers == 1:
+        run_worker(args.host, args.port, args.tick_rate, args.send_every, False)
+        return
+    workers = [multiprocessing.Process(target=run_worker,
+                                       args=(args.host, args.port, args.tick_rate, args.send_every, True))
+               for _ in range(args.workers)]
+    for w in workers:
+        w.start()
+    try:
+        for w in workers:
+            w.join()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
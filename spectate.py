@@ -0,0 +1,354 @@
+"""
+Compact spectator stream for live games, and a viewer that renders it.
+
+The stream is a sequence of binary messages. A keyframe carries the whole
+visible state of a game; each delta after it carries only what changed since
+the previous message. Entity moves are one byte each, pellets eaten are tile
+indices, and ghost timers are only sent when they stop counting down the way
+the viewer predicts. At 60 ticks/s a stream costs well under 1 KB/s.
+
+Keyframe (little-endian):
+    B kind=0, I tick, i score, B lives, B game_over
+    5 x (h x, h y, B dir | flags << 3, H timer)      Pacman, then the ghosts
+    pellet bitmap, power pellet bitmap               one bit per layout tile
+
+Delta:
+    B kind=1, B ticks since the previous message
+    B move_mask, B jump_mask, B state_mask, B misc
+    per entity in move_mask:  B (dx + 8) << 4 | (dy + 8)
+    per entity in jump_mask:  h x, h y
+    per entity in state_mask: B dir | flags << 3
+    misc SCORE: i score, LIVES: B lives, PELLETS: B count + count x H tile,
+         TIMERS: B mask + H timer per ghost in mask
+
+Over a byte stream each message is prefixed with its length as a u16.
+
+Usage (viewer): python spectate.py [--host 127.0.0.1] [--port 8765] [--session N]
+"""
+
+import argparse
+import json
+import socket
+import struct
+import time
+
+import pacman
+from pacman import (MAZE_WIDTH, TILE_SIZE, GAME_WIDTH, GAME_HEIGHT, FPS, BLACK, WHITE,
+                    PELLET_TILES, POWER_TILES, pack_bits, unpack_bits, Simulation)
+
+KEYFRAME = 0
+DELTA = 1
+
+# Delta misc flags
+SCORE = 1
+LIVES = 2
+PELLETS = 4
+TIMERS = 8
+GAME_OVER = 16
+
+DIRECTIONS = [(0, 0), (0, -1), (0, 1), (-1, 0), (1, 0)]
+DIRECTION_CODES = {d: i for i, d in enumerate(DIRECTIONS)}
+
+KEYFRAME_HEAD = struct.Struct('<BIiBB')
+ENTITY = struct.Struct('<hhBH')
+DELTA_HEAD = struct.Struct('<BBBBBB')
+POSITION = struct.Struct('<hh')
+LENGTH = struct.Struct('<H')
+
+
+def entities(sim):
+    """[x, y, dir | flags << 3, timer] for Pacman and each ghost."""
+    p = sim.pacman
+    ents = [[p.x, p.y, DIRECTION_CODES[p.face_dir] | p.mouth_open << 3, 0]]
+    for g in sim.ghosts:
+        flags = g.vulnerable | g.eaten << 1 | g.in_house << 2
+        ents.append([g.x, g.y, DIRECTION_CODES[(g.dir_x, g.dir_y)] | flags << 3, g.vulnerable_timer])
+    return ents
+
+
+def predict_timers(ents, dt):
+    """Vulnerable ghosts count their timer down by one every tick."""
+    for e in ents[1:]:
+        if e[2] >> 3 & 1:
+            e[3] -= dt
+
+
+class StateEncoder:
+    """Turns successive states of one game into keyframes and deltas.
+
+    It keeps the same model of the game a viewer rebuilds, so every delta is
+    relative to exactly what the viewer already has.
+    """
+
+    def __init__(self, keyframe_interval=2 * FPS):
+        self.keyframe_interval = keyframe_interval
+        self.model = None
+        self.tick = 0
+        self.since_keyframe = 0
+        self.score = 0
+        self.lives = 0
+        self.game_over = False
+        self.pellets = set()
+        self.power_pellets = set()
+
+    def keyframe(self, sim):
+        """A keyframe for sim. Does not change the encoder, so it can be sent to a single late viewer."""
+        parts = [KEYFRAME_HEAD.pack(KEYFRAME, sim.tick, sim.score, sim.lives, sim.game_over)]
+        for x, y, state, timer in entities(sim):
+            parts.append(ENTITY.pack(x, y, state, timer))
+        parts.append(pack_bits(PELLET_TILES, sim.pellets))
+        parts.append(pack_bits(POWER_TILES, sim.power_pellets))
+        return b''.join(parts)
+
+    def _reset(self, sim):
+        self.model = entities(sim)
+        self.tick = sim.tick
+        self.score = sim.score
+        self.lives = sim.lives
+        self.game_over = sim.game_over
+        self.pellets = set(sim.pellets)
+        self.power_pellets = set(sim.power_pellets)
+        self.since_keyframe = 0
+
+    def encode(self, sim):
+        """The next message of the stream for sim's current state."""
+        dt = sim.tick - self.tick
+        if (self.model is None or self.since_keyframe >= self.keyframe_interval or not 0 < dt < 256
+                or len(sim.pellets) > len(self.pellets) or len(sim.power_pellets) > len(self.power_pellets)):
+            message = self.keyframe(sim)
+            self._reset(sim)
+            return message
+
+        model = self.model
+        predict_timers(model, dt)
+        move_mask = jump_mask = state_mask = misc = 0
+        moves = []
+        jumps = []
+        states = []
+        for i, (x, y, state, timer) in enumerate(entities(sim)):
+            m = model[i]
+            dx = x - m[0]
+            dy = y - m[1]
+            if dx or dy:
+                if -8 <= dx <= 7 and -8 <= dy <= 7:
+                    move_mask |= 1 << i
+                    moves.append((dx + 8) << 4 | (dy + 8))
+                else:
+                    jump_mask |= 1 << i
+                    jumps.append(POSITION.pack(x, y))
+                m[0] = x
+                m[1] = y
+            if state != m[2]:
+                state_mask |= 1 << i
+                states.append(state)
+                m[2] = state
+
+        tail = []
+        if sim.score != self.score:
+            misc |= SCORE
+            tail.append(struct.pack('<i', sim.score))
+            self.score = sim.score
+        if sim.lives != self.lives:
+            misc |= LIVES
+            tail.append(struct.pack('<B', sim.lives))
+            self.lives = sim.lives
+        if len(sim.pellets) != len(self.pellets) or len(sim.power_pellets) != len(self.power_pellets):
+            eaten = (self.pellets - sim.pellets) | (self.power_pellets - sim.power_pellets)
+            misc |= PELLETS
+            tail.append(struct.pack(f'<B{len(eaten)}H', len(eaten), *(y * MAZE_WIDTH + x for x, y in eaten)))
+            self.pellets -= eaten
+            self.power_pellets -= eaten
+        timer_mask = 0
+        timers = []
+        for i, g in enumerate(sim.ghosts, 1):
+            if g.vulnerable_timer != model[i][3]:
+                timer_mask |= 1 << i
+                timers.append(g.vulnerable_timer)
+                model[i][3] = g.vulnerable_timer
+        if timer_mask:
+            misc |= TIMERS
+            tail.append(struct.pack(f'<B{len(timers)}H', timer_mask, *timers))
+        if sim.game_over and not self.game_over:
+            misc |= GAME_OVER
+            self.game_over = True
+
+        self.tick = sim.tick
+        self.since_keyframe += dt
+        return (DELTA_HEAD.pack(DELTA, dt, move_mask, jump_mask, state_mask, misc)
+                + bytes(moves) + b''.join(jumps) + bytes(states) + b''.join(tail))
+
+
+class StateDecoder:
+    """Rebuilds a drawable Simulation from a spectator stream."""
+
+    def __init__(self):
+        self.sim = None
+        self.model = None
+
+    def apply(self, message):
+        """Apply one message. Deltas before the first keyframe are ignored."""
+        if message[0] == KEYFRAME:
+            self._apply_keyframe(message)
+        elif self.sim is not None:
+            self._apply_delta(message)
+
+    def _apply_keyframe(self, data):
+        _, tick, score, lives, game_over = KEYFRAME_HEAD.unpack_from(data)
+        if self.sim is None:
+            self.sim = Simulation()
+        sim = self.sim
+        sim.tick, sim.score, sim.lives, sim.game_over = tick, score, lives, bool(game_over)
+        offset = KEYFRAME_HEAD.size
+        self.model = []
+        for _ in range(5):
+            self.model.append(list(ENTITY.unpack_from(data, offset)))
+            offset += ENTITY.size
+        sim.pellets, offset = unpack_bits(PELLET_TILES, data, offset)
+        sim.power_pellets, offset = unpack_bits(POWER_TILES, data, offset)
+        self._update_entities()
+
+    def _apply_delta(self, data):
+        _, dt, move_mask, jump_mask, state_mask, misc = DELTA_HEAD.unpack_from(data)
+        sim = self.sim
+        model = self.model
+        sim.tick += dt
+        predict_timers(model, dt)
+        offset = DELTA_HEAD.size
+        for i in range(5):
+            if move_mask >> i & 1:
+                b = data[offset]
+                model[i][0] += (b >> 4) - 8
+                model[i][1] += (b & 15) - 8
+                offset += 1
+        for i in range(5):
+            if jump_mask >> i & 1:
+                model[i][0], model[i][1] = POSITION.unpack_from(data, offset)
+                offset += POSITION.size
+        for i in range(5):
+            if state_mask >> i & 1:
+                model[i][2] = data[offset]
+                offset += 1
+        if misc & SCORE:
+            sim.score, = struct.unpack_from('<i', data, offset)
+            offset += 4
+        if misc & LIVES:
+            sim.lives = data[offset]
+            offset += 1
+        if misc & PELLETS:
+            count = data[offset]
+            for index in struct.unpack_from(f'<{count}H', data, offset + 1):
+                tile = (index % MAZE_WIDTH, index // MAZE_WIDTH)
+                sim.pellets.discard(tile)
+                sim.power_pellets.discard(tile)
+            offset += 1 + 2 * count
+        if misc & TIMERS:
+            mask = data[offset]
+            offset += 1
+            for i in range(1, 5):
+                if mask >> i & 1:
+                    model[i][3], = struct.unpack_from('<H', data, offset)
+                    offset += 2
+        if misc & GAME_OVER:
+            sim.game_over = True
+        self._update_entities()
+
+    def _update_entities(self):
+        sim = self.sim
+        x, y, state, _ = self.model[0]
+        p = sim.pacman
+        p.x, p.y = x, y
+        p.tile_x, p.tile_y = x // TILE_SIZE, y // TILE_SIZE
+        p.face_dir = DIRECTIONS[state & 7]
+        p.mouth_open = bool(state >> 3 & 1)
+        for g, (x, y, state, timer) in zip(sim.ghosts, self.model[1:]):
+            g.x, g.y = x, y
+            g.dir_x, g.dir_y = DIRECTIONS[state & 7]
+            g.vulnerable = bool(state >> 3 & 1)
+            g.eaten = bool(state >> 4 & 1)
+            g.in_house = bool(state >> 5 & 1)
+            g.vulnerable_timer = timer
+
+
+def frame(message):
+    """Length-prefix a message for a byte stream."""
+    return LENGTH.pack(len(message)) + message
+
+
+def unframe(buffer):
+    """Split complete length-prefixed messages off the front of a bytearray."""
+    messages = []
+    while len(buffer) >= LENGTH.size:
+        n, = LENGTH.unpack_from(buffer)
+        if len(buffer) < LENGTH.size + n:
+            break
+        messages.append(bytes(buffer[LENGTH.size:LENGTH.size + n]))
+        del buffer[:LENGTH.size + n]
+    return messages
+
+
+def watch(host, port, session):
+    """Viewer mode: render a game from the server's spectator stream."""
+    pygame = pacman.init_pygame()
+    screen = pygame.display.set_mode((GAME_WIDTH, GAME_HEIGHT))
+    pygame.display.set_caption("Pacman - Spectator")
+    font = pygame.font.Font(None, 36)
+    small_font = pygame.font.Font(None, 24)
+    clock = pygame.time.Clock()
+
+    sock = socket.create_connection((host, port))
+    sock.sendall(json.dumps({'cmd': 'watch', 'session': session}).encode() + b'\n')
+    sock.setblocking(False)
+
+    decoder = StateDecoder()
+    buffer = bytearray()
+    received = 0
+    start = time.perf_counter()
+    running = True
+    while running:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                running = False
+
+        try:
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    running = False
+                    break
+                received += len(chunk)
+                buffer += chunk
+        except BlockingIOError:
+            pass
+        for message in unframe(buffer):
+            decoder.apply(message)
+
+        screen.fill(BLACK)
+        sim = decoder.sim
+        if sim is None:
+            text = font.render("Waiting for game...", True, WHITE)
+            screen.blit(text, text.get_rect(center=(GAME_WIDTH // 2, GAME_HEIGHT // 2)))
+        else:
+            sim.draw(screen, ticks=sim.tick * 1000 // FPS)
+            screen.blit(font.render(f"Score: {sim.score}", True, WHITE), (10, GAME_HEIGHT - 50))
+            screen.blit(font.render(f"Lives: {sim.lives}", True, WHITE), (GAME_WIDTH - 120, GAME_HEIGHT - 50))
+            seconds = max(time.perf_counter() - start, 1)
+            status = f"SPECTATING  {received / seconds:.0f} B/s" + ("  GAME OVER" if sim.game_over else "")
+            screen.blit(small_font.render(status, True, (100, 100, 100)), (GAME_WIDTH // 2 - 140, GAME_HEIGHT - 20))
+        pygame.display.flip()
+        clock.tick(FPS)
+
+    sock.close()
+    pygame.quit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch a live game from a Pacman server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--session', type=int, default=0, help="session id (default: the newest game)")
+    args = parser.parse_args()
+    watch(args.host, args.port, args.session)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Aggregate Pacman gameplay telemetry and draw it as heatmaps over the maze.
+
+The game appends one record per finished session (game over, suspend or quit)
+to telemetry.bin, in compressed batches written from a background thread; the
+format is described in pacman.py (Telemetry). This tool sums any number of
+those files, streaming them a few thousand sessions at a time so millions of
+sessions fit in a small amount of memory, prints a summary and writes PNG
+heatmaps of deaths, traffic and coverage per tile.
+Requires numpy (pip install numpy).
+
+Usage: python telemetry.py [--out DIR] [--scale N] [--json] PATH...
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import zlib
+
+import numpy as np
+
+import pacman
+from pacman import (MAZE_LAYOUT, MAZE_WIDTH, MAZE_HEIGHT, MAZE_TILES, TILE_SIZE, FPS, GAME_WIDTH,
+                    PLAYFIELD_HEIGHT, TELEMETRY_MAGIC, TELEMETRY_VERSION, TELEMETRY_BATCH,
+                    TELEMETRY_LEVELS, TELEMETRY_SIZE, Simulation)
+
+# One session record, matching TELEMETRY_SESSION plus the per-tile counters
+SESSION = np.dtype([
+    ('ticks', '<u4'), ('score', '<i4'), ('levels', '<u2'), ('pellets', '<u4'), ('power', '<u2'),
+    ('ghost_eats', '<u2', 5),
+    ('level_ticks', '<u4', TELEMETRY_LEVELS),
+    ('deaths', 'u1', MAZE_TILES),
+    ('visits', '<u2', MAZE_TILES),
+])
+assert SESSION.itemsize == TELEMETRY_SIZE
+
+
+def reachable_tiles():
+    """Boolean mask of the tiles Pacman can reach from the start tile, tunnels included."""
+    mask = np.zeros(MAZE_TILES, dtype=bool)
+    stack = [(1, 1)]
+    while stack:
+        x, y = stack.pop()
+        x %= MAZE_WIDTH
+        if not 0 <= y < MAZE_HEIGHT or MAZE_LAYOUT[y][x] in '14' or mask[y * MAZE_WIDTH + x]:
+            continue
+        mask[y * MAZE_WIDTH + x] = True
+        stack += [(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)]
+    return mask
+
+
+def read_sessions(path, chunk=4096):
+    """Yield arrays of about `chunk` sessions from a telemetry file.
+
+    Batches from another format version are skipped, and a batch cut short at the
+    end of the file (the game was killed mid-write) ends the file.
+    """
+    pending = []
+    count = 0
+    skipped = 0
+    with open(path, 'rb') as f:
+        while True:
+            head = f.read(TELEMETRY_BATCH.size)
+            if len(head) < TELEMETRY_BATCH.size:
+                break
+            magic, version, sessions, length = TELEMETRY_BATCH.unpack(head)
+            if magic != TELEMETRY_MAGIC:
+                print(f"{path}: not a telemetry batch, ignoring the rest of the file", file=sys.stderr)
+                break
+            payload = f.read(length)
+            if len(payload) < length:
+                break
+            if version != TELEMETRY_VERSION:
+                skipped += sessions
+                continue
+            try:
+                data = zlib.decompress(payload)
+            except zlib.error:
+                skipped += sessions
+                continue
+            if len(data) != sessions * TELEMETRY_SIZE:
+                skipped += sessions
+                continue
+            pending.append(data)
+            count += sessions
+            if count >= chunk:
+                yield np.frombuffer(b''.join(pending), dtype=SESSION)
+                pending = []
+                count = 0
+    if pending:
+        yield np.frombuffer(b''.join(pending), dtype=SESSION)
+    if skipped:
+        print(f"{path}: skipped {skipped} sessions in unreadable batches", file=sys.stderr)
+
+
+class Aggregate:
+    """Running totals over any number of sessions."""
+
+    def __init__(self):
+        self.reachable = reachable_tiles()
+        self.sessions = 0
+        self.ticks = 0
+        self.score = 0
+        self.pellets = 0
+        self.pellet_rate = 0.0      # sum over sessions of pellets per second
+        self.coverage = 0.0         # sum over sessions of the share of reachable tiles visited
+        self.ghost_eats = np.zeros(5, dtype=np.int64)
+        self.level_ticks = np.zeros(TELEMETRY_LEVELS, dtype=np.int64)
+        self.level_counts = np.zeros(TELEMETRY_LEVELS, dtype=np.int64)
+        self.deaths = np.zeros(MAZE_TILES, dtype=np.int64)
+        self.visits = np.zeros(MAZE_TILES, dtype=np.int64)
+        self.visited = np.zeros(MAZE_TILES, dtype=np.int64)   # sessions that entered each tile
+
+    def add(self, sessions):
+        ticks = sessions['ticks'].astype(np.int64)
+        self.sessions += len(sessions)
+        self.ticks += int(ticks.sum())
+        self.score += int(sessions['score'].sum(dtype=np.int64))
+        self.pellets += int(sessions['pellets'].sum(dtype=np.int64))
+        self.pellet_rate += float((sessions['pellets'] * FPS / np.maximum(ticks, 1)).sum())
+        self.ghost_eats += sessions['ghost_eats'].sum(axis=0, dtype=np.int64)
+        levels = sessions['level_ticks']
+        self.level_ticks += levels.sum(axis=0, dtype=np.int64)
+        self.level_counts += (levels > 0).sum(axis=0)
+        self.deaths += sessions['deaths'].sum(axis=0, dtype=np.int64)
+        visits = sessions['visits']
+        self.visits += visits.sum(axis=0, dtype=np.int64)
+        entered = visits > 0
+        self.visited += entered.sum(axis=0)
+        self.coverage += float((entered & self.reachable).sum() / self.reachable.sum())
+
+    def summary(self):
+        n = max(self.sessions, 1)
+        power = max(int(self.ghost_eats.sum()), 1)
+        return {
+            'sessions': self.sessions,
+            'hours': self.ticks / FPS / 3600,
+            'mean_score': self.score / n,
+            'pellets_per_second': self.pellet_rate / n,
+            'mean_coverage': self.coverage / n,
+            'ghosts_per_power_pellet': [int(c) for c in self.ghost_eats],
+            'mean_ghosts_per_power_pellet': float(self.ghost_eats @ np.arange(5)) / power,
+            'mean_level_seconds': [float(t) / c / FPS if c else None
+                                   for t, c in zip(self.level_ticks, self.level_counts)],
+            'deaths': int(self.deaths.sum()),
+        }
+
+
+def heat(t):
+    """Black-body colour for t in [0, 1]."""
+    return (int(255 * min(1.0, 3 * t)), int(255 * min(1.0, max(0.0, 3 * t - 1))),
+            int(255 * min(1.0, max(0.0, 3 * t - 2))))
+
+
+def draw_heatmap(pygame, values, title, path, scale=2):
+    """Save values (one per tile) as a PNG heatmap over the empty maze, square-root scaled."""
+    surface = pygame.Surface((GAME_WIDTH, PLAYFIELD_HEIGHT))
+    maze = Simulation()
+    maze.pellets.clear()
+    maze.power_pellets.clear()
+    maze.draw_maze(surface, ticks=0)
+
+    overlay = pygame.Surface(surface.get_size(), pygame.SRCALPHA)
+    top = float(values.max())
+    if top > 0:
+        for i in np.flatnonzero(values):
+            t = (float(values[i]) / top) ** 0.5
+            y, x = divmod(int(i), MAZE_WIDTH)
+            overlay.fill((*heat(t), int(90 + 150 * t)), (x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE))
+    surface.blit(overlay, (0, 0))
+
+    font = pygame.font.Font(None, 24)
+    label = font.render(f"{title} (max {values.max():,.3g})", True, (255, 255, 255))
+    surface.blit(label, (8, PLAYFIELD_HEIGHT - label.get_height() - 4))
+    if scale != 1:
+        surface = pygame.transform.scale(surface, (GAME_WIDTH * scale, PLAYFIELD_HEIGHT * scale))
+    pygame.image.save(surface, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate Pacman telemetry into a summary and heatmaps")
+    parser.add_argument('paths', nargs='+', metavar='PATH', help="telemetry files (telemetry.bin)")
+    parser.add_argument('--out', default='heatmaps', help="folder for the heatmap PNGs (default: heatmaps)")
+    parser.add_argument('--scale', type=int, default=2, help="heatmap pixels per game pixel")
+    parser.add_argument('--json', action='store_true', help="print the summary as JSON")
+    args = parser.parse_args()
+
+    total = Aggregate()
+    start = time.perf_counter()
+    for path in args.paths:
+        for sessions in read_sessions(path):
+            total.add(sessions)
+    elapsed = time.perf_counter() - start
+    summary = total.summary()
+
+    if args.json:
+        print(json.dumps(summary))
+    else:
+        print(f"{summary['sessions']:,} sessions, {summary['hours']:,.1f} hours of play")
+        print(f"  mean score           {summary['mean_score']:,.0f}")
+        print(f"  pellets per second   {summary['pellets_per_second']:.2f}")
+        print(f"  path coverage        {summary['mean_coverage']:.1%} of reachable tiles per session")
+        shares = summary['ghosts_per_power_pellet']
+        power = max(sum(shares), 1)
+        print("  ghosts per power     " + "  ".join(f"{i}: {c / power:.1%}" for i, c in enumerate(shares))
+              + f"  (mean {summary['mean_ghosts_per_power_pellet']:.2f})")
+        levels = [f"{i + 1}: {s:.1f}" for i, s in enumerate(summary['mean_level_seconds']) if s is not None]
+        print("  seconds per level    " + ("  ".join(levels) or "no levels cleared"))
+    print(f"aggregated in {elapsed:.2f}s ({summary['sessions'] / max(elapsed, 1e-9):,.0f} sessions/s)",
+          file=sys.stderr)
+
+    if total.sessions:
+        pygame = pacman.init_pygame(headless=True)
+        os.makedirs(args.out, exist_ok=True)
+        draw_heatmap(pygame, total.deaths, "Deaths", os.path.join(args.out, 'deaths.png'), args.scale)
+        draw_heatmap(pygame, total.visits, "Times entered", os.path.join(args.out, 'traffic.png'), args.scale)
+        draw_heatmap(pygame, total.visited / total.sessions, "Share of sessions visiting",
+                     os.path.join(args.out, 'coverage.png'), args.scale)
+        print(f"heatmaps written to {args.out}/", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""
+Allocation checks for the frame loop, run with pytest (python -m pytest).
+
+The simulation and drawing of a warmed-up game must neither keep memory from
+frame to frame nor allocate more than a few small objects during a frame:
+the loop reuses its buffers, lists and surfaces (see benchmarks.py alloc for
+a report of the allocation sites).
+"""
+
+import pytest
+
+from benchmarks import measure_allocations
+
+# Net blocks pacman.py may keep per frame (a few dict resizes over the whole game)
+RETAINED_BLOCKS = 0.05
+# Bytes a frame may allocate and free again: the events of the tick and the like
+TRANSIENT_P99 = 512
+TRANSIENT_MAX = 2048
+
+
+@pytest.mark.parametrize('draw', [False, True], ids=['simulation', 'drawing'])
+def test_frame_loop_allocations(draw):
+    m = measure_allocations(frames=3000, warmup=120, draw=draw)
+    frames, transient = m['frames'], m['transient']
+    assert frames > 500
+    assert m['blocks'] / frames < RETAINED_BLOCKS, f"retains {m['blocks'] / frames:.3f} blocks per frame"
+    p99 = transient[int(len(transient) * 0.99)]
+    assert p99 <= TRANSIENT_P99, f"allocates {p99} bytes per frame (p99)"
+    assert transient[-1] <= TRANSIENT_MAX, f"allocates up to {transient[-1]} bytes in a frame"